@@ -0,0 +1,450 @@
+"""
+Asyncio implementation of the main loop running on the host computer.
+
+The serial port is read whenever the event loop reports its file
+descriptor as readable. Received objects are handled by a dispatcher,
+while sequences are stored and the user is asked in separate tasks, so
+messages from the pyboard keep being received during these operations.
+Several pyboards can be served by one process, each in its own session.
+Requires Python 3.5 or newer.
+"""
+
+import asyncio
+import os
+import signal
+import threading
+import time
+import serial
+
+try:
+	from cosplay import server
+	from cosplay import serial_port
+	from cosplay import hotplug
+	from cosplay.pkt import Packet
+except ImportError:
+	import server
+	import serial_port
+	import hotplug
+	from pkt import Packet
+
+sessions = []		#sessions that are currently running
+prompt_lock = threading.Lock()		#only one question is shown to the user at a time
+
+
+def run_in_daemon_thread(loop, func, *args):
+	"""
+	Run `func` in a daemon thread.
+
+	Unlike the default executor of the event loop, a daemon thread
+	does not keep the program alive if it is blocked, e.g. by `input`.
+
+	Parameters
+	----------
+	loop : asyncio event loop
+	func : function
+	    Function that is run with `args`.
+
+	Returns
+	-------
+	asyncio.Future
+	    Future that is set to the return value of `func`.
+	"""
+	future = loop.create_future()
+
+	def run():
+		try:
+			result = func(*args)
+		except Exception as e:
+			loop.call_soon_threadsafe(future.set_exception, e)
+		else:
+			loop.call_soon_threadsafe(future.set_result, result)
+
+	threading.Thread(target=run, daemon=True).start()
+	return future
+
+def ask_user(name):
+	"""Ask the user about the pyboard at port `name` once no other
+	   question is shown (see `cosplay.server.ask_user`)."""
+	with prompt_lock:
+		return server.ask_user(name)
+
+
+class Session(object):
+	"""
+	Communication with one pyboard.
+
+	Parameters
+	----------
+	loop : asyncio event loop
+	port : `cosplay.serial_port.SerialPort` object
+	    Connected port.
+	pkt : `cosplay.pkt.Packet` object
+	    Packet object using `port`.
+	sequences : string
+	    Path to sequences (can include wildcards).
+	storage_path : string
+	    Storage location for delivered sequences. Can be None.
+	vendor : string
+	    Vendor of the MRI scanner.
+	verbose : int
+	    Verbosity level.
+	storage_root : string, optional
+	    Root directory of the scan directories.
+	compress : bool, optional
+	    Send sequences compressed if the pyboard supports it.
+	name : string, optional
+	    Name of the port the pyboard is connected to.
+	subdir : string, optional
+	    Subdirectory of the storage location for the delivered sequences
+	    of this pyboard.
+	"""
+
+	def __init__(self, loop, port, pkt, sequences, storage_path, vendor, verbose,
+		storage_root=None,
+		compress=False,
+		name=None,
+		subdir=None,
+		):
+		self.loop = loop
+		self.port = port
+		self.pkt = pkt
+		self.sequences = sequences
+		self.storage_path = storage_path
+		self.vendor = vendor
+		self.verbose = verbose
+		self.storage_root = storage_root
+		self.compress = compress
+		self.name = name
+		self.subdir = subdir
+		self.sequences_paths = None
+		self.error_msgs = ''		#error messages that occur while delivering one sequence
+		self.timing = []		#timing telemetry of the sequence that is delivered
+		self.objs = asyncio.Queue()
+		self.store_lock = asyncio.Lock()		#sequences are stored one after another
+		self.acked = asyncio.Event()		#set whenever frames are acknowledged
+		self.retransmission = None		#timer handle of the next retransmission check
+		self.tasks = set()
+		self.running = False
+
+	def on_readable(self):
+		"""Decode all bytes available on the port."""
+		try:
+			data = self.port.read_available()
+		except (serial.serialutil.SerialException, OSError):
+			if self.name is None:
+				print('Serial connection interrupted\n')
+			else:
+				print('Serial connection to {0} interrupted\n'.format(self.name))
+			self.stop()
+			return
+		for obj in self.pkt.decode(data):
+			self.objs.put_nowait(obj)
+
+	def drain(self):
+		"""Queue objects that were received while `pkt` read the port
+		   itself, e.g. while waiting for acknowledgments."""
+		while len(self.pkt.rx_objs) > 0:
+			self.objs.put_nowait(self.pkt.rx_objs.pop(0))
+
+	def stop(self):
+		"""Stop the session."""
+		self.running = False
+		self.objs.put_nowait(None)
+
+	def spawn(self, coro):
+		"""Run `coro` as separate task of the session."""
+		task = asyncio.ensure_future(coro)
+		self.tasks.add(task)
+		task.add_done_callback(self.tasks.discard)
+
+	async def run(self):
+		"""Receive and dispatch objects until the session is stopped."""
+		self.running = True
+		fd = self.port.serial_port.fileno()
+		self.loop.add_reader(fd, self.on_readable)
+		self.pkt.ack_handler = self.on_ack
+		try:
+			while self.running:
+				obj = await self.objs.get()
+				if obj is not None:
+					self.dispatch(obj)
+		finally:
+			self.loop.remove_reader(fd)
+			self.pkt.ack_handler = None
+			if self.retransmission is not None:
+				self.retransmission.cancel()
+			for task in list(self.tasks):
+				task.cancel()
+
+	def dispatch(self, obj):
+		"""Act according to an object received from the pyboard."""
+		pkt = self.pkt
+		if type(obj) == str:
+			self.error_msgs = server.process_message(obj, self.error_msgs)
+		elif type(obj) == dict:
+			self.error_msgs = server.process_telemetry(obj, self.error_msgs, self.timing)
+		elif type(obj) == list:
+			self.spawn(self.store(obj, self.error_msgs, self.timing))
+			self.timing = []
+		elif obj == pkt.INS_check_for_sequences_on_server:
+			self.sequences_paths = server.check_for_sequences(self.sequences)
+			if self.sequences_paths is None:
+				self.send(pkt.ANS_no)
+			else:
+				self.send(pkt.ANS_yes)
+			print('Sequences found on computer:')
+			print(self.sequences_paths)
+		elif obj == pkt.INS_ask_user:
+			self.spawn(self.ask_user())
+		elif obj == pkt.INS_send_sequences:
+			self.spawn(self.send_sequences())
+		else:
+			print('\n\nMicrocontroller sent unrecognised instruction of type {0}! {1}\n\n'.format(type(obj),str(obj)))
+
+	async def store(self, obj, error_msgs, timing):
+		"""Save a delivered sequence without blocking the event loop."""
+		async with self.store_lock:
+			await self.loop.run_in_executor(None, server.save_sequence, obj,
+				self.storage_path, error_msgs, self.vendor, self.verbose, self.storage_root, timing, self.subdir)
+
+	async def ask_user(self):
+		"""Ask the user which sequences shall be used and send the answer."""
+		answer = await run_in_daemon_thread(self.loop, ask_user, self.name)
+		if answer == True:
+			self.send(self.pkt.ANS_yes)
+		else:
+			self.send(self.pkt.ANS_no)
+
+	async def send_sequences(self):
+		"""
+		Send the sequences without blocking the event loop.
+
+		The files are read in an executor. The frames are written one
+		after another, so incoming frames (e.g. acknowledgments and
+		messages) are decoded in between. Waiting for acknowledgments
+		is limited to `ack_timeout` of the Packet object.
+		"""
+		pkt = self.pkt
+		objs = await self.loop.run_in_executor(None, server.load_sequences, self.sequences_paths)
+		payloads = pkt.payloads(objs)
+		size = pkt.frames_size(payloads)		#uncompressed, the library is only packed once
+		start_time = time.time()
+		num_bytes = 0
+		for payload in pkt.prepare_payloads(payloads, self.compress):
+			if pkt.is_reliable() and not await self.acknowledged(pkt.window - 1):
+				pkt.give_up()
+			num_bytes += pkt.send_payloads([payload])
+			self.schedule_retransmission()
+			await asyncio.sleep(0)
+		if not await self.acknowledged(0):
+			print('Warning: the pyboard did not acknowledge all packets within {0} ms.\n'.format(pkt.ack_timeout))
+		server.report_sent(self.sequences_paths, objs, self.verbose, size, num_bytes, time.time() - start_time)
+
+	async def acknowledged(self, num_frames):
+		"""Wait until at most `num_frames` frames are unacknowledged.
+		   Returns False if this takes longer than `ack_timeout` ms."""
+		deadline = self.loop.time() + self.pkt.ack_timeout / 1000.
+		while len(self.pkt.unacked) > num_frames:
+			remaining = deadline - self.loop.time()
+			if remaining <= 0:
+				return False
+			self.acked.clear()
+			try:
+				await asyncio.wait_for(self.acked.wait(), remaining)
+			except asyncio.TimeoutError:
+				return False
+		return True
+
+	def send(self, obj):
+		"""Send `obj` and make sure it is sent again if it is not
+		   acknowledged in the reliable mode."""
+		self.pkt.send(obj)
+		self.schedule_retransmission()
+
+	def on_ack(self):
+		"""Wake up tasks waiting for acknowledgments and restart the
+		   retransmission timer."""
+		self.acked.set()
+		self.schedule_retransmission()
+
+	def schedule_retransmission(self):
+		"""Check for retransmissions when the oldest unacknowledged frame
+		   times out. Nothing is scheduled if all frames are acknowledged."""
+		if self.retransmission is not None:
+			self.retransmission.cancel()
+			self.retransmission = None
+		due = self.pkt.retransmission_due()
+		if due is not None:
+			self.retransmission = self.loop.call_later((due + 1) / 1000., self.retransmit)	#the frames time out after more than rto ms
+
+	def retransmit(self):
+		"""Send packets again that are not acknowledged in time."""
+		self.retransmission = None
+		self.pkt.check_retransmission()
+		self.drain()
+		self.schedule_retransmission()
+
+
+def stop():
+	"""Stop the server and all sessions."""
+	server.keep_running = False
+	for session in sessions:
+		session.stop()
+
+async def serve(loop, verbose, vendor, port_name, sequences, storage_path, storage_root, compress, window):
+	"""Connect to the pyboard and run a session until the program is stopped."""
+	while server.keep_running:
+		port = await loop.run_in_executor(None, server.connect, port_name)
+		if port is None:
+			continue
+		pkt = Packet(port, show_packets=verbose >= 2, window=window)
+		session = Session(loop, port, pkt, sequences, storage_path, vendor, verbose,
+			storage_root=storage_root, compress=compress)
+		await run_session(session)
+		port_name = None
+
+def parse_boards(board_args):
+	"""
+	Parse the storage roots of individual pyboards.
+
+	Parameters
+	----------
+	board_args : list
+	    List of strings of the form 'ID=PATH', where ID is the port name
+	    or the USB serial number of a pyboard and PATH the storage root
+	    for the sequences delivered by it.
+
+	Returns
+	-------
+	dict
+	    Storage root for each ID.
+	"""
+	boards = {}
+	for arg in board_args:
+		board_id, sep, path = arg.partition('=')
+		if sep == '' or board_id == '' or path == '':
+			raise ValueError('Expected ID=PATH but got "{0}".'.format(arg))
+		boards[board_id] = path
+	return boards
+
+def board_subdir(device, serial_number):
+	"""Return the name of the storage subdirectory of a pyboard that is
+	   not listed in the boards, its USB serial number if it is known or
+	   the name of its port otherwise."""
+	if serial_number is not None and serial_number != '':
+		name = serial_number
+	else:
+		name = os.path.basename(device)
+	return ''.join([c if c.isalnum() or c in '-_.' else '_' for c in name])
+
+def find_storage_root(boards, device, serial_number):
+	"""Return the storage root in `boards` for the pyboard with port name
+	   `device` or `serial_number`, or None if it is not listed."""
+	if device in boards:
+		return boards[device]
+	if serial_number is not None and serial_number in boards:
+		return boards[serial_number]
+	return None
+
+async def serve_all(loop, verbose, vendor, sequences, storage_path, storage_root, compress, window, boards,
+	scan_interval=1.,
+	):
+	"""
+	Run a session for every pyboard connected until the program is stopped.
+
+	The serial ports are checked for new pyboards whenever a device is
+	added (see `cosplay.hotplug`) or at the latest every `scan_interval`
+	seconds. The sessions themselves only run when their port is readable,
+	so additional pyboards do not add polling.
+	Delivered sequences of pyboards listed in `boards` are stored in the
+	most recent scan directory below their own storage root. The other
+	pyboards share `storage_path` or `storage_root`, so their sequences
+	are stored in a subdirectory per pyboard (see `board_subdir`).
+	"""
+	tasks = {}
+	watcher = hotplug.get_watcher()
+	while server.keep_running:
+		devices = await loop.run_in_executor(None, serial_port.autoscan_all)
+		for device, serial_number in devices:
+			if device in tasks or not server.keep_running:
+				continue
+			port = serial_port.SerialPort()
+			if not port.connect_serial(device):
+				continue
+			print('Connection to {0} established.\n'.format(device))
+			board_path = storage_path
+			subdir = None
+			board_root = find_storage_root(boards, device, serial_number)
+			if board_root is None:
+				board_root = storage_root
+				subdir = board_subdir(device, serial_number)
+			else:
+				board_path = None
+			pkt = Packet(port, show_packets=verbose >= 2, window=window)
+			session = Session(loop, port, pkt, sequences, board_path, vendor, verbose,
+				storage_root=board_root, compress=compress, name=device, subdir=subdir)
+			tasks[device] = asyncio.ensure_future(run_session(session))
+			tasks[device].add_done_callback(lambda task, device=device: tasks.pop(device, None))
+		await loop.run_in_executor(None, watcher.pause, scan_interval)
+	if len(tasks) > 0:
+		await asyncio.wait(list(tasks.values()))
+
+async def run_session(session):
+	"""Run `session` and close its port once it is stopped."""
+	sessions.append(session)
+	try:
+		await session.run()
+	finally:
+		sessions.remove(session)
+		session.port.close_serial()
+
+def main(verbose, vendor, port_name, sequences, storage_path=None, storage_root=None, compress=False, window=0, boards=None):
+	"""
+	Main function running on server using asyncio.
+
+	Same as `cosplay.server.main`, but incoming messages are received
+	while the user is asked or delivered sequences are stored.
+	Exit this function by pressing CTRL-C.
+
+	Parameters
+	----------
+	verbose : int
+	    Verbosity level.
+	vendor : string
+	    Vendor of the MRI scanner.
+	port_name : string
+	    Port name.
+	sequences : string
+	    Path to sequences (can include wildcards).
+	storage_path : string
+	    String to storage location for delivered sequences.
+	compress : bool, optional
+	    Send sequences compressed if the pyboard supports it.
+	    Default is False.
+	window : int, optional
+	    Number of unacknowledged packets in flight in the reliable mode.
+	    0 disables the reliable mode. Default is 0.
+	boards : dict, optional
+	    If not None, all pyboards found are served and `port_name` is
+	    ignored. Maps port names or USB serial numbers of pyboards to
+	    the storage root of their sequences (see `parse_boards`).
+	    Default is None.
+	"""
+	storage_path = server.check_storage_path(storage_path, vendor, storage_root)
+
+	loop = asyncio.new_event_loop()
+	asyncio.set_event_loop(loop)
+	loop.add_signal_handler(signal.SIGINT, stop)
+	print('\nPress Ctrl+c when you are done to close the program.\n')
+	if boards is None:
+		coro = serve(loop, verbose, vendor, port_name, sequences,
+			storage_path, storage_root, compress, window)
+	else:
+		for board_root in boards.values():
+			server.check_storage_path(None, vendor, board_root)
+		coro = serve_all(loop, verbose, vendor, sequences,
+			storage_path, storage_root, compress, window, boards)
+	try:
+		loop.run_until_complete(coro)
+	finally:
+		loop.close()
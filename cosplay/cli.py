@@ -12,10 +12,13 @@
 __author__ = "Aymanns Florian"
 
 import argparse
+import sys
 try:
 	import cosplay.server as server
+	from cosplay.pkt import MAX_WINDOW
 except ImportError:
 	import server
+	from pkt import MAX_WINDOW
 
 def return_parser():
 	"""Return argparse argument parser."""
@@ -58,6 +61,34 @@ def return_parser():
 			type=str,
 			help='Path to directory where delivered sequences are stored. If not specified, the sequence is stored in the folder of the most recent scan.',
 			default=None)
+	parser.add_argument('--compress',
+			dest='compress',
+			action='store_true',
+			help='Send the sequence library compressed. Only takes effect if the firmware on the pyboard supports it.',
+			default=False)
+	parser.add_argument('--window',
+			dest='window',
+			action='store',
+			type=int,
+			help='Number of packets sent without acknowledgment in the reliable mode, which retransmits lost or corrupted packets. 0 disables the reliable mode, at most {0} packets are possible. Only takes effect if the firmware on the pyboard supports it.'.format(MAX_WINDOW),
+			default=0)
+	parser.add_argument('--asyncio',
+			dest='asyncio',
+			action='store_true',
+			help='Use the asyncio implementation of the server, which keeps receiving messages from the pyboard while asking the user or storing sequences. Requires Python 3.5 or newer.',
+			default=False)
+	parser.add_argument('--all_boards',
+			dest='all_boards',
+			action='store_true',
+			help='Serve all pyboards connected to the computer from this process. The sequences delivered by pyboards that are not given with --board are stored in a subdirectory named after their USB serial number or port. Implies --asyncio.',
+			default=False)
+	parser.add_argument('--board',
+			dest='boards',
+			action='append',
+			type=str,
+			metavar='ID=PATH',
+			help='Store the sequences delivered by the pyboard with port name or USB serial number ID below the storage root PATH. Can be given multiple times. Implies --all_boards.',
+			default=[])
 
 	return parser
 
@@ -66,8 +97,22 @@ def main():
 	parser = return_parser()
 
 	args = parser.parse_args()
+	if args.window < 0 or args.window > MAX_WINDOW:
+		parser.error('argument --window: must be between 0 and {0}'.format(MAX_WINDOW))
 
-	server.main(args.verbose, args.vendor, args.port, args.sequences, args.storage_path, args.storage_root)
+	if args.asyncio or args.all_boards or len(args.boards) > 0:
+		if sys.version_info < (3, 5):		#async_server cannot even be imported by older versions
+			parser.error('--asyncio, --all_boards and --board require Python 3.5 or newer')
+		try:
+			import cosplay.async_server as async_server
+		except ImportError:
+			import async_server
+		boards = None
+		if args.all_boards or len(args.boards) > 0:
+			boards = async_server.parse_boards(args.boards)
+		async_server.main(args.verbose, args.vendor, args.port, args.sequences, args.storage_path, args.storage_root, args.compress, args.window, boards)
+	else:
+		server.main(args.verbose, args.vendor, args.port, args.sequences, args.storage_path, args.storage_root, args.compress, args.window)
 
 if __name__ == '__main__':
 	main()
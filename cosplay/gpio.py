@@ -0,0 +1,124 @@
+"""
+Output of the digital out channels by direct writes to the GPIO registers.
+
+Writing a word to the bit set/reset register (BSRR) of a GPIO port sets
+the pins of the lower 16 bits and resets the pins of the upper 16 bits
+in a single bus write, so all channels on the same port change at the
+same instant. Channels on different ports are written one port after
+another. An event can drive several channels given as channel list,
+e.g. '1+3'.
+"""
+
+try:
+	from stm import mem32
+except ImportError:
+	mem32 = None
+
+GPIO_BASE = {'A': 0x40020000, 'B': 0x40020400, 'C': 0x40020800}
+BSRR = 0x18		#offset of the bit set/reset register
+
+#out channel: (port, pin)
+CHANNELS = {
+	1: ('C', 6),		#Y1
+	2: ('B', 8),		#Y3
+	3: ('B', 1),		#Y12
+	4: ('A', 1),		#X2
+}
+
+def parse_channels(out_channel):
+	"""
+	Return the list of channels of an out channel value.
+
+	Parameters
+	----------
+	out_channel : float / string
+	    Out channel of an event, either a number or a list of digital
+	    out channels joined by '+', e.g. '1+3'.
+
+	Returns
+	-------
+	list
+	    Out channels as int.
+	"""
+	if type(out_channel) == str:
+		channels = []
+		for part in out_channel.split('+'):
+			try:
+				channel = int(part)
+			except ValueError:
+				raise ValueError('Unrecognized out channel {0}.'.format(out_channel))
+			if channel not in CHANNELS or channel in channels:
+				raise ValueError('Invalid channel {0} in out channel {1}.'.format(channel, out_channel))
+			channels.append(channel)
+		return channels
+	return [int(out_channel)]
+
+def words(channels, on_values, state):
+	"""
+	Return the register writes setting `channels` to `state`.
+
+	Parameters
+	----------
+	channels : list
+	    Digital out channels.
+	on_values : dict
+	    Value of the pin of each channel while a pulse is active.
+	state : bool
+	    True for the active state, False for the idle state.
+
+	Returns
+	-------
+	list
+	    (address, word) tuples, one for each port.
+	"""
+	bits = {}
+	for channel in channels:
+		port, pin = CHANNELS[channel]
+		if bool(on_values[channel]) == bool(state):
+			bit = 1 << pin
+		else:
+			bit = 1 << (pin + 16)
+		bits[port] = bits.get(port, 0) | bit
+	return [(GPIO_BASE[port] + BSRR, bits[port]) for port in sorted(bits)]
+
+class PortWriter(object):
+	"""
+	Switch several digital out channels with one register write per port.
+
+	`value` can be used instead of `pyb.Pin.value` as `pin_out_func`. Its
+	argument is the state of the channels, not the value of the pins, so
+	channels with different on values can be combined.
+
+	Parameters
+	----------
+	channels : list
+	    Digital out channels.
+	on_values : dict
+	    Value of the pin of each channel while a pulse is active.
+	mem : object, optional
+	    Memory the words are written to. Default is `stm.mem32`.
+	"""
+
+	def __init__(self, channels, on_values, mem=None):
+		if mem is None:
+			mem = mem32
+		self.mem = mem
+		self.channels = channels
+		on = words(channels, on_values, True)
+		off = words(channels, on_values, False)
+		self.num_ports = len(on)
+		self.addresses = [address for address, word in on]		#ints are created once, not per write
+		self.on_words = [word for address, word in on]
+		self.off_words = [word for address, word in off]
+
+	def value(self, state):
+		"""Set all channels to the active state if `state` is true and to
+		   the idle state otherwise."""
+		mem = self.mem
+		addresses = self.addresses
+		if state:
+			words = self.on_words
+		else:
+			words = self.off_words
+		for k in range(self.num_ports):
+			mem[addresses[k]] = words[k]
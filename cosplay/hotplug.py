@@ -0,0 +1,186 @@
+"""
+Detection of pyboards that are plugged in.
+
+On Linux, udev events are used if pyudev is installed. The serial
+ports are then only enumerated when a tty device is added. Otherwise the
+ports are enumerated with exponentially increasing intervals.
+"""
+
+import sys
+import time
+
+try:
+	import pyudev
+except ImportError:
+	pyudev = None
+
+try:
+	from cosplay import serial_port
+except ImportError:
+	import serial_port
+
+try:
+	monotonic = time.monotonic
+except AttributeError:
+	monotonic = time.time
+
+
+def list_devices():
+	"""Return the names of all ports with a MicroPython device."""
+	return [device for device, serial_number in serial_port.autoscan_all()]
+
+
+class PollingWatcher(object):
+	"""
+	Waits for devices by enumerating them with exponential backoff.
+
+	Parameters
+	----------
+	enumerate : function, optional
+	    Function returning a list of the devices that are present.
+	    Default is `list_devices`.
+	min_interval : float, optional
+	    Time in s between the first enumerations. Default is 0.01.
+	max_interval : float, optional
+	    Maximal time in s between enumerations. Default is 1.
+	sleep : function, optional
+	    Function used to wait. Default is `time.sleep`.
+	"""
+
+	def __init__(self, enumerate=None, min_interval=0.01, max_interval=1., sleep=time.sleep):
+		if enumerate is None:
+			enumerate = list_devices
+		self.enumerate = enumerate
+		self.min_interval = min_interval
+		self.max_interval = max_interval
+		self.sleep = sleep
+		self.interval = 0		#current interval between enumerations
+		self.remaining = 0		#time until the next enumeration, 0 enumerates immediately
+
+	def reset(self):
+		"""Enumerate immediately on the next call of `wait`, e.g. after
+		   a device was connected successfully."""
+		self.interval = 0
+		self.remaining = 0
+
+	def pause(self, time_out):
+		"""Wait `time_out` s before the next enumeration."""
+		self.sleep(time_out)
+
+	def wait(self, time_out=None):
+		"""
+		Wait until devices are present.
+
+		Unless `reset` was called, the devices are enumerated only after
+		the current interval, so repeated calls do not spin if the devices
+		found cannot be used.
+
+		Parameters
+		----------
+		time_out : float, optional
+		    Time in s until return if no devices are found. None never
+		    times out. A call that times out before the next enumeration
+		    is due returns without enumerating, so short time outs do not
+		    shorten the interval. Default is None.
+
+		Returns
+		-------
+		list
+		    Devices found. Empty in case of time out.
+		"""
+		start = monotonic()
+		while True:
+			if time_out is not None:
+				left = max(0, start + time_out - monotonic())
+				if self.remaining > left:
+					self.remaining -= left
+					if left > 0:
+						self.pause(left)
+					if self.remaining > 0:
+						return []		#the next enumeration is not due yet
+			if self.remaining > 0:
+				self.pause(self.remaining)
+			self.interval = min(max(2 * self.interval, self.min_interval), self.max_interval)
+			self.remaining = self.interval
+			devices = self.enumerate()
+			if len(devices) > 0:
+				return devices
+			if time_out is not None and monotonic() - start >= time_out:
+				return []
+
+
+class UdevWatcher(PollingWatcher):
+	"""
+	Waits for devices using udev events.
+
+	The devices are enumerated again as soon as a tty device is added.
+	Enumerations with exponential backoff are only kept as fall back,
+	e.g. if a device node appears before its permissions are set.
+
+	Parameters
+	----------
+	enumerate : function, optional
+	    Function returning a list of the devices that are present.
+	    Default is `list_devices`.
+	monitor : object, optional
+	    Object with a `poll(timeout)` method returning devices with an
+	    `action` attribute or None in case of time out. Default is a
+	    `pyudev.Monitor` for tty devices.
+	min_interval : float, optional
+	    Time in s between the first enumerations. Default is 0.01.
+	max_interval : float, optional
+	    Maximal time in s between enumerations. Default is 10.
+	"""
+
+	def __init__(self, enumerate=None, monitor=None, min_interval=0.01, max_interval=10.):
+		PollingWatcher.__init__(self, enumerate, min_interval, max_interval)
+		if monitor is None:
+			monitor = pyudev.Monitor.from_netlink(pyudev.Context())
+			monitor.filter_by(subsystem='tty')
+			monitor.start()
+		self.monitor = monitor
+
+	def pause(self, time_out):
+		"""Wait `time_out` s or until a device is added."""
+		end = monotonic() + time_out
+		while True:
+			device = self.monitor.poll(timeout=max(0, end - monotonic()))
+			if device is None:
+				return
+			if device.action == 'add':
+				self.reset()		#enumerate now and start with the shortest interval again
+				return
+
+
+watcher = None		#watcher shared by all connection attempts of the process
+
+def get_watcher():
+	"""Return the watcher of this process, which is created by
+	   `create_watcher` on the first call, so only one udev monitor is
+	   opened."""
+	global watcher
+	if watcher is None:
+		watcher = create_watcher()
+	return watcher
+
+def create_watcher(enumerate=None):
+	"""
+	Create the best watcher available on this system.
+
+	Parameters
+	----------
+	enumerate : function, optional
+	    Function returning a list of the devices that are present.
+	    Default is `list_devices`.
+
+	Returns
+	-------
+	`UdevWatcher` if pyudev is installed and udev can be used,
+	`PollingWatcher` otherwise.
+	"""
+	if pyudev is not None and sys.platform.startswith('linux'):
+		try:
+			return UdevWatcher(enumerate)
+		except Exception:
+			pass
+	return PollingWatcher(enumerate)
@@ -79,6 +79,46 @@ class SerialPort(object):
 			else:
 				raise TypeError('serial_port.read() returned unrecognised type {0}'.format(type(data[0])))
 
+	def read_available(self):
+		"""Read all bytes that are currently available on the serial port.
+
+		   This function reads everything waiting in the input buffer of
+		   the port with a single call instead of one call per byte.
+
+		   Returns
+		   -------
+		   bytearray
+		       Received bytes. Empty if no bytes are available.
+		"""
+		if self.serial_port.is_open:
+			num_bytes = self.serial_port.in_waiting
+			if num_bytes > 0:
+				return bytearray(self.serial_port.read(num_bytes))
+		else:
+			print('Cannot read because port is not open.')
+		return bytearray()
+
+	def wait_readable(self, time_out=None):
+		"""Block until bytes can be read from the serial port.
+
+		   Parameters
+		   ----------
+		   time_out : int, optional
+		       Maximal time in ms to wait. None waits until bytes are
+		       available.
+
+		   Returns
+		   -------
+		   bool
+		       True if bytes are available, False in case of time out.
+		"""
+		if self.serial_port.in_waiting > 0:
+			return True
+		if time_out is not None:
+			time_out = time_out / 1000.
+		readable, _, _ = select.select([self.serial_port.fileno()], [], [], time_out)
+		return bool(readable)
+
 	def write(self, data):
 		"""Write `data` to the serial port.
 
@@ -141,3 +181,21 @@ def autoscan():						#function form rshell project of dhylands
 	return None
 
 
+
+def autoscan_all():
+	"""Check all serial ports to see if they are MicroPython devices.
+
+	   Unlike `autoscan`, this function returns all ports with matching
+	   VID:PID and not only the first one.
+
+	   Returns
+	   -------
+	   list
+	       List of tuples with the full device name/path and the USB serial
+	       number (None if unknown) of each MicroPython device found.
+	"""
+	devices = []
+	for port in serial.tools.list_ports.comports():
+		if is_micropython_usb_device(port):
+			devices.append((port[0], getattr(port, 'serial_number', None)))
+	return devices
@@ -9,11 +9,15 @@ import getpass
 
 try:
 	from cosplay import tsv
+	from cosplay import telemetry
 	from cosplay import serial_port
+	from cosplay import hotplug
 	from cosplay.pkt import Packet
 except ImportError:
 	import tsv
+	import telemetry
 	import serial_port
+	import hotplug
 	from pkt import Packet
 
 keep_running = True
@@ -78,16 +82,85 @@ def process_message(obj,error_msgs):
 		return error_msgs + obj + '\n'
 	return error_msgs
 
+def process_telemetry(obj, error_msgs, timing):
+	"""
+	Report timing telemetry received from the pyboard.
+
+	Summary records are added to the error messages. Records of
+	individual deviations are only stored.
+
+	Parameters
+	----------
+	obj : dict
+	    Telemetry records in the format of `telemetry.loads`.
+	error_msgs : string
+	    Already accumulated error messages.
+	timing : list
+	    Telemetry received during the current sequence. `obj` is appended.
+
+	Returns
+	-------
+	string
+	    updated `error_msgs`
+	"""
+	timing.append(obj)
+	if obj['format'] == telemetry.SUMMARY:
+		for record in zip(*[obj[name] for name in telemetry.SUMMARY_COLUMNS]):
+			msg = telemetry.summary_message(*record, unit=obj['unit'])
+			print(msg + '\n')
+			error_msgs = error_msgs + msg + '\n'
+	return error_msgs
+
+def save_timing(path, suffix, timing):
+	"""
+	Save telemetry as tsv files with one row per record.
+
+	The summary of each event is saved as `path` + '_summary' + `suffix`
+	and the individual deviations as `path` + `suffix`.
+
+	Parameters
+	----------
+	path : string
+	    Path of the files without suffix.
+	suffix : string
+	    Suffix of the files.
+	timing : list
+	    Telemetry in the format of `telemetry.loads`.
+	"""
+	summary = telemetry.concatenate(timing, telemetry.SUMMARY)
+	if summary is not None:
+		unit = summary['unit']
+		matrix = [list(telemetry.SUMMARY_COLUMNS) + ['mean_onset_' + unit, 'mean_end_' + unit]]
+		for record in zip(*[summary[name] for name in telemetry.SUMMARY_COLUMNS]):
+			mean_onset = float(record[3]) / record[1] if record[1] > 0 else 'n/a'
+			mean_end = float(record[6]) / record[4] if record[4] > 0 else 'n/a'
+			matrix.append(list(record) + [mean_onset, mean_end])
+		with open(path + '_summary' + suffix, 'w+') as fp:
+			tsv.dump(matrix, fp)
+		print('Timing summary saved as {0}\n'.format(path + '_summary' + suffix))
+	records = telemetry.concatenate(timing, telemetry.RECORDS)
+	if records is not None:
+		matrix = [list(telemetry.COLUMNS) + ['lateness_' + records['unit']]]
+		for record in zip(*[records[name] for name in telemetry.COLUMNS]):
+			matrix.append(list(record) + [telemetry.lateness(record[2], record[3])])
+		with open(path + suffix, 'w+') as fp:
+			tsv.dump(matrix, fp)
+		print('Timing telemetry saved as {0}\n'.format(path + suffix))
+
 def save_sequence(obj, storage_path, error_msgs, vendor,
 	verbose=0,
 	storage_root=None,
+	timing=None,
+	subdir=None,
 	):
 	"""
 	Save sequence in `storage_path`.
 
 	This function saves a sequence and error messages in two separate files.
 	If `storage_path` is None, the files are saved in the most recent scan
-	directory (see 'find_current_scan_dir').
+	directory (see 'find_current_scan_dir'). If `subdir` is given, the
+	files are saved in this subdirectory of the directory, which is
+	created if necessary.
 
 	Parameters
 	----------
@@ -104,6 +177,12 @@ def save_sequence(obj, storage_path, error_msgs, vendor,
 	verbose : int, optional
 	    If 'verbose' is larger than 1, the sequence is printed to the screen.
 	    Default is 0.
+	timing : list, optional
+	    Telemetry of the sequence (see `process_telemetry`). Is stored
+	    in the same directory as the sequence.
+	subdir : string, optional
+	    Name of a subdirectory, e.g. to separate the sequences of several
+	    pyboards.
 	"""
 	if type(obj) != list:
 		raise TypeError('save_sequence only stores sequences in dictionary format.')
@@ -111,6 +190,8 @@ def save_sequence(obj, storage_path, error_msgs, vendor,
 		print('Received sequence:\n' + str(obj))
 	if storage_path is None:
 		path = find_current_scan_dir(vendor, storage_root=storage_root)
+		if subdir is not None:
+			path = make_subdir(path, subdir)
 		with open(path+'sequence.tsv','w+') as fp:
 			tsv.dump(obj,fp)
 			print('Sequence saved as {0}'.format(path+'sequence.tsv\n'))
@@ -121,7 +202,11 @@ def save_sequence(obj, storage_path, error_msgs, vendor,
 				except SyntaxError:
 					print >>fp, error_msgs
 				print('Error messages saved as {0}'.format(path+'errors.txt\n'))
+		if timing is not None:
+			save_timing(path+'sequence_timing', '.tsv', timing)
 	else:
+		if subdir is not None:
+			storage_path = make_subdir(storage_path, subdir)
 		file_idx = 0
 		while os.path.exists(storage_path+'sequence'+str(file_idx)+'.tsv'):
 			file_idx += 1
@@ -135,6 +220,16 @@ def save_sequence(obj, storage_path, error_msgs, vendor,
 					except SyntaxError:
 						print >>fp, error_msgs
 					print('Error messages saved as {0}\n'.format(storage_path+'errors'+str(file_idx)+'.txt'))
+		if timing is not None:
+			save_timing(storage_path+'sequence_timing', str(file_idx)+'.tsv', timing)
+
+def make_subdir(path, subdir):
+	"""Return the path of the subdirectory `subdir` of `path` ending with
+	   '/' and create it if it does not exist."""
+	path = os.path.join(path, subdir) + '/'
+	if not os.path.isdir(path):
+		os.makedirs(path)
+	return path
 
 def listdir_nohidden(path):
 	"""
@@ -209,31 +304,45 @@ def check_for_sequences(sequences_arg=None):
 		return sequences_paths
 	return None
 
-def ask_user():
+def ask_user(name=None):
 	"""
 	Ask user whether sequences on server or microcontroller shall
 	be used.
 
+	Parameters
+	----------
+	name : string, optional
+	    Name of the port of the pyboard, which is included in the
+	    question if several pyboards are served.
+
 	Returns
 	-------
 	bool
 	    True if sequences on server shall be used, False otherwise.
 	"""
+	board = 'the pyboard'
+	if name is not None:
+		board = 'the pyboard at {0}'.format(name)
+	question = 'Shall the sequences on the computer be used instead of the sequences on {0}? (y/n)'.format(board)
 	while True:
 		try:
-			var = raw_input('Shall the sequences on the computer be used instead of the sequences on the pyboard? (y/n)')
+			var = raw_input(question)
 		except NameError:
-			var = input('Shall the sequences on the computer be used instead of the sequences on the pyboard? (y/n)')
+			var = input(question)
 		if var == 'y':
 			return True
 		elif var == 'n':
 			return False
 		print('"{0}" is not a valid answer. Try again!'.format(var))
 
-def send_sequences(sequences_paths,pkt,verbose):
+def send_sequences(sequences_paths,pkt,verbose,compress=False):
 	"""
 	Send sequences to microcontroller.
 
+	If `compress` is True and the firmware on the microcontroller
+	supports it, the library is sent as compressed stream. Older
+	firmware receives the uncompressed sequences.
+
 	Parameters
 	----------
 	sequences_paths : list
@@ -243,20 +352,74 @@ def send_sequences(sequences_paths,pkt,verbose):
 	verbose : int
 	    If larger than 1, print path to every sequence sent.
 	    If larger than 2, print every sequence sent.
+	compress : bool, optional
+	    Compress the sequences. Default is False.
+	"""
+	objs = load_sequences(sequences_paths)
+	payloads = pkt.payloads(objs)
+	size = pkt.frames_size(payloads)		#uncompressed, the library is only packed once
+	start_time = time.time()
+	num_bytes = pkt.send_payloads(pkt.prepare_payloads(payloads, compress))	#all sequences are sent with a single write
+	if not pkt.flush(pkt.ack_timeout):		#wait for the acknowledgment of all packets in the reliable mode
+		print('Warning: the pyboard did not acknowledge all packets within {0} ms.\n'.format(pkt.ack_timeout))
+	report_sent(sequences_paths, objs, verbose, size, num_bytes, time.time() - start_time)
+
+def load_sequences(sequences_paths):
+	"""
+	Load the sequences that are sent to the microcontroller.
+
+	Parameters
+	----------
+	sequences_paths : list
+	    List of paths (strings) to sequences. Can be None.
+
+	Returns
+	-------
+	list
+	    Sequences followed by `Packet.ANS_no`, which indicates that all
+	    sequences have been sent.
 	"""
+	objs = []
 	if sequences_paths is not None:
 		print('sending {0} sequences\n'.format(len(sequences_paths)))
 		for path in sequences_paths:
 			with open(path) as data_file:
-				seq = tsv.load(data_file)
-				pkt.send(seq)
+				objs.append(tsv.load(data_file))
+	else:
+		print('sequences_paths contains no sequences. No sequences were sent!\n')
+	objs.append(Packet.ANS_no) #Indicates that all sequences have been sent
+	return objs
+
+def report_sent(sequences_paths, objs, verbose, size, num_bytes, duration):
+	"""
+	Print the transfer rate and the sequences that were sent.
+
+	Parameters
+	----------
+	sequences_paths : list
+	    List of paths (strings) to sequences that were sent. Can be None.
+	objs : list
+	    Objects that were sent (see `load_sequences`).
+	verbose : int
+	    Verbosity level.
+	size : int
+	    Number of bytes of the uncompressed frames.
+	num_bytes : int
+	    Number of bytes written.
+	duration : float
+	    Duration of the transfer in s.
+	"""
+	duration = max(duration, 1e-6)
+	if num_bytes < size:
+		print('Sent {0} bytes compressed to {1} bytes (ratio {2:.1f}) in {3:.3f}s ({4:.1f} kB/s uncompressed)\n'.format(size, num_bytes, float(size) / num_bytes, duration, size / duration / 1000.))
+	else:
+		print('Sent {0} bytes in {1:.3f}s ({2:.1f} kB/s)\n'.format(num_bytes, duration, num_bytes / duration / 1000.))
+	if sequences_paths is not None:
+		for path, seq in zip(sequences_paths, objs):
 			if verbose >= 1:
 				print('Sequence {0} sent to board\n'.format(path))
 			elif verbose >= 2:
 				print('Sent sequences:\n' + str(seq))
-	else:
-		print('sequences_paths contains no sequences. No sequences were sent!\n')
-	pkt.send(pkt.ANS_no) #Indicates that all sequences have been sent
 
 def connect(port_name=None):
 	"""
@@ -264,7 +427,9 @@ def connect(port_name=None):
 
 	This function tries to connect to `port_name`. If `port_name`
 	is None, tries to connect to the first serial port with a
-	maching VID:PID for the MicroPython Pyboard.
+	maching VID:PID for the MicroPython Pyboard. While no pyboard
+	is connected, it waits for one to be plugged in (see
+	`cosplay.hotplug`).
 
 	Parameters
 	----------
@@ -293,17 +458,51 @@ def connect(port_name=None):
 			print('Could not connect to {0}. Trying to auto connect...'.format(port_name))
 
 	print('Searching port...')
+	watcher = hotplug.get_watcher()
 	while not connected and keep_running:
-		port_name = serial_port.autoscan()
-		if port_name is not None:
+		for port_name in watcher.wait(time_out=0.5):		#returns regularly to check keep_running
 			connected = port.connect_serial(port_name)
+			if connected:
+				break
 	if not connected:
 		return None
+	watcher.reset()		#search immediately when the connection is lost
 	print('Connection to {0} established.\n'.format(port_name))
 	return port
 
 
-def main(verbose, vendor, port_name, sequences, storage_path=None, storage_root=None):
+def check_storage_path(storage_path, vendor, storage_root=None):
+	"""
+	Check the storage location for delivered sequences.
+
+	If `storage_path` is None, this checks if the current scan directory
+	can be found to notify the user of potential problems before they
+	start the experiment.
+
+	Parameters
+	----------
+	storage_path : string
+	    Path to directory where delivered sequences are stored. Can be None.
+	vendor : string
+	    Name of the MRI vendor.
+	storage_root : string, optional
+	    Root directory of the scan directories.
+
+	Returns
+	-------
+	string
+	    `storage_path` ending with '/' or None.
+	"""
+	if storage_path is None:
+		find_current_scan_dir(vendor, storage_root=storage_root)
+		return None
+	if not os.path.isdir(storage_path):
+		raise ValueError('No directory {0} exists.'.format(storage_path))
+	if storage_path[-1] != '/':		#this ensures the path ends with /
+		storage_path = storage_path + '/'
+	return storage_path
+
+def main(verbose, vendor, port_name, sequences, storage_path=None, storage_root=None, compress=False, window=0):
 	"""
 	Main function running on server.
 
@@ -323,21 +522,19 @@ def main(verbose, vendor, port_name, sequences, storage_path=None, storage_root=
 	    Path to sequences (can include wildcards).
 	storage_path : string
 	    String to storage location for delivered sequences.
+	compress : bool, optional
+	    Send sequences compressed if the pyboard supports it.
+	    Default is False.
+	window : int, optional
+	    Number of unacknowledged packets in flight in the reliable mode.
+	    0 disables the reliable mode. Default is 0.
 	"""
 	sequences_paths = None			#List with all paths to all sequences that will be sent to the microcontroller if requested
 
-	if storage_path is None:
-		find_current_scan_dir(vendor, storage_root=storage_root)	#this checks if the path can be found to notify the user of potential problems before they start the experiment
-		storage_path = None
-	else:
-		if not os.path.isdir(storage_path):
-			raise ValueError('No directory {0} exists.'.format(storage_path))
-		if storage_path[-1] != '/':		#this ensures the path ends with /
-			storage_path = storage_path + '/'
-
-
+	storage_path = check_storage_path(storage_path, vendor, storage_root)
 
 	error_msgs = ''		#stores error messages that occurer while delivering one sequence
+	timing = []		#stores timing telemetry of the sequence that is delivered
 
 	signal.signal(signal.SIGINT, signal_handler_end_program)
 	print('\nPress Ctrl+c when you are done to close the program.\n')
@@ -350,9 +547,9 @@ def main(verbose, vendor, port_name, sequences, storage_path=None, storage_root=
 				continue
 
 			if verbose >= 2:
-				pkt = Packet(port,show_packets=True)
+				pkt = Packet(port,show_packets=True,window=window)
 			else:
-				pkt = Packet(port)
+				pkt = Packet(port,window=window)
 
 			message_type = None
 			try:
@@ -361,13 +558,16 @@ def main(verbose, vendor, port_name, sequences, storage_path=None, storage_root=
 				message_type = str
 
 			while keep_running:
-				obj = pkt.receive(time_out=2)
+				obj = pkt.receive(time_out=500)
 				if obj == None:
 					continue
 				if type(obj) == message_type:
 					error_msgs = process_message(obj,error_msgs)
+				elif type(obj) == dict:
+					error_msgs = process_telemetry(obj,error_msgs,timing)
 				elif type(obj) == list:
-					save_sequence(obj,storage_path,error_msgs,vendor,verbose,storage_root)
+					save_sequence(obj,storage_path,error_msgs,vendor,verbose,storage_root,timing)
+					timing = []
 				elif obj == pkt.INS_check_for_sequences_on_server:
 					sequences_paths = check_for_sequences(sequences)
 					if sequences_paths is None:
@@ -383,7 +583,7 @@ def main(verbose, vendor, port_name, sequences, storage_path=None, storage_root=
 					else:
 						pkt.send(pkt.ANS_no)
 				elif obj == pkt.INS_send_sequences:
-					send_sequences(sequences_paths,pkt,verbose)
+					send_sequences(sequences_paths,pkt,verbose,compress)
 				else:
 					print('\n\nMicrocontroller sent unrecognised instruction of type {0}! {1}\n\n'.format(type(obj),str(obj)))
 			port.close_serial()
@@ -0,0 +1,141 @@
+"""
+Benchmark of the frame-level decoder `Packet.decode` against the per-byte
+state machine it replaces. Run with ``python benchmark_pkt.py`` on the host
+or copy it together with the modules in pyboard/lib to a MicroPython board.
+"""
+
+try:
+	from utime import ticks_us, ticks_diff
+	import tsv
+	from pkt import Packet, lrc, SOH, STX, ETX, EOT, SEQ, MSG, INS
+except ImportError:
+	from time import time
+	def ticks_us():
+		return int(time() * 1000000)
+	def ticks_diff(a, b):
+		return a - b
+	from cosplay import tsv
+	from cosplay.pkt import Packet, lrc, SOH, STX, ETX, EOT, SEQ, MSG, INS
+
+class LegacyDecoder:
+	"""Per-byte state machine previously used by `Packet.process_byte`."""
+
+	STATE_SOH = 0
+	STATE_LEN_0 = 1
+	STATE_LEN_1 = 2
+	STATE_TYPE = 3
+	STATE_STX = 4
+	STATE_PAYLOAD = 5
+	STATE_ETX = 6
+	STATE_LRC = 7
+	STATE_EOT = 8
+
+	def __init__(self):
+		self.pkt_len = 0
+		self.pkt_type = None
+		self.pkt_idx = 0
+		self.pkt = None
+		self.lrc = 0
+		self.state = LegacyDecoder.STATE_SOH
+
+	def process_byte(self, byte):
+		if self.state == LegacyDecoder.STATE_SOH:
+			if byte == SOH:
+				self.state = LegacyDecoder.STATE_LEN_0
+		elif self.state == LegacyDecoder.STATE_LEN_0:
+			self.pkt_len = byte
+			self.state = LegacyDecoder.STATE_LEN_1
+		elif self.state == LegacyDecoder.STATE_LEN_1:
+			self.pkt_len += (byte << 8)
+			self.state = LegacyDecoder.STATE_TYPE
+		elif self.state == LegacyDecoder.STATE_TYPE:
+			self.pkt_type = byte
+			self.state = LegacyDecoder.STATE_STX
+		elif self.state == LegacyDecoder.STATE_STX:
+			if byte == STX:
+				self.state = LegacyDecoder.STATE_PAYLOAD
+				self.pkt_idx = 0
+				self.pkt = bytearray(self.pkt_len)
+				self.lrc = 0
+			else:
+				self.state = LegacyDecoder.STATE_SOH
+		elif self.state == LegacyDecoder.STATE_PAYLOAD:
+			self.pkt[self.pkt_idx] = byte
+			self.lrc = (self.lrc + byte) & 0xff
+			self.pkt_idx += 1
+			if self.pkt_idx >= self.pkt_len:
+				self.state = LegacyDecoder.STATE_ETX
+		elif self.state == LegacyDecoder.STATE_ETX:
+			if byte == ETX:
+				self.state = LegacyDecoder.STATE_LRC
+			else:
+				self.state = LegacyDecoder.STATE_SOH
+		elif self.state == LegacyDecoder.STATE_LRC:
+			self.lrc = ((self.lrc ^ 0xff) + 1) & 0xff
+			if self.lrc == byte:
+				self.state = LegacyDecoder.STATE_EOT
+			else:
+				self.state = LegacyDecoder.STATE_SOH
+		elif self.state == LegacyDecoder.STATE_EOT:
+			self.state = LegacyDecoder.STATE_SOH
+			if byte == EOT:
+				payload = str(bytes(self.pkt), 'ascii')
+				if self.pkt_type == SEQ:
+					return tsv.loads(payload)
+				elif self.pkt_type == MSG:
+					return payload
+				elif self.pkt_type == INS:
+					return int(payload)
+
+def legacy_frame(pkt_type, payload):
+	"""Return `payload` framed in the format understood by `LegacyDecoder`."""
+	payload_len = len(payload)
+	return (bytearray((SOH, payload_len & 0xff, payload_len >> 8, pkt_type, STX)) +
+		payload + bytearray((ETX, lrc(payload), EOT)))
+
+def make_sequence(num_events):
+	seq = [['onset', 'duration', 'frequency', 'pulse_width', 'amplitude', 'out_channel']]
+	for i in range(num_events):
+		seq.append([10. * i, 8., 20., 0.005, 'n/a', float(i % 6 + 1)])
+	return seq
+
+class ListPort:
+	def __init__(self):
+		self.data = []
+
+	def write(self, data):
+		self.data.append(bytes(data))
+
+def benchmark(num_events=100, repetitions=20, chunk_size=64):
+	"""Decode `repetitions` sequences with `num_events` events each that are
+	   received in chunks of `chunk_size` bytes and print the throughput."""
+	seq = make_sequence(num_events)
+	payload = tsv.dumps(seq).encode('ascii')
+	stream = legacy_frame(SEQ, payload) * repetitions
+	chunks = [bytes(stream[i:i + chunk_size]) for i in range(0, len(stream), chunk_size)]
+	nbytes = len(stream)
+
+	legacy = LegacyDecoder()
+	count = 0
+	start = ticks_us()
+	for chunk in chunks:
+		for byte in bytearray(chunk):
+			if legacy.process_byte(byte) is not None:
+				count += 1
+	legacy_us = ticks_diff(ticks_us(), start)
+	assert count == repetitions
+
+	pkt = Packet(ListPort())
+	count = 0
+	start = ticks_us()
+	for chunk in chunks:
+		count += len(pkt.decode(chunk))
+	decode_us = ticks_diff(ticks_us(), start)
+	assert count == repetitions
+
+	print('{0} bytes in {1} byte chunks'.format(nbytes, chunk_size))
+	print('per-byte state machine: {0} us ({1:.0f} kB/s)'.format(legacy_us, nbytes * 1000. / max(legacy_us, 1)))
+	print('frame decoder:          {0} us ({1:.0f} kB/s)'.format(decode_us, nbytes * 1000. / max(decode_us, 1)))
+
+if __name__ == '__main__':
+	benchmark()
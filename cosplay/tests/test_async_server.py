@@ -0,0 +1,120 @@
+import asyncio, os, select, shutil, tempfile, threading, tty
+
+from cosplay import async_server
+from cosplay import tsv
+from cosplay.pkt import Packet
+from cosplay.serial_port import SerialPort
+
+def test_parse_boards():
+	boards = async_server.parse_boards(['/dev/ttyACM0=/data/rig1', '3276345A3233=/data/rig2'])
+	assert boards == {'/dev/ttyACM0': '/data/rig1', '3276345A3233': '/data/rig2'}
+	try:
+		async_server.parse_boards(['/dev/ttyACM0'])
+	except ValueError:
+		pass
+	else:
+		assert False
+	assert async_server.find_storage_root(boards, '/dev/ttyACM0', None) == '/data/rig1'
+	assert async_server.find_storage_root(boards, '/dev/ttyACM1', '3276345A3233') == '/data/rig2'
+	assert async_server.find_storage_root(boards, '/dev/ttyACM1', None) is None
+
+def test_board_subdir():
+	assert async_server.board_subdir('/dev/ttyACM0', '3276345A3233') == '3276345A3233'
+	assert async_server.board_subdir('/dev/ttyACM0', None) == 'ttyACM0'
+	assert async_server.board_subdir('COM3', 'a/b') == 'a_b'
+	directory = tempfile.mkdtemp()
+	try:
+		sequence = [['onset', 'duration'], [1.0, 2.0]]
+		async_server.server.save_sequence(sequence, directory + '/', '', 'none', subdir='rig1')
+		async_server.server.save_sequence(sequence, directory + '/', '', 'none', subdir='rig2')
+		async_server.server.save_sequence(sequence, directory + '/', '', 'none', subdir='rig1')
+		assert sorted(os.listdir(os.path.join(directory, 'rig1'))) == ['sequence0.tsv', 'sequence1.tsv']
+		assert os.listdir(os.path.join(directory, 'rig2')) == ['sequence0.tsv']
+	finally:
+		shutil.rmtree(directory)
+
+class FdPort(object):
+	"""Serial port replacement for the master side of a pty."""
+
+	def __init__(self, fd):
+		self.fd = fd
+
+	def write(self, data):
+		data = bytes(data)
+		while len(data) > 0:
+			data = data[os.write(self.fd, data):]
+
+	def read_available(self):
+		if select.select([self.fd], [], [], 0)[0]:
+			return bytearray(os.read(self.fd, 65536))
+		return bytearray()
+
+sequence = [['onset', 'duration', 'frequency', 'pulse_width', 'amplitude', 'out_channel'],
+	    [1.0, 8.0, 20.0, 0.005, 'n/a', 1.0],
+	    [10.0, 8.0, 20.0, 0.005, 0.5, 5.0]]
+
+def test_session_loopback():
+	directory = tempfile.mkdtemp()
+	for i in range(3):
+		with open(os.path.join(directory, 'sequence{0}.tsv'.format(i)), 'w') as fp:
+			tsv.dump(sequence, fp)
+	master, slave = os.openpty()
+	tty.setraw(master)
+	sp = SerialPort()
+	assert sp.connect_serial(os.ttyname(slave))
+	loop = asyncio.new_event_loop()
+	session = async_server.Session(loop, sp, Packet(sp, window=4, rto=50), directory, directory, 'none', 0)
+	received = []
+	def board():
+		pkt = Packet(FdPort(master))
+		pkt.send_capabilities()
+		pkt.send(pkt.INS_check_for_sequences_on_server)
+		received.append(pkt.receive(time_out=5000))
+		pkt.send(pkt.INS_send_sequences)
+		pkt.send('Missed scheduled onset time')		#received while the sequences are sent
+		obj = pkt.receive(time_out=5000)
+		while type(obj) == list:
+			received.append(obj)
+			obj = pkt.receive(time_out=5000)
+		received.append(obj)
+		pkt.flush(1000)
+		loop.call_soon_threadsafe(session.stop)
+	thread = threading.Thread(target=board)
+	try:
+		thread.start()
+		loop.run_until_complete(asyncio.wait_for(session.run(), 10))
+		thread.join()
+	finally:
+		sp.close_serial()
+		os.close(master)
+		os.close(slave)
+		loop.close()
+		shutil.rmtree(directory)
+	assert received == [Packet.ANS_yes, sequence, sequence, sequence, Packet.ANS_no]
+	assert session.error_msgs == 'Missed scheduled onset time\n'
+	assert len(session.pkt.unacked) == 0
+
+def test_retransmission_timer():
+	from cosplay.tests.test_pkt import CrossedPorts
+	ports = CrossedPorts()
+	host = Packet(ports.a, window=4, rto=20)
+	board = Packet(ports.b)
+	board.send_capabilities()
+	host.decode(ports.a.read_available())
+	board.decode(ports.b.read_available())
+	loop = asyncio.new_event_loop()
+	session = async_server.Session(loop, None, host, '', None, 'none', 0)
+	host.ack_handler = session.on_ack
+	async def exchange():
+		session.send('first')
+		assert board.decode(ports.b.read_available()) == ['first']
+		ports.a.read_available()		#the acknowledgment is lost
+		await asyncio.sleep(0.05)
+		assert board.decode(ports.b.read_available()) == []		#resent frame is a duplicate
+		host.decode(ports.a.read_available())
+		assert session.acked.is_set() and session.retransmission is None
+		assert await session.acknowledged(0)
+	try:
+		loop.run_until_complete(asyncio.wait_for(exchange(), 5))
+	finally:
+		loop.close()
@@ -0,0 +1,62 @@
+import io
+
+from cosplay import bseq, event_table, tsv
+
+SEQUENCE = 'onset\tduration\tfrequency\tpulse_width\tout_channel\tamplitude\twaveform\n' \
+	'1.0\t0.5\t10.0\t0.01\t1\tn/a\tn/a\n' \
+	'2.0\t1.0\t20.0\t0.02\t5\t0.5\tsine\n' \
+	'3.0\t0.5\t10.0\t0.01\t1+3\tn/a\tn/a\n' \
+	'1000.0\t0.1\t100.0\t0.001\t5\t1.0\tsine\n'
+
+def test_round_trip():
+	table = event_table.from_sequence(tsv.loads(SEQUENCE), 1000000, 1 << 29)
+	assert len(table) == 4
+	assert list(table.onset) == [1000000, 2000000, 3000000, 1000000000]
+	assert list(table.period) == [100000, 50000, 100000, 10000]
+	assert list(table.num_pulses) == [5, 20, 5, 10]
+	assert list(table.onset_sleep) == [0, 0, 0, 1 << 29]
+	assert list(table.amplitude) == [1, 127, 1, 255]
+	assert table.channels == [1, 5, '1+3']
+	assert list(table.channel) == [0, 1, 2, 1]
+	assert table.waveforms == ['n/a', 'sine']
+	assert list(table.waveform) == [0, 1, 0, 1]
+	table.source = (123, 456)
+	buf = io.BytesIO()
+	event_table.dump(table, buf)
+	loaded = event_table.load(io.BytesIO(buf.getvalue()))
+	for name in event_table.COLUMNS:
+		assert getattr(loaded, name) == getattr(table, name)
+	assert loaded.channels == table.channels and loaded.waveforms == table.waveforms
+	assert loaded.source == (123, 456) and loaded.tmax == 1 << 29
+	try:
+		event_table.load(io.BytesIO(buf.getvalue()[:-30]))
+		assert False, 'incomplete tables must raise ValueError'
+	except ValueError:
+		pass
+
+def test_invalid_events():
+	for row in ('1.0\t0.5\t10.0\t0.2\t1\tn/a\n', '1.0\t0.5\t10.0\t0.01\t7\tn/a\n'):
+		try:
+			event_table.from_sequence(tsv.loads('onset\tduration\tfrequency\tpulse_width\tout_channel\tamplitude\n' + row))
+			assert False, 'invalid events must raise ValueError'
+		except ValueError:
+			pass
+
+def test_packed_columns():
+	matrix = tsv.loads(SEQUENCE.replace('\t1+3\t', '\t3\t'))
+	matrix = [row[:6] for row in matrix]
+	data = bseq.dumps(matrix)
+	columns = bseq.load_columns(io.BytesIO(data))
+	assert [c.typecode for c in columns] == list(bseq.FORMATS)
+	assert list(columns[5]) == [1, 5, 3, 5]
+	assert [type(x) for x in bseq.loads(data)[1]][5] is int
+	table = event_table.from_columns(bseq.COLUMNS, columns, 1000000, 1 << 29)
+	expected = event_table.from_sequence(matrix, 1000000, 1 << 29)
+	for name in event_table.COLUMNS:
+		assert getattr(table, name) == getattr(expected, name)
+	assert table.channels == [1, 5, 3]
+	try:
+		bseq.load_columns(io.BytesIO(data[:-1]))
+		assert False, 'incomplete packed sequences must raise ValueError'
+	except ValueError:
+		pass
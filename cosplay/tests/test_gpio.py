@@ -0,0 +1,23 @@
+from cosplay import gpio
+
+def test_port_writer():
+	assert gpio.parse_channels(3.0) == [3]
+	assert gpio.parse_channels('1+3') == [1, 3]
+	for out_channel in ('1+5', '1+1', 'laser'):
+		try:
+			gpio.parse_channels(out_channel)
+			assert False, 'invalid out channel must raise ValueError'
+		except ValueError:
+			pass
+	on_values = {1: 0, 2: 0, 3: 1, 4: 1}
+	mem = {}
+	writer = gpio.PortWriter([2, 3], on_values, mem)
+	assert writer.num_ports == 1		#both pins are on port B
+	writer.value(True)
+	assert mem == {0x40020418: (1 << 24) | (1 << 1)}		#reset PB8, set PB1
+	writer.value(False)
+	assert mem == {0x40020418: (1 << 8) | (1 << 17)}
+	writer = gpio.PortWriter([1, 4], on_values, mem)
+	writer.value(True)
+	assert writer.num_ports == 2
+	assert mem[0x40020018] == 1 << 1 and mem[0x40020818] == 1 << 22
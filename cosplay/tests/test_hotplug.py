@@ -0,0 +1,74 @@
+from cosplay import hotplug
+
+class FakeEnumerator(object):
+	"""Returns the devices in `results` one enumeration after the other."""
+
+	def __init__(self, results):
+		self.results = results
+		self.calls = 0
+
+	def __call__(self):
+		self.calls += 1
+		if len(self.results) > 0:
+			return self.results.pop(0)
+		return []
+
+class FakeEvent(object):
+
+	def __init__(self, action):
+		self.action = action
+
+class FakeMonitor(object):
+	"""Returns the events in `events` one poll after the other."""
+
+	def __init__(self, events):
+		self.events = events
+		self.timeouts = []
+
+	def poll(self, timeout=None):
+		self.timeouts.append(timeout)
+		if len(self.events) > 0:
+			return self.events.pop(0)
+		return None
+
+def test_polling_backoff():
+	sleeps = []
+	enumerate = FakeEnumerator([[], [], [], [], ['/dev/ttyACM0']])
+	watcher = hotplug.PollingWatcher(enumerate, min_interval=0.01, max_interval=0.04, sleep=sleeps.append)
+	assert watcher.wait() == ['/dev/ttyACM0']
+	assert sleeps == [0.01, 0.02, 0.04, 0.04]
+	enumerate.results = [['/dev/ttyACM0']]
+	del sleeps[:]
+	assert watcher.wait() == ['/dev/ttyACM0']
+	assert sleeps == [0.04]		#the device could not be used, so the next call backs off
+	watcher.reset()
+	enumerate.results = [['/dev/ttyACM1']]
+	del sleeps[:]
+	assert watcher.wait() == ['/dev/ttyACM1']
+	assert sleeps == []
+
+def test_polling_time_out():
+	watcher = hotplug.PollingWatcher(FakeEnumerator([]), min_interval=0.01, max_interval=0.02)
+	assert watcher.wait(time_out=0.05) == []
+
+def test_udev_add_event():
+	enumerate = FakeEnumerator([['/dev/ttyACM0']])
+	monitor = FakeMonitor([FakeEvent('remove'), FakeEvent('add')])
+	watcher = hotplug.UdevWatcher(enumerate, monitor, min_interval=0.01, max_interval=10.)
+	watcher.interval = 10.
+	watcher.remaining = 10.
+	assert watcher.wait() == ['/dev/ttyACM0']
+	assert enumerate.calls == 1
+	assert len(monitor.timeouts) == 2		#enumerated as soon as the device was added
+	assert watcher.interval == 0.01
+
+def test_short_time_out_keeps_backoff():
+	sleeps = []
+	enumerate = FakeEnumerator([])
+	watcher = hotplug.PollingWatcher(enumerate, min_interval=0.5, max_interval=0.5, sleep=sleeps.append)
+	assert watcher.wait(time_out=0.2) == []		#enumerates immediately, then waits 0.2 of 0.5 s
+	assert watcher.wait(time_out=0.2) == []
+	assert enumerate.calls == 1		#the time outs did not shorten the interval
+	assert watcher.wait(time_out=0.2) == []
+	assert enumerate.calls == 2
+	assert abs(sum(sleeps[:3]) - 0.5) < 0.01		#the enumeration was due after 0.5 s
@@ -0,0 +1,32 @@
+from cosplay import pattern
+
+on_values = {1: 0, 2: 0, 3: 1, 4: 1}
+
+def test_pattern_segments():
+	compiler = pattern.PatternCompiler([0, 35], [20, 10], [3, 2], [10, 10], [[2], [3, 1]], on_values, 5, segment_size=8)
+	assert compiler.ports == ['B', 'C']
+	assert compiler.addresses == [0x40020418, 0x40020818]
+	assert (compiler.num_steps, compiler.num_segments, compiler.max_error) == (12, 2, 0)
+	segment = compiler.segment_buffer()
+	played = []
+	while compiler.fill(segment) > 0:
+		played.extend(zip(*[list(words[:segment.length]) for words in segment.words]))
+	assert len(played) == 12
+	assert played[0] == (1 << 24, 0)		#channel 2 is active low
+	assert played[7] == (1 << 1, 1 << 22)		#channels 3 and 1 in one step
+	assert played[9] == (1 << 1, 1 << 22)		#end and start of back to back pulses keep the channels on
+	assert played[11] == (1 << 17, 1 << 6)
+	assert played[1] == (0, 0)
+	compiler.reset()
+	assert compiler.fill(segment) == 8 and segment.words[0][0] == 1 << 24
+	compiler = pattern.PatternCompiler([3], [10], [2], [4], [[4]], on_values, 5)
+	assert compiler.max_error == 2
+	compiler = pattern.PatternCompiler([50], [20], [2], [10], [[2]], on_values, 5, segment_size=4)
+	assert (compiler.first_step, compiler.num_steps, compiler.num_segments) == (10, 17, 2)
+	segment = compiler.segment_buffer()
+	assert compiler.fill(segment) == 4 and segment.words[0][0] == 1 << 24		#the first segment starts at the first edge
+	try:
+		pattern.PatternCompiler([0], [10], [1], [5], [[5]], on_values, 5)
+		assert False, 'DAC channels cannot be played as GPIO pattern'
+	except ValueError:
+		pass
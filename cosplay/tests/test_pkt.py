@@ -0,0 +1,347 @@
+from cosplay.pkt import Packet
+from cosplay import pkt
+from cosplay import tsv
+from cosplay import telemetry
+from cosplay.serial_port import SerialPort
+import os, select, threading, time, tty
+
+class LoopbackPort(object):
+	"""Serial port replacement that returns everything written to it."""
+
+	def __init__(self):
+		self.data = bytearray()
+
+	def write(self, data):
+		self.data.extend(data)
+
+	def read_available(self):
+		data = self.data
+		self.data = bytearray()
+		return data
+
+sequence = [['onset', 'duration', 'frequency', 'pulse_width', 'amplitude', 'out_channel'],
+	    [1.0, 8.0, 20.0, 0.005, 'n/a', 1.0],
+	    [10.0, 8.0, 20.0, 0.005, 0.5, 5.0]]
+
+def test_decode_multiple_objects():
+	port = LoopbackPort()
+	pkt = Packet(port)
+	pkt.send('Test string!')
+	pkt.send(pkt.INS_send_sequences)
+	pkt.send(sequence)
+	objs = pkt.decode(port.read_available())
+	assert objs == ['Test string!', pkt.INS_send_sequences, sequence]
+
+def test_receive_buffer_reused():
+	port = LoopbackPort()
+	pkt = Packet(port)
+	pkt.send_many(['Test string!'] * 300 + [sequence])
+	data = port.read_available()
+	buf = pkt.rx_buf
+	objs = []
+	for k in range(0, len(data), 7):		#frames split across chunks, the buffer is compacted in place
+		objs.extend(pkt.decode(data[k:k + 7]))
+	assert objs == ['Test string!'] * 300 + [sequence]
+	assert pkt.rx_buf is buf and pkt.rx_start == pkt.rx_end == 0
+	large = [sequence[0]] + sequence[1:] * 1000
+	pkt.send(large)
+	data = port.read_available()
+	assert len(data) > len(buf)
+	assert pkt.decode(data[:100]) == [] and pkt.rx_end == 100
+	assert pkt.decode(data[100:]) == [large]		#the buffer grows for frames larger than it
+
+def test_decode_split_frames():
+	port = LoopbackPort()
+	pkt = Packet(port)
+	pkt.send('Test string!')
+	pkt.send(sequence)
+	data = port.read_available()
+	objs = []
+	for i in range(0, len(data), 7):
+		objs.extend(pkt.decode(data[i:i+7]))
+	assert objs == ['Test string!', sequence]
+
+def test_decode_resync():
+	port = LoopbackPort()
+	pkt = Packet(port)
+	pkt.send('corrupted')
+	corrupted = port.read_available()
+	corrupted[7] ^= 0xff
+	pkt.send(pkt.ANS_yes)
+	data = b'\x01\x02garbage' + corrupted + port.read_available()
+	assert pkt.decode(data) == [pkt.ANS_yes]
+
+def test_receive_stalled_frame():
+	port = LoopbackPort()
+	pkt = Packet(port)
+	port.write(bytearray((1, 0xff, 0xff, 6, 2)))	#header of a frame that never completes
+	pkt.send('Test string!')
+	assert pkt.receive(time_out=10) == 'Test string!'
+
+def test_send_many_single_write():
+	port = LoopbackPort()
+	writes = []
+	write = port.write
+	port.write = lambda data: writes.append(bytes(data)) or write(data)
+	pkt = Packet(port)
+	pkt.send_many(['Test string!', sequence, pkt.ANS_no])
+	assert len(writes) == 1
+	assert pkt.decode(port.read_available()) == ['Test string!', sequence, pkt.ANS_no]
+
+class CrossedPorts(object):
+	"""Two connected serial port replacements."""
+
+	def __init__(self):
+		self.a = LoopbackPort()
+		self.b = LoopbackPort()
+		self.a.read_available, self.b.read_available = self.b.read_available, self.a.read_available
+
+def test_capabilities_binary_sequence():
+	ports = CrossedPorts()
+	host = Packet(ports.a)
+	board = Packet(ports.b)
+	host.send(sequence)
+	assert ports.a.data[3] == pkt.SEQ		#no capabilities announced yet
+	assert board.receive(time_out=1) == sequence
+	board.send_capabilities()
+	board.send(board.INS_send_sequences)
+	assert host.receive(time_out=1) == host.INS_send_sequences
+	assert host.peer_capabilities == pkt.CAPABILITIES
+	assert board.decode(ports.b.read_available()) == []	#capabilities of the host
+	assert board.peer_capabilities == pkt.CAPABILITIES
+	host.send(sequence)
+	assert ports.a.data[3] == pkt.BSQ | pkt.CRC_FLAG
+	assert board.receive(time_out=1) == sequence
+	extended = [row + [0] for row in sequence]
+	extended[0][-1] = 'extra'
+	host.send(extended)
+	assert ports.a.data[3] == pkt.SEQ | pkt.CRC_FLAG	#tsv fallback
+	assert board.receive(time_out=1) == extended
+
+def test_compressed_library():
+	ports = CrossedPorts()
+	host = Packet(ports.a)
+	board = Packet(ports.b)
+	library = [[sequence[0]] + sequence[1:] * 200] * 10 + [host.ANS_no]
+	size = len(host.frame(library))
+	assert host.frames_size(host.payloads(library)) == size
+	assert host.send_many(library, compress=True) == size	#not negotiated
+	assert board.decode(ports.b.read_available()) == library
+	board.send_capabilities()
+	host.decode(ports.a.read_available())
+	board.decode(ports.b.read_available())
+	assert host.send_many(library, compress=True) < size / 10
+	assert board.decode(ports.b.read_available()) == library
+	large = [sequence[0]] + [[float(i), 8.0, 20.0, 0.005, 0.5, 5.0] for i in range(20000)]
+	payloads = host.prepare([large, host.ANS_no], compress=True)
+	assert len(payloads) > 1 and max([len(p[1]) for p in payloads]) <= pkt.FRG_SIZE + pkt.FRG_HDR_LEN
+	host.send_payloads(payloads)
+	assert board.decode(ports.b.read_available()) == [large, host.ANS_no]
+
+def test_fragmented_sequence():
+	ports = CrossedPorts()
+	host = Packet(ports.a)
+	board = Packet(ports.b)
+	large = [sequence[0]] + sequence[1:] * 3000
+	try:
+		host.send(large)
+		assert False, 'payload larger than 64 KiB must not be sent in one frame'
+	except ValueError:
+		pass
+	board.send_capabilities()
+	host.decode(ports.a.read_available())
+	board.decode(ports.b.read_available())
+	host.send(large)
+	assert board.decode(ports.b.read_available()) == [large]
+	fragments = []
+	board.fragment_handler = lambda pkt_type, index, data, last: fragments.append((pkt_type, index, bytes(data), last))
+	host.send_many([large, host.ANS_no])
+	assert board.decode(ports.b.read_available()) == [host.ANS_no]
+	assert [f[1] for f in fragments] == list(range(len(fragments)))
+	assert fragments[-1][3] and not fragments[0][3]
+	assert pkt.bseq.loads(b''.join([f[2] for f in fragments])) == large
+
+def test_binary_sequence_from_tsv_file():
+	text = tsv.dumps(sequence)
+	assert text.endswith('\n')		#like the tsv files of the library
+	matrix = tsv.loads(text)
+	assert matrix == sequence and len(matrix) - 1 == 2
+	assert pkt.bseq.loads(pkt.bseq.dumps(matrix)) == sequence
+
+def test_crc_nak_retransmission():
+	ports = CrossedPorts()
+	host = Packet(ports.a, window=4)
+	board = Packet(ports.b, window=4)
+	board.send_capabilities()
+	host.decode(ports.a.read_available())
+	board.decode(ports.b.read_available())
+	assert pkt.crc16(b'123456789') == 0x29b1
+	board.send('Start')
+	assert host.decode(ports.a.read_available()) == ['Start']
+	board.decode(ports.b.read_available())
+	board.send('Test string!')
+	ports.b.data[6] ^= 0x01		#'T' -> 'U' and 'e' -> 'd' keep the LRC of the payload
+	ports.b.data[7] ^= 0x01
+	assert host.decode(ports.a.read_available()) == []
+	assert board.decode(ports.b.read_available()) == []	#NAK triggers retransmission
+	assert host.decode(ports.a.read_available()) == ['Test string!']
+
+def test_crc_nak_earlier_frame():
+	ports = CrossedPorts()
+	host = Packet(ports.a, window=4)
+	board = Packet(ports.b)
+	board.send_capabilities()
+	host.decode(ports.a.read_available())
+	board.decode(ports.b.read_available())
+	host.send('zero')
+	assert board.decode(ports.b.read_available()) == ['zero']
+	host.decode(ports.a.read_available())
+	host.send_many(['first', 'second', host.ANS_no])
+	ports.a.data[7] ^= 0x01		#payload of the first frame
+	assert board.decode(ports.b.read_available()) == []	#the following frames are out of order
+	assert host.decode(ports.a.read_available()) == []	#NAK goes back to the first frame
+	assert board.decode(ports.b.read_available()) == ['first', 'second', host.ANS_no]
+	host.decode(ports.a.read_available())
+	assert host.flush(time_out=1)
+
+def test_crc_without_sequence_numbers():
+	ports = CrossedPorts()
+	host = Packet(ports.a)
+	board = Packet(ports.b)
+	board.send_capabilities()
+	host.decode(ports.a.read_available())
+	board.decode(ports.b.read_available())
+	host.send_many(['first', 'second', host.ANS_no])
+	ports.a.data[6] ^= 0x01		#payload of the first frame
+	assert board.decode(ports.b.read_available()) == ['second', host.ANS_no]
+	assert len(ports.b.data) == 0		#a resent frame would arrive out of order
+	assert not board.is_reliable()
+
+def test_telemetry():
+	ports = CrossedPorts()
+	host = Packet(ports.a)
+	board = Packet(ports.b)
+	board.send_capabilities()
+	assert host.receive(time_out=1) is None
+	board.decode(ports.b.read_available())
+	batch = telemetry.Batch(size=2)
+	assert batch.add(3, 0, telemetry.TICKS_PERIOD - 5, 10, telemetry.KIND_ONSET)
+	assert batch.add(3, 7, 100, 142, telemetry.KIND_END)
+	assert not batch.add(4, 0, 100, 101, telemetry.KIND_ONSET)
+	assert batch.overflow == 1
+	assert batch.record(1) == (3, 7, 100, 142, telemetry.KIND_END)
+	board.send_telemetry(batch)
+	assert ports.b.data[3] == pkt.TLM | pkt.CRC_FLAG
+	columns = host.receive(time_out=1)
+	assert columns['unit'] == 'us'
+	assert list(columns['event']) == [3, 3]
+	assert list(columns['pulse']) == [0, 7]
+	assert list(columns['kind']) == [telemetry.KIND_ONSET, telemetry.KIND_END]
+	assert telemetry.lateness(columns['scheduled'][0], columns['actual'][0]) == 15	#ticks wrapped around
+	assert telemetry.lateness(columns['scheduled'][1], columns['actual'][1]) == 42
+	summary = telemetry.Summary(5)
+	summary.add(3, 15, telemetry.KIND_ONSET)
+	summary.add(3, 5, telemetry.KIND_ONSET)
+	summary.add(3, 42, telemetry.KIND_END)
+	board.send_telemetry(summary)
+	columns = host.receive(time_out=1)
+	assert columns['format'] == telemetry.SUMMARY
+	assert [list(columns[name]) for name in telemetry.SUMMARY_COLUMNS] == [[3], [2], [15], [20], [1], [42], [42]]
+	assert telemetry.summary_message(*summary.record(3)) == 'Missed scheduled onset time of 2 pulses (max 15 us, mean 10.0 us) and scheduled end time of 1 pulses (max 42 us, mean 42.0 us) in event 3'
+
+class FdPort(object):
+	"""Serial port replacement for the master side of a pty."""
+
+	def __init__(self, fd):
+		self.fd = fd
+
+	def write(self, data):
+		data = bytes(data)
+		while len(data) > 0:
+			data = data[os.write(self.fd, data):]
+
+	def read_available(self):
+		if select.select([self.fd], [], [], 0)[0]:
+			return bytearray(os.read(self.fd, 65536))
+		return bytearray()
+
+class CorruptingPort(object):
+	"""Flip one byte in every `period`-th write."""
+
+	def __init__(self, port, period):
+		self.port = port
+		self.period = period
+		self.writes = 0
+
+	def write(self, data):
+		data = bytearray(data)
+		self.writes += 1
+		if self.writes % self.period == 0:
+			data[len(data) // 2] ^= 0x5a
+		self.port.write(data)
+
+	def read_available(self):
+		return self.port.read_available()
+
+def test_reliable_pty_loopback():
+	master, slave = os.openpty()
+	tty.setraw(master)
+	sp = SerialPort()
+	assert sp.connect_serial(os.ttyname(slave))
+	host = Packet(CorruptingPort(sp, 3), window=8, rto=50)
+	board = Packet(FdPort(master))
+	board.send_capabilities()
+	assert host.receive(time_out=100) is None		#capabilities are handled by Packet
+	assert host.is_reliable()
+	library = [[sequence[0]] + sequence[1:] * (i + 1) for i in range(100)]
+	received = []
+	def receive():
+		obj = board.receive(time_out=5000)
+		while type(obj) == list:
+			received.append(obj)
+			obj = board.receive(time_out=5000)
+		received.append(obj)
+	thread = threading.Thread(target=receive)
+	thread.start()
+	host.send_many(library + [host.ANS_no])
+	assert host.flush(time_out=10000)
+	thread.join()
+	sp.close_serial()
+	os.close(master)
+	os.close(slave)
+	assert received == library + [host.ANS_no]
+
+def test_receive_time_out():
+	master, slave = os.openpty()
+	tty.setraw(master)
+	sp = SerialPort()
+	assert sp.connect_serial(os.ttyname(slave))
+	pkt = Packet(sp, inter_byte_timeout=100)
+	start = time.time()
+	assert pkt.receive(time_out=200) is None
+	assert 0.2 <= time.time() - start < 0.4
+	os.write(master, b'\x01\x05\x00')		#start of a frame that is never completed
+	start = time.time()
+	assert pkt.receive(time_out=5000) is None
+	assert 0.1 <= time.time() - start < 0.3
+	sp.close_serial()
+	os.close(master)
+	os.close(slave)
+
+def test_reliable_ack_timeout():
+	for window in (-1, 128):
+		try:
+			Packet(LoopbackPort(), window=window)
+			assert False, 'windows beyond the sequence number space must raise ValueError'
+		except ValueError:
+			pass
+	ports = CrossedPorts()
+	host = Packet(ports.a, window=2, rto=20, ack_timeout=100)
+	board = Packet(ports.b)
+	board.send_capabilities()
+	host.decode(ports.a.read_available())
+	assert host.is_reliable()
+	start = time.time()
+	host.send_many(['first', 'second', 'third'])		#the board never acknowledges
+	assert 0.09 <= time.time() - start < 0.5		#ticks_ms counts whole milliseconds
+	assert not host.flush(time_out=50)
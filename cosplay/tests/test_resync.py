@@ -0,0 +1,31 @@
+from cosplay import resync
+from cosplay import telemetry
+
+def test_trigger_sync():
+	tr = 2000000
+	sync = resync.TriggerSync(tr, size=16)
+	start = telemetry.TICKS_PERIOD - 3000000		#ticks wrap around during the sequence
+	drift = 400		#the clock of the pyboard runs 200 ppm fast
+	triggers = [(start + k * (tr + drift)) % telemetry.TICKS_PERIOD for k in range(12)]
+	del triggers[5]		#missed trigger
+	for ticks in triggers:
+		sync.trigger(ticks)
+	sync.update()
+	assert sync.volume == 11
+	assert sync.log.count == 10
+	records = [sync.log.record(i) for i in range(sync.log.count)]
+	assert [r[1] for r in records] == [1, 2, 3, 4, 6, 7, 8, 9, 10, 11]
+	assert all(r[4] == telemetry.KIND_TRIGGER for r in records)
+	corrections = [telemetry.lateness(r[2], r[3]) for r in records]
+	assert corrections[0] == drift
+	assert abs(corrections[-1]) < drift / 10		#frequency locked
+	assert abs(sync.period - (tr + drift)) < drift / 10
+	next_onset = sync.schedule(11 * tr + tr // 2)
+	expected = (start + 11 * (tr + drift) + (tr + drift) // 2) % telemetry.TICKS_PERIOD
+	assert abs(telemetry.lateness(expected, next_onset)) < drift / 10
+	assert telemetry.message(*records[0]) == 'Volume trigger 1 (TR 1) arrived 400 us after the predicted time'
+	sync.trigger((triggers[-1] + 10) % telemetry.TICKS_PERIOD)		#bouncing trigger line
+	sync.update()
+	assert sync.volume == 11 and sync.log.count == 10
+	sync.reset()
+	assert sync.count == 0 and sync.log.count == 0
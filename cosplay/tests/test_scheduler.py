@@ -0,0 +1,23 @@
+from cosplay import scheduler
+
+def test_edge_scheduler():
+	onset = [0, 150, 1000]
+	period = [100, 100, 50]
+	num_pulses = [3, 2, 1]
+	pulse_width = [100, 20, 10]
+	edges = []
+	sched = scheduler.EdgeScheduler(onset, period, num_pulses, pulse_width)
+	while sched.peek() >= 0:
+		edges.append((sched.time, sched.event, sched.pulse, sched.edge))
+		sched.advance()
+	assert edges == [(0, 0, 0, 1), (100, 0, 0, 0), (100, 0, 1, 1), (150, 1, 0, 1), (170, 1, 0, 0),
+		(200, 0, 1, 0), (200, 0, 2, 1), (250, 1, 1, 1), (270, 1, 1, 0), (300, 0, 2, 0),
+		(1000, 2, 0, 1), (1010, 2, 0, 0)]
+	sched.reset()
+	sched.peek()
+	sched.drop()		#e.g. generated by a timer
+	assert sched.peek() == 1
+	assert scheduler.collisions(onset, period, num_pulses, pulse_width, [1, 3, 1]) == []
+	assert scheduler.collisions(onset, period, num_pulses, pulse_width, [1, 1, 1]) == [(0, 1)]
+	assert scheduler.collisions([0, 300], [100, 100], [3, 1], [100, 10], [2, 2]) == []
+	assert scheduler.collisions(onset, period, num_pulses, pulse_width, [[1, 3], 3, 1]) == [(0, 1)]
@@ -0,0 +1,25 @@
+from cosplay import timers
+
+def test_settings():
+	freq = timers.SOURCE_FREQ[8]
+	prescaler, period, width = timers.settings(freq, 100, 5)		#10 kHz, 5 us
+	assert (prescaler, period, width) == (0, 16799, 840)
+	assert timers.quantization(freq, prescaler, period, width) == (100000, 5000)
+	prescaler, period, width = timers.settings(freq, 50000, 5000)		#20 Hz needs a prescaler
+	assert (prescaler, period) == (128, 65115)
+	actual_period, actual_width = timers.quantization(freq, prescaler, period, width)
+	assert abs(actual_period - 50000000) < 1000 and abs(actual_width - 5000000) < 1000
+	assert timers.settings(timers.SOURCE_FREQ[2], 50000, 5000, bits=32) == (0, 4199999, 420000)
+	assert timers.settings(freq, 7, 3, ticks_per_second=1000) == (17, 65332, 28000)
+	for args in [(freq, 100, 200), (freq, 60000000, 5), (freq, 0, 0)]:
+		try:
+			timers.settings(*args)
+			assert False, 'invalid settings must raise ValueError'
+		except ValueError:
+			pass
+
+def test_bursts():
+	assert timers.bursts(1) == (1, 0)
+	assert timers.bursts(256) == (256, 0)
+	assert timers.bursts(257) == (1, 1)
+	assert timers.bursts(1000) == (232, 3)
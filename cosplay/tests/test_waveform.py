@@ -0,0 +1,24 @@
+from cosplay import waveform
+
+def test_samples():
+	assert waveform.parse('n/a') is None and waveform.parse(1.0) is None
+	assert waveform.parse('sine') == ('sine', None)
+	assert waveform.parse('table:0,0.5,1') == ('table', [0., 0.5, 1.])
+	for value in ('triangle', 'table:0,2', 'table:a'):
+		try:
+			waveform.parse(value)
+			assert False, 'invalid waveform must raise ValueError'
+		except ValueError:
+			pass
+	buf = waveform.samples(('ramp', None), 100, 40, 1., 100000)		#10 kHz, 40 us at 100 kS/s
+	assert list(buf) == [64, 128, 191, 255, 0, 0, 0, 0, 0, 0]
+	buf = waveform.samples(('sine', None), 1000, 1000, 0.5, 10000)
+	assert list(buf) == [3, 26, 64, 101, 124, 124, 101, 64, 26, 3]		#half amplitude
+	buf = waveform.samples(('table', [0., 1.]), 1000, 400, 1., 10000)
+	assert list(buf) == [0, 0, 255, 255, 0, 0, 0, 0, 0, 0]
+	assert waveform.period_error(33, 100000) == -3000		#3 samples are played in 30 us
+	try:
+		waveform.samples(('sine', None), 1000000, 500000, 1., 100000)
+		assert False, 'periods with too many samples must raise ValueError'
+	except ValueError:
+		pass
@@ -39,6 +39,8 @@ def loads(s):
 	    First columns contains event numbers.
 	"""
 	s = s.split('\n')
+	while len(s) > 1 and s[-1] == '':
+		s.pop()			#newline at the end of the file
 	matrix = [[cast(x) for x in s[i].split('\t')] for i in range(1,len(s))]
 	head = s[0].split('\t')
 	matrix.insert(0,head)
@@ -78,13 +80,10 @@ def dumps(matrix):
 	string
 	    tsv formatted string.
 	"""
-	s = '\t'.join(matrix[0])
+	lines = ['\t'.join(matrix[0])]
 	for i in range(1,len(matrix)):
-		s = s + '\n'
-		for l in range(len(matrix[i])-1):
-			s = s + str(matrix[i][l]) + '\t'
-		s = s + str(matrix[i][len(matrix[i])-1])
-	return s
+		lines.append('\t'.join([str(x) for x in matrix[i]]))
+	return '\n'.join(lines) + '\n'
 
 def dump(matrix,file_obj):
 	"""
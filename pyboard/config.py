@@ -13,3 +13,71 @@ on_value_out_channel3 = 1
 on_value_out_channel4 = 1
 on_value_out_channel5 = 1
 on_value_out_channel6 = 1
+
+"""Number of packets (at most 127) sent to the host without acknowledgment.
+Lost or corrupted packets are retransmitted. 0 disables the reliable mode."""
+window = 0
+
+"""Timing deviations (e.g. missed onsets) are reported after the sequence as
+lateness statistics of each event. If timing_detail is True, every deviation
+is reported as well. At most timing_buffer_size deviations are recorded, further
+deviations are only counted."""
+timing_detail = False
+timing_buffer_size = 256
+
+"""If disable_gc is True, garbage is collected before the system is armed and
+garbage collection is disabled while the sequence is delivered, so it cannot
+pause pulses. Sequences leaving less than min_free_memory bytes of heap memory
+free after they are loaded are rejected."""
+disable_gc = True
+min_free_memory = 8192
+
+"""Repetition time of the scanner in s. If tr is not None, every volume trigger
+is timestamped while the sequence is delivered and the upcoming onsets are
+re-anchored to it, correcting the drift between the clocks of the pyboard and
+the scanner. The correction at each of at most resync_log_size triggers is
+reported after the sequence."""
+tr = None
+resync_log_size = 1024
+
+"""If timer_pulses is True, the pulses of the out channels 1 to 4 are generated
+by hardware timers in PWM mode instead of being timed by the interpreter. Only
+the onset of each event is timed in software."""
+timer_pulses = False
+
+"""Events of the out channels 1 to 4 with a frequency of at least pwm_min_frequency
+Hz are generated by hardware timers even if timer_pulses is False. The timers
+of out channels 1 and 3 count the pulses with their repetition counter, so their
+frequency is only limited by the timer clock. Out channels 2 and 4 support at
+most 10 kHz. None disables this mode."""
+pwm_min_frequency = None
+
+"""If concurrent_events is True, the pulse edges of all events are merged into one
+stream ordered by time, so events of different out channels can overlap.
+Sequences with overlapping events on the same out channel are rejected."""
+concurrent_events = False
+
+"""If gpio_registers is True, the digital out channels 1 to 4 are switched by
+writing to the bit set/reset registers of the GPIO ports instead of calling
+pyb.Pin.value. Events with a channel list like '1+3' as out_channel are always
+switched this way; channels on the same port (2 and 3) switch at the same instant."""
+gpio_registers = False
+
+"""If dma_pattern is True, sequences of the digital out channels 1 to 4 are
+compiled into patterns of GPIO register words on a grid with a step of
+dma_resolution s, which are played by DMA transfers triggered by timer 8.
+Patterns are compiled in segments of dma_segment_size steps while they are
+played. Edges are shifted to the closest step of the grid. The pattern is
+started relative to the trigger; with tr set, later volume triggers do not
+shift it. Sequences with events on the out channels 5 and 6 are rejected in
+this mode."""
+dma_pattern = False
+dma_resolution = 0.00001
+dma_segment_size = 512
+
+"""Pulses of the out channels 5 and 6 can be shaped with the sequence column
+'waveform'. One period of the waveform is computed before the sequence is
+armed and played by DMA with dac_sample_rate samples per second. Both DACs use
+the same sample rate. Periods need at most dac_max_samples samples."""
+dac_sample_rate = 100000
+dac_max_samples = 4096
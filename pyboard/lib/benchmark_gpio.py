@@ -0,0 +1,46 @@
+"""
+Benchmark of the output of the digital out channels with `pyb.Pin.value`
+against writes to the GPIO registers with `gpio.PortWriter`. Copy it to the
+pyboard and run ``import benchmark_gpio; benchmark_gpio.run()``. The pins
+of the out channels toggle during the benchmark, so disconnect the
+stimulation devices first.
+
+The overhead is the time of one call switching all channels. The skew
+between the channels is not measured, the CPU cannot observe the pins
+while it writes them. Channels on the same port switch in the same bus
+write, so their skew is 0. The skew between ports is at most the time of
+the call and can be measured with an oscilloscope on the pins.
+"""
+
+import pyb
+import utime
+import gpio
+
+def measure(func, repetitions):
+	"""Return the mean time in ns of a call of `func(state)`."""
+	start = utime.ticks_us()
+	state = True
+	for k in range(repetitions):
+		func(state)
+		state = not state
+	return utime.ticks_diff(utime.ticks_us(), start) * 1000 // repetitions
+
+def run(repetitions=10000):
+	pins = {}
+	for channel in gpio.CHANNELS:
+		pin = pyb.Pin(gpio.CHANNELS[channel][0] + str(gpio.CHANNELS[channel][1]), pyb.Pin.OUT_PP)
+		pins[channel] = pin
+	on_values = {1: 1, 2: 1, 3: 1, 4: 1}
+	print('Edge of one channel:')
+	print('  Pin.value:        {0} ns'.format(measure(pins[2].value, repetitions)))
+	print('  PortWriter.value: {0} ns'.format(measure(gpio.PortWriter([2], on_values).value, repetitions)))
+	for channels in ([2, 3], [1, 2, 3, 4]):
+		def sequential(state):
+			for channel in channels:
+				pins[channel].value(state)
+		writer = gpio.PortWriter(channels, on_values)
+		pin_time = measure(sequential, repetitions)
+		writer_time = measure(writer.value, repetitions)
+		print('Edge of channels {0} ({1} ports):'.format(channels, writer.num_ports))
+		print('  Pin.value:        {0} ns ({1} writes)'.format(pin_time, len(channels)))
+		print('  PortWriter.value: {0} ns ({1} writes)'.format(writer_time, writer.num_ports))
@@ -0,0 +1,186 @@
+"""
+Packed binary representation of sequences.
+
+A sequence is stored as a header followed by one column after another.
+All values are little-endian. The header contains the format version,
+the number of columns and the number of events. Columns 'onset',
+'duration', 'frequency', 'pulse_width' and 'amplitude' are stored as
+float64, column 'out_channel' as uint8. Amplitudes that are not available
+('n/a') are stored as NaN.
+
+`load_columns` reads the columns directly into arrays, so compiling a
+stored sequence does not create a Python object for every value.
+"""
+
+try:
+	from array import array
+except ImportError:
+	from uarray import array
+
+try:
+	from io import BytesIO
+except ImportError:
+	from uio import BytesIO
+
+try:
+	import ustruct as struct
+except ImportError:
+	import struct
+
+try:
+	StructError = struct.error
+except AttributeError:
+	#MicroPython's ustruct raises ValueError
+	StructError = ValueError
+
+VERSION = 1
+HEADER = '<BBI'		#version, number of columns, number of events
+HEADER_LEN = struct.calcsize(HEADER)
+COLUMNS = ('onset', 'duration', 'frequency', 'pulse_width', 'amplitude', 'out_channel')
+FORMATS = ('d', 'd', 'd', 'd', 'd', 'B')
+NOT_AVAILABLE = 'n/a'
+
+def dumps(matrix):
+	"""
+	Serialize `matrix` to packed binary columns.
+
+	Parameters
+	----------
+	matrix : 2d array
+	    Sequence in the format returned by `tsv.loads`.
+
+	Returns
+	-------
+	bytes
+	    Packed sequence.
+
+	Raises
+	------
+	ValueError
+	    If the sequence has columns other than `COLUMNS` or
+	    values that cannot be packed.
+	"""
+	head = matrix[0]
+	if len(head) != len(COLUMNS):
+		raise ValueError('Sequence has columns {0}, only {1} can be packed.'.format(head, COLUMNS))
+	num_events = len(matrix) - 1
+	parts = [struct.pack(HEADER, VERSION, len(COLUMNS), num_events)]
+	for name, fmt in zip(COLUMNS, FORMATS):
+		try:
+			column = head.index(name)
+		except ValueError:
+			raise ValueError('Sequence has no column {0}.'.format(name))
+		values = [matrix[i][column] for i in range(1, num_events + 1)]
+		if fmt == 'd':
+			values = [float('nan') if x == NOT_AVAILABLE else x for x in values]
+		else:
+			values = [int(x) for x in values]
+		try:
+			parts.append(struct.pack('<{0}{1}'.format(num_events, fmt), *values))
+		except StructError:
+			raise ValueError('Column {0} contains values that cannot be packed.'.format(name))
+	return b''.join(parts)
+
+def load_columns(file_obj):
+	"""
+	Load packed binary sequence file as columns.
+
+	Parameters
+	----------
+	file_obj : file object
+	    File object opened in binary mode.
+
+	Returns
+	-------
+	list of arrays
+	    Columns in the order of `COLUMNS`, array('d') of the floats and
+	    array('B') of the out channels. Amplitudes that are not available
+	    are NaN.
+
+	Raises
+	------
+	ValueError
+	    If the file is not a complete packed sequence of this version.
+	"""
+	header = file_obj.read(HEADER_LEN)
+	if len(header) != HEADER_LEN:
+		raise ValueError('Packed sequence is incomplete.')
+	version, num_columns, num_events = struct.unpack(HEADER, header)
+	if version != VERSION or num_columns != len(COLUMNS):
+		raise ValueError('Unsupported packed sequence version {0}.'.format(version))
+	columns = []
+	for fmt in FORMATS:
+		column = array(fmt, [0] * num_events)
+		if num_events > 0 and file_obj.readinto(column) != num_events * struct.calcsize(fmt):
+			raise ValueError('Packed sequence is incomplete.')
+		columns.append(column)
+	return columns
+
+def loads_columns(buf):
+	"""
+	Convert packed binary columns into arrays (see `load_columns`).
+
+	Parameters
+	----------
+	buf : bytes / bytearray / memoryview
+	    Packed sequence.
+
+	Returns
+	-------
+	list of arrays
+	    Columns in the order of `COLUMNS`.
+	"""
+	return load_columns(BytesIO(buf))
+
+def loads(buf):
+	"""
+	Convert packed binary columns into a matrix.
+
+	Parameters
+	----------
+	buf : bytes / bytearray / memoryview
+	    Packed sequence.
+
+	Returns
+	-------
+	2d array
+	    First line contains names for columns.
+	    Same format as returned by `tsv.loads`.
+	"""
+	columns = loads_columns(buf)
+	matrix = [list(COLUMNS)]
+	for i in range(len(columns[0])):
+		row = [column[i] for column in columns]		#out channels stay ints
+		if row[4] != row[4]:		#NaN
+			row[4] = NOT_AVAILABLE
+		matrix.append(row)
+	return matrix
+
+def load(file_obj):
+	"""
+	Load packed binary sequence file.
+
+	Parameters
+	----------
+	file_obj : file object
+	    File object opened in binary mode.
+
+	Returns
+	-------
+	2d array
+	    First line contains names for columns.
+	"""
+	return loads(file_obj.read())
+
+def dump(matrix, file_obj):
+	"""
+	Serialize `matrix` as packed binary columns to `file_obj`.
+
+	Parameters
+	----------
+	matrix : 2d array
+	    Input matrix.
+	file_obj : file_obj
+	    A .write()-supporting file-like object opened in binary mode.
+	"""
+	file_obj.write(dumps(matrix))
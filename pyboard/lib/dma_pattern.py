@@ -0,0 +1,120 @@
+import pyb
+import stm
+import uctypes
+import timers
+
+RCC_AHB1ENR = 0x40023830
+DMA2EN = 1 << 22
+DMA2 = 0x40026400
+LISR = DMA2 + 0x00
+LIFCR = DMA2 + 0x08
+TIM8_DIER = 0x40010400 + 0x0c
+
+#DMA requests of timer 8 on DMA2 channel 7: (stream, DIER bit) used for the ports in this order
+REQUESTS = ((1, 1 << 8), (2, 1 << 9), (3, 1 << 10))		#update, compare 1, compare 2
+FLAG_SHIFT = (0, 6, 16, 22)		#position of the interrupt flags of streams 0 to 3 in LISR
+TCIF = 1 << 5
+
+CR_EN = 1
+CR_CT = 1 << 19
+CR_CONFIG = (7 << 25) | (1 << 18) | (2 << 16) | (2 << 13) | (2 << 11) | (1 << 10) | (1 << 8) | (1 << 6)	#channel 7, double buffer, high priority, 32 bit words, memory increment, circular, memory to peripheral
+
+class PatternPlayer:
+	"""
+	Play a GPIO pattern compiled by `pattern.PatternCompiler` with DMA.
+
+	Timer 8 triggers one DMA transfer per port and step of the grid from
+	a segment to the bit set/reset register of the port. The streams run
+	in double buffer mode: while one segment is transferred, the CPU fills
+	the other one. The pins are not timed by the CPU.
+	Uses timer 8 and the streams 1 to 3 of DMA2, which must not be used
+	otherwise (e.g. by timer pulses of out channel 1).
+
+	Parameters
+	----------
+	compiler : `pattern.PatternCompiler` object
+	ticks_per_second : int, optional
+	    Number of ticks per second of the schedule. Default is 1000000.
+	"""
+	def __init__(self, compiler, ticks_per_second=1000000):
+		self.compiler = compiler
+		self.timer = pyb.Timer(8)
+		prescaler, period, width = timers.settings(self.timer.source_freq(), compiler.resolution, 0, ticks_per_second, 16)
+		self.resolution_ns = timers.quantization(self.timer.source_freq(), prescaler, period, 0)[0]
+		self.timer.init(prescaler=prescaler, period=period)
+		self.timer.channel(1, pyb.Timer.OC_TIMING, compare=0)
+		self.timer.channel(2, pyb.Timer.OC_TIMING, compare=0)
+		self.segments = (compiler.segment_buffer(), compiler.segment_buffer())
+		self.streams = [REQUESTS[k][0] for k in range(len(compiler.ports))]
+		self.dier = 0
+		for k in range(len(compiler.ports)):
+			self.dier |= REQUESTS[k][1]
+		self.done_flag = TCIF << FLAG_SHIFT[self.streams[0]]
+		self.clear_flags = 0
+		for stream in self.streams:
+			self.clear_flags |= 0x3d << FLAG_SHIFT[stream]
+		self.underruns = 0
+
+	def stream_register(self, stream, offset):
+		return DMA2 + 0x10 + 0x18 * stream + offset
+
+	def arm(self):
+		"""Fill the first two segments and prepare the DMA streams."""
+		compiler = self.compiler
+		compiler.reset()
+		compiler.fill(self.segments[0])
+		compiler.fill(self.segments[1])
+		stm.mem32[RCC_AHB1ENR] |= DMA2EN
+		stm.mem32[TIM8_DIER] &= ~0x700
+		for k in range(len(self.streams)):
+			stream = self.streams[k]
+			stm.mem32[self.stream_register(stream, 0)] = 0		#disable the stream before configuring it
+			while stm.mem32[self.stream_register(stream, 0)] & CR_EN:
+				pass
+			stm.mem32[self.stream_register(stream, 4)] = compiler.segment_size
+			stm.mem32[self.stream_register(stream, 8)] = compiler.addresses[k]
+			stm.mem32[self.stream_register(stream, 0xc)] = uctypes.addressof(self.segments[0].words[k])
+			stm.mem32[self.stream_register(stream, 0x10)] = uctypes.addressof(self.segments[1].words[k])
+			stm.mem32[self.stream_register(stream, 0x14)] = 0		#direct mode
+		stm.mem32[LIFCR] = self.clear_flags
+		for stream in self.streams:
+			stm.mem32[self.stream_register(stream, 0)] = CR_CONFIG | CR_EN
+		self.underruns = 0
+
+	def start_time(self):
+		"""Return the time in ticks after the trigger at which `play` has
+		   to be called, so the first segment is played on the grid. It
+		   is negative if the sequence starts with an edge at 0."""
+		return (self.compiler.first_step - 1) * self.compiler.resolution
+
+	def play(self):
+		"""
+		Start the pattern at the next step of the timer and return
+		after the last segment was transferred.
+		"""
+		compiler = self.compiler
+		segments = self.segments
+		control = self.stream_register(self.streams[0], 0)
+		self.timer.counter(0)
+		stm.mem32[TIM8_DIER] |= self.dier		#the timer requests transfers from now on
+		finished = False
+		while True:
+			while not stm.mem32[LISR] & self.done_flag:
+				pass
+			stm.mem32[LIFCR] = self.clear_flags
+			if finished:
+				break		#the last segment was transferred
+			if stm.mem32[control] & CR_CT:
+				done = segments[0]
+			else:
+				done = segments[1]
+			finished = compiler.fill(done) == 0		#an empty segment does not change any pin
+			if stm.mem32[LISR] & self.done_flag:
+				self.underruns += 1		#the other segment ended before this one was filled
+		self.stop()
+
+	def stop(self):
+		"""Stop the timer requests and disable the streams."""
+		stm.mem32[TIM8_DIER] &= ~0x700
+		for stream in self.streams:
+			stm.mem32[self.stream_register(stream, 0)] = 0
@@ -1,9 +1,15 @@
 import path as ospath
 import uos
+import telemetry
+from pkt import CAP_TLM
 
 class ErrorHandler:
-	def __init__(self, use_wo_server, pkt=None, storage_path=None):
+	def __init__(self, use_wo_server, pkt=None, storage_path=None, unit='us', size=256, detail=False):
 		self.use_wo_server = use_wo_server
+		self.unit = unit
+		self.detail = detail		#report every deviation in addition to the statistics of each event
+		self.batch = telemetry.Batch(size, unit)	#timing deviations of the sequence that is delivered
+		self.summary = telemetry.Summary(0, unit)	#lateness statistics of the events of the sequence
 		if use_wo_server:
 			self.msgstr = ''
 			self.storage_path = storage_path
@@ -28,6 +34,82 @@ class ErrorHandler:
 		else:
 			self.pkt.send(s)
 
+	def start(self, num_events):
+		"""
+		Prepare the statistics for a sequence with `num_events` events.
+
+		Call this function before the sequence is delivered because
+		it allocates memory.
+		"""
+		self.summary = telemetry.Summary(num_events, self.unit)
+		self.batch.clear()
+
+	def timing(self, event, pulse, scheduled, actual, kind):
+		"""
+		Record a timing deviation of a pulse.
+
+		The deviation is added to the statistics of its event and, if
+		`detail` is set, stored in a preallocated buffer. Neither
+		allocates memory or sends anything, so it can be called
+		while pulses are delivered. Deviations that do not fit in the
+		buffer are only counted. Call `flush` after the sequence to
+		report them.
+
+		Parameters
+		----------
+		event : int
+		    Index of the event.
+		pulse : int
+		    Index of the pulse in the event.
+		scheduled : int
+		    Scheduled ticks.
+		actual : int
+		    Actual ticks.
+		kind : int
+		    Kind of the deviation, e.g. `telemetry.KIND_ONSET`.
+		"""
+		self.summary.add(event, telemetry.lateness(scheduled, actual), kind)
+		if self.detail:
+			self.batch.add(event, pulse, scheduled, actual, kind)
+
+	def flush(self):
+		"""
+		Report the recorded timing deviations.
+
+		One summary record is reported for each event with deviations,
+		followed by the individual deviations if `detail` is set. If the
+		server supports telemetry, they are sent as binary records.
+		Otherwise they are formatted as messages.
+		"""
+		summary = self.summary
+		batch = self.batch
+		events = summary.events()
+		if not self.use_wo_server and self.pkt.peer_capabilities & CAP_TLM:
+			if len(events) > 0:
+				self.pkt.send_telemetry(summary)
+		else:
+			for event in events:
+				self.send(telemetry.summary_message(*summary.record(event), unit=self.unit))
+		self.summary = telemetry.Summary(0, self.unit)
+		self.report(batch)
+
+	def report(self, batch):
+		"""
+		Report the records in a `telemetry.Batch` and clear it.
+
+		If the server supports telemetry, the records are sent as binary
+		records. Otherwise they are formatted as messages.
+		"""
+		if batch.count > 0:
+			if not self.use_wo_server and self.pkt.peer_capabilities & CAP_TLM:
+				self.pkt.send_telemetry(batch)
+			else:
+				for i in range(batch.count):
+					self.send(telemetry.message(*batch.record(i), unit=self.unit))
+		if batch.overflow > 0:
+			self.send('Missed {0} timing records, which were not recorded because the buffer for {1} records was full.'.format(batch.overflow, batch.size))
+		batch.clear()
+
 	def save(self):
 		"""
 		Save error messages to file.
@@ -42,6 +124,7 @@ class ErrorHandler:
 		"""
 		if not self.use_wo_server:
 			return
+		self.flush()
 		idx = 0
 		while ospath.exists(self.storage_path + '/sequence' + str(idx) + '.tsv'):
 			idx += 1
@@ -0,0 +1,255 @@
+"""
+Compiled event tables of sequences.
+
+The parameters of the events of a sequence are converted to ticks once and
+stored in fixed-type columns: one 32 bit integer per event for the onset,
+period, number of pulses and pulse width and the sleep times derived from
+them, and one byte for the amplitude, the out channel and the waveform. Out
+channels and waveforms are stored as indices into tables of the distinct
+values of the sequence, so a channel list like '1+3' or a waveform table is
+only stored once.
+
+Tables are dumped as a header followed by the raw columns and the value
+tables, so loading a table reads the columns directly into arrays without
+parsing or compiling the sequence. The pyboard caches the table of each
+library file next to it.
+"""
+
+try:
+	from array import array
+except ImportError:
+	from uarray import array
+
+try:
+	import ustruct as struct
+except ImportError:
+	import struct
+
+VERSION = 2
+HEADER = '<BIIIIIBB'		#version, number of events, ticks per second, tmax, size and mtime of the sequence file, number of channels and waveforms
+HEADER_LEN = struct.calcsize(HEADER)
+COLUMNS = ('onset', 'period', 'num_pulses', 'pulse_width', 'onset_sleep', 'pulse_sleep', 'amplitude', 'channel', 'waveform')
+TYPECODES = ('i', 'i', 'i', 'i', 'i', 'i', 'B', 'B', 'B')
+ITEMSIZE = {'i': 4, 'B': 1}
+NOT_AVAILABLE = 'n/a'
+DAC_CHANNELS = (5, 6)
+MAX_INT = (1 << 31) - 1
+
+class EventTable(object):
+	"""
+	Columns of the events of a sequence in ticks.
+
+	Parameters
+	----------
+	num_events : int
+	    Number of events.
+	ticks_per_second : int, optional
+	    Number of ticks per second. Default is 1000000.
+	tmax : int, optional
+	    Longest time in ticks of a single sleep. The sleep times are the
+	    multiples of `tmax` in the onset intervals and pulse widths.
+	    Default is 2**29.
+
+	Attributes
+	----------
+	onset, period, num_pulses, pulse_width, onset_sleep, pulse_sleep : array('i')
+	    Parameters of each event in ticks.
+	amplitude : array('B')
+	    Amplitude of each event, 0 to 255 for the out channels 5 and 6
+	    and 1 for the digital out channels.
+	channel : array('B')
+	    Index of the out channel of each event in `channels`.
+	waveform : array('B')
+	    Index of the waveform of each event in `waveforms`.
+	channels : list
+	    Distinct out channels, an int or a channel list like '1+3'.
+	waveforms : list
+	    Distinct values of the column 'waveform'. The first one is 'n/a'.
+	source : tuple
+	    (size, mtime) of the sequence file the table was compiled from.
+	"""
+
+	def __init__(self, num_events, ticks_per_second=1000000, tmax=1<<29):
+		self.ticks_per_second = ticks_per_second
+		self.tmax = tmax
+		for name, typecode in zip(COLUMNS, TYPECODES):
+			setattr(self, name, array(typecode, [0] * num_events))
+		self.channels = []
+		self.waveforms = [NOT_AVAILABLE]
+		self.source = (0, 0)
+
+	def __len__(self):
+		return len(self.onset)
+
+	def columns(self):
+		"""Return the columns in the order of `COLUMNS`."""
+		return [getattr(self, name) for name in COLUMNS]
+
+def value_index(values, value):
+	"""Return the index of `value` in `values` and append it if necessary."""
+	for k in range(len(values)):
+		if values[k] == value:
+			return k
+	if len(values) == 255:
+		raise ValueError('A sequence can use at most 255 different out channels or waveforms.')
+	values.append(value)
+	return len(values) - 1
+
+def out_channel(value):
+	"""Return an out channel as int 1 to 6 or a channel list string."""
+	if type(value) == str:
+		if value.isdigit():
+			value = int(value)
+		else:
+			return value
+	if value != int(value) or int(value) < 1 or int(value) > 6:
+		raise ValueError('Unrecognized out channel {0}.'.format(value))
+	return int(value)
+
+def check_ticks(value):
+	"""Raise a ValueError if `value` does not fit into a column."""
+	if value < -MAX_INT - 1 or value > MAX_INT:
+		raise ValueError('Time of {0} ticks is too long.'.format(value))
+	return value
+
+def from_sequence(matrix, ticks_per_second=1000000, tmax=1<<29):
+	"""
+	Compile a sequence into an `EventTable`.
+
+	Parameters
+	----------
+	matrix : 2d array
+	    Sequence in the format returned by `tsv.loads`.
+	ticks_per_second : int, optional
+	    Number of ticks per second. Default is 1000000.
+	tmax : int, optional
+	    Longest time in ticks of a single sleep. Default is 2**29.
+
+	Returns
+	-------
+	`EventTable`
+
+	Raises
+	------
+	ValueError
+	    If a column is missing or an event is invalid.
+	"""
+	head = matrix[0]
+	columns = [[matrix[i][k] for i in range(1, len(matrix))] for k in range(len(head))]
+	return from_columns(head, columns, ticks_per_second, tmax)
+
+def from_columns(head, columns, ticks_per_second=1000000, tmax=1<<29):
+	"""
+	Compile the columns of a sequence into an `EventTable`.
+
+	Parameters
+	----------
+	head : list
+	    Names of the columns.
+	columns : list
+	    Values of each column, lists or arrays like those returned by
+	    `bseq.load_columns`. Amplitudes that are not available are 'n/a'
+	    or NaN.
+	ticks_per_second : int, optional
+	    Number of ticks per second. Default is 1000000.
+	tmax : int, optional
+	    Longest time in ticks of a single sleep. Default is 2**29.
+
+	Returns
+	-------
+	`EventTable`
+
+	Raises
+	------
+	ValueError
+	    If a column is missing or an event is invalid.
+	"""
+	try:
+		onsets = columns[head.index('onset')]
+		frequencies = columns[head.index('frequency')]
+		durations = columns[head.index('duration')]
+		pulse_widths = columns[head.index('pulse_width')]
+		out_channels = columns[head.index('out_channel')]
+		amplitudes = columns[head.index('amplitude')]
+	except ValueError:
+		raise ValueError('Sequence needs the columns onset, frequency, duration, pulse_width, out_channel and amplitude.')
+	waveforms = None
+	if 'waveform' in head:
+		waveforms = columns[head.index('waveform')]
+	table = EventTable(len(onsets), ticks_per_second, tmax)
+	previous = 0
+	for i in range(len(table)):
+		period = int(1. / frequencies[i] * ticks_per_second)
+		onset = check_ticks(int(onsets[i] * ticks_per_second))
+		pulse_width = check_ticks(int(pulse_widths[i] * ticks_per_second))
+		if period < pulse_widths[i] * ticks_per_second:
+			raise ValueError('Period of event {0} is smaller than pulse width.'.format(i + 1))
+		table.onset[i] = onset
+		table.period[i] = check_ticks(period)
+		table.num_pulses[i] = check_ticks(round(durations[i] * ticks_per_second / period))
+		table.pulse_width[i] = pulse_width
+		table.onset_sleep[i] = onset - previous - (onset - previous) % tmax
+		table.pulse_sleep[i] = pulse_width - pulse_width % tmax
+		previous = onset
+		channel = out_channel(out_channels[i])
+		if channel in DAC_CHANNELS:
+			table.amplitude[i] = min(max(int(amplitudes[i] * 255), 0), 255)
+		else:
+			table.amplitude[i] = 1
+		table.channel[i] = value_index(table.channels, channel)
+		if waveforms is not None and type(waveforms[i]) == str and waveforms[i] != '':
+			table.waveform[i] = value_index(table.waveforms, waveforms[i])
+	return table
+
+def dump(table, file_obj):
+	"""
+	Write `table` to `file_obj`.
+
+	Parameters
+	----------
+	table : `EventTable`
+	file_obj : file object
+	    A .write()-supporting file-like object opened in binary mode.
+	"""
+	file_obj.write(struct.pack(HEADER, VERSION, len(table), table.ticks_per_second, table.tmax,
+		table.source[0], table.source[1], len(table.channels), len(table.waveforms)))
+	for column in table.columns():
+		file_obj.write(column)
+	values = '\t'.join([str(c) for c in table.channels]) + '\n' + '\t'.join(table.waveforms)
+	file_obj.write(values.encode())
+
+def load(file_obj):
+	"""
+	Read an `EventTable` written by `dump`.
+
+	Parameters
+	----------
+	file_obj : file object
+	    File object opened in binary mode.
+
+	Returns
+	-------
+	`EventTable`
+
+	Raises
+	------
+	ValueError
+	    If the file is not a complete table of this version.
+	"""
+	header = file_obj.read(HEADER_LEN)
+	if len(header) != HEADER_LEN:
+		raise ValueError('Event table is incomplete.')
+	version, num_events, ticks_per_second, tmax, size, mtime, num_channels, num_waveforms = struct.unpack(HEADER, header)
+	if version != VERSION:
+		raise ValueError('Unsupported event table version {0}.'.format(version))
+	table = EventTable(num_events, ticks_per_second, tmax)
+	table.source = (size, mtime)
+	for column, typecode in zip(table.columns(), TYPECODES):
+		if num_events > 0 and file_obj.readinto(column) != num_events * ITEMSIZE[typecode]:
+			raise ValueError('Event table is incomplete.')
+	channels, waveforms = file_obj.read().decode().split('\n')
+	table.channels = [out_channel(c) for c in channels.split('\t') if c != '']
+	table.waveforms = waveforms.split('\t')
+	if len(table.channels) != num_channels or len(table.waveforms) != num_waveforms:
+		raise ValueError('Event table is incomplete.')
+	return table
@@ -0,0 +1,90 @@
+import uos
+import tsv
+import bseq
+from pkt import BSQ
+
+class LibraryWriter:
+	"""
+	Store sequences received from the server in the sequence library.
+
+	Sequences that are received as a whole are written with `write`.
+	Fragments of large sequences are written to flash one after another
+	by `fragment`, which can be used as `fragment_handler` of a
+	`pkt.Packet`, so the sequence is never held in RAM.
+	"""
+	def __init__(self, path):
+		self.path = path
+		self.sequence_idx = 0
+		self.fp = None
+		self.file_path = None
+		self.frg_next = 0
+
+	def clear(self):
+		"""Remove all files from the library."""
+		for s in uos.listdir(self.path):
+			uos.remove(self.path + '/' + s)
+
+	def next_path(self, extension):
+		file_path = self.path + '/sequence' + str(self.sequence_idx) + extension
+		self.sequence_idx += 1
+		return file_path
+
+	def write(self, seq):
+		"""
+		Write sequence to the library.
+
+		Sequences are stored as packed binary files if possible,
+		which are loaded without parsing text.
+
+		Parameters
+		----------
+		seq : 2d array
+		    Sequence.
+		"""
+		try:
+			data = bseq.dumps(seq)
+			with open(self.next_path('.bsq'), 'wb') as fp:
+				fp.write(data)
+		except ValueError:
+			with open(self.next_path('.tsv'), 'w+') as fp:
+				fp.write(tsv.dumps(seq))
+
+	def fragment(self, pkt_type, index, data, last):
+		"""
+		Append fragment of a sequence to its file.
+
+		Parameters
+		----------
+		pkt_type : int
+		    Type of the sequence payload (pkt.SEQ or pkt.BSQ).
+		index : int
+		    Index of the fragment.
+		data : memoryview
+		    Data of the fragment.
+		last : bool
+		    True for the last fragment of the sequence.
+		"""
+		if index == 0:
+			self.abort()
+			if pkt_type == BSQ:
+				self.file_path = self.next_path('.bsq')
+			else:
+				self.file_path = self.next_path('.tsv')
+			self.fp = open(self.file_path, 'wb')
+		elif self.fp is None:
+			return
+		elif index != self.frg_next:
+			self.abort()		#fragment missing, the sequence is incomplete
+			return
+		self.fp.write(data)
+		self.frg_next = index + 1
+		if last:
+			self.fp.close()
+			self.fp = None
+
+	def abort(self):
+		"""Remove a partially written sequence."""
+		if self.fp is not None:
+			self.fp.close()
+			self.fp = None
+			uos.remove(self.file_path)
@@ -0,0 +1,179 @@
+"""
+Compilation of sequences into GPIO patterns.
+
+The digital out channels are switched on a fixed time grid. For every step
+of the grid, each GPIO port gets the word written to its bit set/reset
+register (see `gpio`), 0 if no pin of the port changes. The words are
+played out by DMA transfers triggered by a timer, so no pulse is timed by
+the CPU. Long sequences are compiled in segments of a fixed number of
+steps: while one segment is played, the next one is filled. The steps
+before the first edge do not change any pin, so the segments start at the
+step of the first edge.
+"""
+
+try:
+	from array import array
+except ImportError:
+	from uarray import array
+
+try:
+	from cosplay import gpio
+	from cosplay.scheduler import EdgeScheduler, RISING
+except ImportError:
+	import gpio
+	from scheduler import EdgeScheduler, RISING
+
+class PatternCompiler(object):
+	"""
+	Compile the edges of a sequence into segments of register words.
+
+	Parameters
+	----------
+	onset, period, num_pulses, pulse_width : list
+	    Parameters of each event in ticks.
+	channels : list
+	    List of digital out channels of each event.
+	on_values : dict
+	    Value of the pin of each channel while a pulse is active.
+	resolution : int
+	    Time between two steps of the grid in ticks.
+	segment_size : int, optional
+	    Number of steps of a segment. Default is 512.
+	"""
+
+	def __init__(self, onset, period, num_pulses, pulse_width, channels, on_values, resolution, segment_size=512):
+		if resolution < 1:
+			raise ValueError('Invalid resolution {0}.'.format(resolution))
+		self.edges = EdgeScheduler(onset, period, num_pulses, pulse_width)
+		self.resolution = resolution
+		self.segment_size = segment_size
+		ports = []
+		for event_channels in channels:
+			for channel in event_channels:
+				if channel not in gpio.CHANNELS:
+					raise ValueError('Out channel {0} cannot be played as GPIO pattern.'.format(channel))
+				if gpio.CHANNELS[channel][0] not in ports:
+					ports.append(gpio.CHANNELS[channel][0])
+		ports.sort()
+		self.ports = ports
+		self.addresses = [gpio.GPIO_BASE[port] + gpio.BSRR for port in ports]
+		self.on_words = []		#words of each port for the rising edges of each event
+		self.off_words = []
+		for event_channels in channels:
+			on = dict([(address, word) for address, word in gpio.words(event_channels, on_values, True)])
+			off = dict([(address, word) for address, word in gpio.words(event_channels, on_values, False)])
+			self.on_words.append([on.get(address, 0) for address in self.addresses])
+			self.off_words.append([off.get(address, 0) for address in self.addresses])
+		self.num_steps = 0
+		self.first_step = None		#step of the first edge, where the first segment starts
+		self.max_error = 0		#largest difference between an edge and its step in ticks
+		while self.edges.peek() >= 0:
+			step, error = self.step(self.edges.time)
+			if self.first_step is None:
+				self.first_step = step
+			self.num_steps = step + 1
+			self.max_error = max(self.max_error, abs(error))
+			self.edges.advance()
+		if self.first_step is None:
+			self.first_step = 0
+		self.num_segments = (self.num_steps - self.first_step + segment_size - 1) // segment_size
+		self.reset()
+
+	def step(self, time):
+		"""Return the step of the grid closest to `time` and the
+		   difference between them in ticks."""
+		step = (time + self.resolution // 2) // self.resolution
+		return step, step * self.resolution - time
+
+	def reset(self):
+		"""Start again with the first segment."""
+		self.edges.reset()
+		self.segment = 0
+
+	def segment_buffer(self):
+		"""Return an empty `Segment` for the ports of the sequence."""
+		return Segment(len(self.ports), self.segment_size)
+
+	def fill(self, segment):
+		"""
+		Fill `segment` with the next segment of the sequence.
+
+		If edges of different events switch the same pin at the same step,
+		the later edge determines the state of the pin.
+
+		Parameters
+		----------
+		segment : `Segment`
+		    Segment as returned by `segment_buffer`.
+
+		Returns
+		-------
+		int
+		    Number of steps of the segment that belong to the sequence,
+		    0 if all segments were filled.
+		"""
+		segment.clear()
+		if self.segment >= self.num_segments:
+			return 0
+		first = self.first_step + self.segment * self.segment_size
+		last = min(first + self.segment_size, self.num_steps)
+		words = segment.words
+		num_ports = len(words)
+		edges = self.edges
+		while edges.peek() >= 0:
+			step = (edges.time + self.resolution // 2) // self.resolution
+			if step >= last:
+				break
+			if edges.edge == RISING:
+				event_words = self.on_words[edges.event]
+			else:
+				event_words = self.off_words[edges.event]
+			index = step - first
+			segment.touch(index)
+			for k in range(num_ports):
+				word = event_words[k]
+				if word != 0:
+					pins = (word | (word >> 16)) & 0xffff
+					words[k][index] = (words[k][index] & ~(pins | (pins << 16))) | word
+			edges.advance()
+		self.segment += 1
+		segment.length = last - first
+		return segment.length
+
+class Segment(object):
+	"""
+	Register words of each port for the steps of one segment.
+
+	All words fit into small integers, because only pins 0 to 13 are used,
+	so filling a segment does not allocate memory on the pyboard.
+
+	Parameters
+	----------
+	num_ports : int
+	    Number of GPIO ports.
+	size : int
+	    Number of steps.
+	"""
+
+	def __init__(self, num_ports, size):
+		self.words = [array('I', [0] * size) for k in range(num_ports)]
+		self.steps = array('H', [0] * size)		#steps with words that are not 0
+		self.count = 0
+		self.length = 0		#number of steps that belong to the sequence
+
+	def touch(self, index):
+		"""Remember that words are written at step `index`."""
+		for buf in self.words:
+			if buf[index] != 0:
+				return
+		self.steps[self.count] = index
+		self.count += 1
+
+	def clear(self):
+		"""Set all words to 0."""
+		for k in range(self.count):
+			index = self.steps[k]
+			for buf in self.words:
+				buf[index] = 0
+		self.count = 0
+		self.length = 0
@@ -5,21 +5,60 @@ This file is based on Dave Hylands json-ipc/json_pkt.py
 
 try:
 	#imports for pyboard
-	from utime import sleep
+	from utime import sleep, ticks_ms, ticks_diff, ticks_add
 	import tsv
+	import bseq
+	import telemetry
 	from dump_mem import dump_mem
 except ImportError:
 	#imports on host computer
 	from time import sleep
+	try:
+		from time import monotonic as time		#not affected by changes of the system clock
+	except ImportError:
+		from time import time
+	def ticks_ms():
+		return int(time() * 1000)
+	def ticks_diff(new, old):
+		return new - old
+	def ticks_add(ticks, delta):
+		return ticks + delta
 	try:
 		#if COSplay is installed as package
 		from cosplay import tsv
+		from cosplay import bseq
+		from cosplay import telemetry
 		from cosplay.dump_mem import dump_mem
 	except ImportError:
 		#if cli.py is executed directly
 		import tsv
+		import bseq
+		import telemetry
 		from dump_mem import dump_mem
 
+try:
+	import ustruct as struct
+except ImportError:
+	import struct
+
+try:
+	from binascii import crc_hqx
+except ImportError:
+	crc_hqx = None		#MicroPython uses the table in crc16
+
+try:
+	from array import array
+except ImportError:
+	from uarray import array
+
+try:
+	import zlib
+except ImportError:
+	try:
+		import uzlib as zlib	#older MicroPython versions
+	except ImportError:
+		zlib = None
+
 
 SOH = 0x01			#start of header
 STX = 0x02			#start of text
@@ -28,30 +67,152 @@ EOT = 0x04			#end of transmission
 SEQ = 0x05			#type of data is a sequence (json)
 MSG = 0x06			#type of data is message for user from pyboard
 INS = 0x07			#instruction form pyboard to server 
+CAP = 0x08			#capabilities of the sender (bit field), ignored by older versions
+BSQ = 0x09			#type of data is a sequence (packed binary columns, see bseq)
+ZLB = 0x0a			#type of data is a zlib compressed stream of frames
+FRG = 0x0b			#fragment of a payload that is sent in several frames
+ACK = 0x0c			#all frames before the sequence number in the payload were received
+TLM = 0x0d			#type of data is timing telemetry (binary records, see telemetry)
+NAK = 0x15			#a received frame was corrupted, the payload is the sequence number of the next expected frame
 # <SOH><LenLow><LenHigh><TYPE><STX><PAYLOAD><ETX><LRC><EOT>
+# <SOH><LenLow><LenHigh><TYPE|CRC_FLAG><STX><PAYLOAD><ETX><CRCLow><CRCHigh><EOT>
+
+HDR_LEN = 5			#number of bytes before the payload
+FTR_LEN = 3			#number of bytes after the payload
+CRC_FTR_LEN = 4			#number of bytes after the payload of a frame with CRC
+CRC_FLAG = 0x80			#set in the type of frames with a CRC instead of a LRC
+SEQ_FLAG = 0x40			#set in the type of frames whose payload starts with a sequence number
+MAX_WINDOW = 0x7f		#sequence numbers less than half the number space ahead are new frames, others duplicates
+
+CAP_BSQ = 0x01			#sequences can be received as BSQ packets
+CAP_ZLB = 0x02			#compressed ZLB packets can be received
+CAP_FRG = 0x04			#fragmented payloads can be received
+CAP_CRC = 0x08			#frames with CRC can be received, corrupted frames are answered with NAK in the reliable mode
+CAP_ARQ = 0x10			#frames with sequence numbers are acknowledged
+CAP_TLM = 0x20			#timing telemetry can be received as TLM packets
+CAPABILITIES = CAP_BSQ | CAP_FRG | CAP_CRC | CAP_ARQ | CAP_TLM	#capabilities implemented by this module
+if zlib is not None:
+	CAPABILITIES |= CAP_ZLB
+
+ZLB_WBITS = 10			#window size of compressed streams (1 KiB) to save memory on the pyboard
+ZLB_BATCH = 8192		#maximum number of uncompressed bytes in one ZLB packet
+
+MAX_PAYLOAD = 0xffff		#largest payload the length field can describe
+FRG_HDR = '<BHB'		#type of the payload, index of the fragment, last fragment flag
+FRG_HDR_LEN = struct.calcsize(FRG_HDR)
+FRG_SIZE = 4096			#payload bytes per fragment
+RX_SIZE = 4096			#initial size of the receive buffer, which grows for larger frames
+
+try:
+	bytearray().find
+	Buffer = bytearray
+except AttributeError:
+	#MicroPython's bytearray has no find method
+	Buffer = bytes
+
+def find_soh(buf, start, end):
+	"""
+	Return the index of the first start of header in `buf` between
+	`start` and `end` or -1.
+	"""
+	if Buffer is bytes and type(buf) is bytearray:
+		for i in range(start, end):		#MicroPython's bytearray has no find method
+			if buf[i] == SOH:
+				return i
+		return -1
+	return buf.find(b'\x01', start, end)
 
 def lrc(str):
-	sum = 0
+	"""
+	Return longitudinal redundancy checksum.
+	"""
 	try:
-		for b in str:
-			sum = (sum + b) & 0xff
-		return ((sum ^ 0xff) + 1) & 0xff
+		sum_ = sum(str)
 	except TypeError:
-		for b in str:
-			sum = (sum + ord(b)) & 0xff
-		return ((sum ^ 0xff) + 1) & 0xff
+		sum_ = sum(bytearray(str))
+	return (((sum_ & 0xff) ^ 0xff) + 1) & 0xff
 
-class Packet:
+def crc16_table():
+	"""
+	Return lookup table of the CRC-16/CCITT polynomial 0x1021.
+	"""
+	table = array('H', [0] * 256)
+	for i in range(256):
+		crc = i << 8
+		for _ in range(8):
+			if crc & 0x8000:
+				crc = ((crc << 1) ^ 0x1021) & 0xffff
+			else:
+				crc = (crc << 1) & 0xffff
+		table[i] = crc
+	return table
+
+CRC16_TABLE = crc16_table()
+
+def crc16(data, crc=0xffff):
+	"""
+	Return CRC-16/CCITT-FALSE checksum of `data`.
+
+	On CPython the checksum is calculated by `binascii.crc_hqx`,
+	otherwise by looking up one table entry per byte.
+
+	Parameters
+	----------
+	data : bytes / bytearray / memoryview
+	    Input data.
+	crc : int, optional
+	    Initial value. Default is 0xffff.
+
+	Returns
+	-------
+	int
+	    Checksum.
+	"""
+	if crc_hqx is not None:
+		return crc_hqx(data, crc)
+	table = CRC16_TABLE
+	for b in data:
+		crc = ((crc << 8) & 0xff00) ^ table[(crc >> 8) ^ b]
+	return crc
 
-	STATE_SOH = 0
-	STATE_LEN_0 = 1
-	STATE_LEN_1 = 2
-	STATE_TYPE = 3
-	STATE_STX = 4
-	STATE_PAYLOAD = 5
-	STATE_ETX = 6
-	STATE_LRC = 7
-	STATE_EOT = 8
+def to_bytes(payload):
+	"""
+	Return bytes object of `payload`.
+
+	Parameters
+	----------
+	payload : bytes / bytearray / memoryview
+	    Received payload.
+
+	Returns
+	-------
+	bytes
+	"""
+	try:
+		return payload.tobytes()
+	except AttributeError:
+		return bytes(payload)
+
+def to_str(payload):
+	"""
+	Return ascii string of `payload`.
+
+	Parameters
+	----------
+	payload : bytes / bytearray / memoryview
+	    Received payload.
+
+	Returns
+	-------
+	string
+	"""
+	payload = to_bytes(payload)
+	try:				# MicroPython does not have decode attribute for bytearrays
+		return payload.decode('ascii')
+	except AttributeError:
+		return str(payload,'ascii')
+
+class Packet:
 
 	ANS_no = 0				#answers form server to instructions/questions form pyboard
 	ANS_yes = 1
@@ -59,146 +220,837 @@ class Packet:
 	INS_ask_user = 3			#ask user whether to use sequences stored on microcontroller or host computer
 	INS_send_sequences = 4			#send sequences to microcontroller
 
-	def __init__(self, serial_port, show_packets=False):
+	def __init__(self, serial_port, show_packets=False, window=0, rto=200, inter_byte_timeout=1000, ack_timeout=10000):
+		"""
+		Parameters
+		----------
+		serial_port : object
+		    Port providing `write` and `read_available`.
+		show_packets : bool, optional
+		    Dump all frames that are sent and received.
+		window : int, optional
+		    Number of frames (at most `MAX_WINDOW`) that are sent without
+		    being acknowledged in the reliable mode. The reliable mode is only
+		    used if `window` is larger than 0 and the other side announced
+		    CAP_ARQ. Default is 0.
+		rto : int, optional
+		    Time in ms after which unacknowledged frames are sent again.
+		    Default is 200.
+		inter_byte_timeout : int, optional
+		    Time in ms `receive` waits for the rest of a frame that was
+		    received partially. Default is 1000.
+		ack_timeout : int, optional
+		    Time in ms the reliable mode waits for acknowledgments while
+		    the window is full. Afterwards the unacknowledged frames are
+		    given up, so a peer that disappeared does not block the
+		    sender forever. Default is 10000.
+
+		Raises
+		------
+		ValueError
+		    If `window` is not between 0 and `MAX_WINDOW`.
+		"""
+		if window < 0 or window > MAX_WINDOW:
+			raise ValueError('Window of {0} frames is not between 0 and {1}.'.format(window, MAX_WINDOW))
 		self.serial_port = serial_port
 		self.show_packets = show_packets
-		self.pkt_len = 0
-		self.pkt_type = None
-		self.pkt_idx = 0
-		self.pkt = None
-		self.lrc = 0
-		self.state = Packet.STATE_SOH
+		self.window = window
+		self.rto = rto
+		self.inter_byte_timeout = inter_byte_timeout
+		self.ack_timeout = ack_timeout
+		self.tx_seq = 0			#sequence number of the next frame
+		self.tx_base = 0		#sequence number of the oldest unacknowledged frame
+		self.tx_time = 0		#time the oldest unacknowledged frame was sent
+		self.unacked = []		#frames that were sent but not acknowledged yet
+		self.rx_expected = None		#sequence number of the next frame, None until the first frame arrives
+		self.ack_pending = False
+		self.nak_seq = None		#sequence number the last NAK was sent for
+		self.rx_buf = bytearray(RX_SIZE)	#received bytes, those between rx_start and rx_end are not decoded yet
+		self.rx_start = 0
+		self.rx_end = 0
+		self.rx_objs = []		#decoded objects that have not been returned yet
+		self.tx_buf = bytearray()	#reused buffer for outgoing frames
+		self.peer_capabilities = 0	#capabilities announced by the other side
+		self.capabilities_sent = False
+		self.fragment_handler = None	#function called with fragments of sequences instead of reassembling them
+		self.ack_handler = None		#function called after frames were acknowledged
+		self.frg_type = None		#type of the payload that is currently reassembled
+		self.frg_next = 0		#index of the next expected fragment
+		self.frg_buf = None
+		self.zlb_next = 0		#index of the next expected fragment of a compressed batch
+		self.zlb_buf = None
 
-	def send(self, obj):
-		"""Convert a Python object into its string representation and then send
-    	    	   it using the 'serial_port' passed in the constructor.
+	def pack(self, obj):
+		"""Convert a Python object into the type and payload of a frame.
 
 		   Parameters
 		   ----------
 		   obj : list, string or int
-		       object that is send via 'serial_port'
-    	    	"""
+		       Object that is converted.
+
+		   Returns
+		   -------
+		   pkt_type : int
+		       Type of the frame.
+		   payload : bytes
+		       Payload of the frame.
+		"""
 		data_type = type(obj)
-		payload_str = None
-		payload_len = None
-		payload_lrc = None
 		if data_type is list:
-			payload_str = tsv.dumps(obj).encode('ascii')
-			payload_len = len(payload_str)
-			payload_lrc = lrc(payload_str)			#longitudinal redundancy check
-			hdr = bytearray((SOH, payload_len & 0xff, payload_len >> 8, SEQ, STX)) #header & 0xff masks the lower eight bits(FF is 255) >>8 means shift to the right by 8 bits 
+			if self.peer_capabilities & CAP_BSQ:
+				try:
+					return BSQ, bseq.dumps(obj)
+				except ValueError:
+					pass		#sequences with additional columns are sent as tsv
+			return SEQ, tsv.dumps(obj).encode('ascii')
 		elif data_type is str:
-			payload_str = obj.encode('ascii')
-			payload_len = len(payload_str)
-			payload_lrc = lrc(payload_str)
-			hdr = bytearray((SOH, payload_len & 0xff, payload_len >> 8, MSG, STX))
+			return MSG, obj.encode('ascii')
 		elif data_type is int:
-			payload_str = str(obj).encode('ascii')
-			payload_len = len(payload_str)
-			payload_lrc = lrc(payload_str)
-			hdr = bytearray((SOH, payload_len & 0xff, payload_len >> 8, INS, STX))
+			return INS, str(obj).encode('ascii')
+		raise TypeError("Type cannot be send using Packet.")
+
+	def frame(self, objs):
+		"""Write the frames of all objects in `objs` into the transmit buffer.
+
+		   The transmit buffer is reused for consecutive calls and only
+		   grows if the frames do not fit.
+
+		   Parameters
+		   ----------
+		   objs : list
+		       Objects that are framed.
+
+		   Returns
+		   -------
+		   memoryview
+		       View of the transmit buffer containing the frames.
+		"""
+		return self.frame_payloads(self.payloads(objs))
+
+	def payloads(self, objs):
+		"""Return (type, payload) tuples of the frames of `objs`.
+
+		   Parameters
+		   ----------
+		   objs : list
+		       Objects that are converted.
+
+		   Returns
+		   -------
+		   list
+		       List of (type, payload) tuples, large payloads are
+		       split into fragments.
+		"""
+		payloads = []
+		for obj in objs:
+			pkt_type, payload = self.pack(obj)
+			payloads.extend(self.fragment(pkt_type, payload))
+		return payloads
+
+	def fragment(self, pkt_type, payload):
+		"""Split a payload into FRG payloads.
+
+		   Payloads larger than `FRG_SIZE` are split if the other side
+		   announced CAP_FRG. The receiver can process the fragments one
+		   after another, so payloads of any size can be transferred.
+
+		   Parameters
+		   ----------
+		   pkt_type : int
+		       Type of the payload.
+		   payload : bytes
+		       Payload that is split.
+
+		   Returns
+		   -------
+		   list
+		       List of (type, payload) tuples.
+
+		   Raises
+		   ------
+		   ValueError
+		       If the payload is too large for one frame and the
+		       other side cannot receive fragments.
+		"""
+		payload_len = len(payload)
+		if payload_len <= FRG_SIZE or not self.peer_capabilities & CAP_FRG:
+			if payload_len > MAX_PAYLOAD:
+				raise ValueError('Payload of {0} bytes exceeds the maximum of {1} bytes.'.format(payload_len, MAX_PAYLOAD))
+			return [(pkt_type, payload)]
+		mv = memoryview(payload)
+		fragments = []
+		index = 0
+		for start in range(0, payload_len, FRG_SIZE):
+			last = start + FRG_SIZE >= payload_len
+			hdr = struct.pack(FRG_HDR, pkt_type, index, last)
+			fragments.append((FRG, hdr + to_bytes(mv[start:start + FRG_SIZE])))
+			index += 1
+		return fragments
+
+	def frame_payloads(self, payloads, crc=None):
+		"""Write frames of (type, payload) tuples into the transmit buffer.
+
+		   Parameters
+		   ----------
+		   payloads : list
+		       List of tuples containing type and payload of a frame.
+		   crc : bool, optional
+		       If True, frames end with a CRC-16 covering header and
+		       payload, otherwise with a LRC of the payload. Default is
+		       to use a CRC if the other side announced CAP_CRC.
+
+		   Returns
+		   -------
+		   memoryview
+		       View of the transmit buffer containing the frames.
+		"""
+		if crc is None:
+			crc = bool(self.peer_capabilities & CAP_CRC)
+		if crc:
+			ftr_len = CRC_FTR_LEN
 		else:
-			raise TypeError("Type cannot be send using Packet.")
-		ftr = bytearray((ETX, payload_lrc, EOT))	#footer
+			ftr_len = FTR_LEN
+		size = self.frames_size(payloads, crc)
+		if len(self.tx_buf) < size:
+			self.tx_buf = bytearray(size)
+		buf = self.tx_buf
+		mv = memoryview(buf)
+		idx = 0
+		for pkt_type, payload in payloads:
+			payload_len = len(payload)
+			buf[idx] = SOH
+			buf[idx + 1] = payload_len & 0xff		#& 0xff masks the lower eight bits(FF is 255)
+			buf[idx + 2] = payload_len >> 8			#>>8 means shift to the right by 8 bits
+			buf[idx + 3] = pkt_type
+			buf[idx + 4] = STX
+			idx += HDR_LEN
+			mv[idx:idx + payload_len] = payload
+			idx += payload_len
+			buf[idx] = ETX
+			if crc:
+				buf[idx - payload_len - 2] = pkt_type | CRC_FLAG
+				checksum = crc16(mv[idx - payload_len - HDR_LEN + 1:idx])	#length, type, STX and payload
+				buf[idx + 1] = checksum & 0xff
+				buf[idx + 2] = checksum >> 8
+				buf[idx + 3] = EOT
+			else:
+				buf[idx + 1] = lrc(payload)			#longitudinal redundancy check
+				buf[idx + 2] = EOT
+			idx += ftr_len
+		return mv[:idx]
+
+	def frames_size(self, payloads, crc=None):
+		"""Return the number of bytes of the frames of (type, payload)
+		   tuples without framing them (see `frame_payloads`)."""
+		if crc is None:
+			crc = bool(self.peer_capabilities & CAP_CRC)
+		if crc:
+			ftr_len = CRC_FTR_LEN
+		else:
+			ftr_len = FTR_LEN
+		size = 0
+		for pkt_type, payload in payloads:
+			size += HDR_LEN + len(payload) + ftr_len
+		return size
+
+	def send_capabilities(self):
+		"""Announce the capabilities of this side to the other side.
+
+		   Versions that do not know the CAP type ignore the packet,
+		   so optional features are only used if both sides
+		   announced them.
+		"""
+		self.capabilities_sent = True
+		payload = str(CAPABILITIES).encode('ascii')
+		data = self.frame_payloads([(CAP, payload)], crc=False)
 		if self.show_packets:
-			data = hdr + payload_str + ftr
 			dump_mem(data, 'Send')
-		self.serial_port.write(hdr)
-		self.serial_port.write(payload_str)
-		self.serial_port.write(ftr)
+		self.serial_port.write(data)
 
+	def send_nak(self):
+		"""Request the retransmission of a corrupted or lost frame.
 
-	def process_byte(self, byte):
-		"""Process a single byte. Return a object when one is
-    	    	   successfully parsed, otherwise returns None.
+		   The NAK carries the sequence number of the next expected
+		   frame, so the other side goes back to this frame and sends
+		   all following frames again in order. Without sequence
+		   numbers nothing is sent, because the frames after a corrupted
+		   frame were already delivered and a resent frame would arrive
+		   out of order.
+		"""
+		if not self.peer_capabilities & CAP_ARQ or self.rx_expected is None:
+			return
+		if self.nak_seq == self.rx_expected:
+			return			#the frames are already requested
+		self.nak_seq = self.rx_expected
+		data = self.frame_payloads([(NAK, bytearray((self.rx_expected,)))], crc=True)
+		if self.show_packets:
+			dump_mem(data, 'Send')
+		self.serial_port.write(data)
+
+	def send(self, obj):
+		"""Convert a Python object into its string representation and then send
+    	    	   it using the 'serial_port' passed in the constructor.
+
+		   The complete frame is written with a single call.
 
 		   Parameters
 		   ----------
-		   byte : bytes object / bytearray
-		       Input byte. For MicroPython and Python 3 this
-		       should be a bytes object. In Python 2 a bytearray
-		       should be used.
+		   obj : list, string or int
+		       object that is send via 'serial_port'
+    	    	"""
+		self.send_many([obj])
+
+	def compress(self, payloads):
+		"""Return the frames of (type, payload) tuples compressed as
+		   ZLB payloads.
+
+		   The frames are compressed in batches of at most `ZLB_BATCH`
+		   bytes, so the receiver never has to hold a large decompressed
+		   stream in memory. Large objects are already split into
+		   fragments by `payloads`, so their frames are spread over
+		   several batches. Compressed batches larger than `FRG_SIZE`
+		   are sent as fragments themselves.
+
+		   Parameters
+		   ----------
+		   payloads : list
+		       (type, payload) tuples as returned by `payloads`, which
+		       are framed and compressed.
 
 		   Returns
 		   -------
-		   out : 2d array / string / int
-		       Returns object if package is successfully parsed,
-		       otherwise returns None.
-    	    	"""
+		   list
+		       List of (type, payload) tuples of the ZLB frames.
+
+		   Raises
+		   ------
+		   ValueError
+		       If a compressed batch is too large for one frame and the
+		       other side cannot receive fragments.
+		"""
+		compressed = []
+		batch = []
+		batch_len = 0
+		for payload in payloads:
+			frame = to_bytes(self.frame_payloads([payload]))
+			if batch_len + len(frame) > ZLB_BATCH and len(batch) > 0:
+				compressed.extend(self.fragment(ZLB, self.deflate(b''.join(batch))))
+				batch = []
+				batch_len = 0
+			batch.append(frame)
+			batch_len += len(frame)
+		if len(batch) > 0:
+			compressed.extend(self.fragment(ZLB, self.deflate(b''.join(batch))))
+		return compressed
+
+	def deflate(self, data):
+		"""Return `data` compressed as zlib stream with a window of
+		   `ZLB_WBITS` bits."""
+		compressor = zlib.compressobj(9, zlib.DEFLATED, ZLB_WBITS)
+		return compressor.compress(data) + compressor.flush()
+
+	def send_many(self, objs, compress=False):
+		"""Send several objects with a single write to 'serial_port'.
+
+		   Parameters
+		   ----------
+		   objs : list
+		       List of objects (list, string or int) that are send.
+		   compress : bool, optional
+		       If True and the other side announced CAP_ZLB, the
+		       frames are sent as compressed ZLB packets.
+		       Default is False.
+
+		   Returns
+		   -------
+		   int
+		       Number of bytes written.
+		"""
+		return self.send_payloads(self.prepare(objs, compress))
+
+	def prepare(self, objs, compress=False):
+		"""Return the (type, payload) tuples `send_many` sends for `objs`."""
+		return self.prepare_payloads(self.payloads(objs), compress)
+
+	def prepare_payloads(self, payloads, compress=False):
+		"""Return the (type, payload) tuples that are sent for the
+		   `payloads` of objects, compressed if `compress` is True and
+		   the other side announced CAP_ZLB."""
+		if compress and self.peer_capabilities & CAP_ZLB:
+			return self.compress(payloads)
+		return payloads
+
+	def send_telemetry(self, batch):
+		"""Send the records of a `telemetry.Batch` or `telemetry.Summary`
+		   as TLM packet.
+
+		   Only use this function if the other side announced CAP_TLM.
+
+		   Returns
+		   -------
+		   int
+		       Number of bytes written.
+		"""
+		return self.send_payloads([(TLM, batch.payload())])
+
+	def send_payloads(self, payloads):
+		"""Frame (type, payload) tuples and send them with a single write.
+
+		   Returns
+		   -------
+		   int
+		       Number of bytes written.
+		"""
+		if self.is_reliable():
+			return self.send_reliable(payloads)
+		data = self.frame_payloads(payloads)
 		if self.show_packets:
-			if byte >= ord(' ') and byte <= ord('~'):
-				print('Rcvd 0x%02x \'%c\'' % (byte, byte))
-			else:
-				print('Rcvd 0x%02x' % byte)
-		if self.state == Packet.STATE_SOH:
-			if byte == SOH:
-				self.state = Packet.STATE_LEN_0
-		elif self.state == Packet.STATE_LEN_0:
-			self.pkt_len = byte
-			self.state = Packet.STATE_LEN_1
-		elif self.state == Packet.STATE_LEN_1:
-			self.pkt_len += (byte << 8)
-			self.state = Packet.STATE_TYPE
-		elif self.state == Packet.STATE_TYPE:
-			self.pkt_type = byte
-			self.state = Packet.STATE_STX
-		elif self.state == Packet.STATE_STX:
-			if byte == STX:
-				self.state = Packet.STATE_PAYLOAD
-				self.pkt_idx = 0
-				self.pkt = bytearray(self.pkt_len)
-				self.lrc = 0
-			else:
-				self.state = Packet.STATE_SOH
-		elif self.state == Packet.STATE_PAYLOAD:
-			self.pkt[self.pkt_idx] = byte
-			self.lrc = (self.lrc + byte) & 0xff
-			self.pkt_idx += 1
-			if self.pkt_idx >= self.pkt_len:
-				self.state = Packet.STATE_ETX
-		elif self.state == Packet.STATE_ETX:
-			if byte == ETX:
-				self.state = Packet.STATE_LRC
+			dump_mem(data, 'Send')
+		self.serial_port.write(data)
+		return len(data)
+
+	def is_reliable(self):
+		"""Return True if frames are sent with sequence numbers."""
+		return self.window > 0 and bool(self.peer_capabilities & CAP_ARQ)
+
+	def send_reliable(self, payloads):
+		"""Send payloads as frames with sequence numbers.
+
+		   At most `window` frames are in flight. Frames are written in
+		   batches that fill the window and the function only waits for
+		   acknowledgments if the window is full, so the connection
+		   stays busy. Lost or corrupted frames are sent again after a
+		   NAK or if no acknowledgment arrives within `rto` ms. If the
+		   window stays full for `ack_timeout` ms, the unacknowledged
+		   frames are given up.
+
+		   Parameters
+		   ----------
+		   payloads : list
+		       List of (type, payload) tuples.
+
+		   Returns
+		   -------
+		   int
+		       Number of bytes written.
+		"""
+		num_bytes = 0
+		idx = 0
+		while idx < len(payloads):
+			if not self.wait(self.window - 1, self.ack_timeout):
+				self.give_up()
+			batch = []
+			while idx < len(payloads) and len(self.unacked) < self.window:
+				pkt_type, payload = payloads[idx]
+				payload = bytearray((self.tx_seq,)) + payload
+				frame = to_bytes(self.frame_payloads([(pkt_type | SEQ_FLAG, payload)], crc=True))
+				if len(self.unacked) == 0:
+					self.tx_time = ticks_ms()
+				self.unacked.append(frame)
+				self.tx_seq = (self.tx_seq + 1) & 0xff
+				batch.append(frame)
+				idx += 1
+			data = b''.join(batch)
+			if self.show_packets:
+				dump_mem(data, 'Send')
+			self.serial_port.write(data)
+			num_bytes += len(data)
+		return num_bytes
+
+	def ack(self, seq):
+		"""Remove all frames before sequence number `seq` from the
+		   unacknowledged frames."""
+		count = (seq - self.tx_base) & 0xff
+		if 0 < count <= len(self.unacked):
+			self.unacked = self.unacked[count:]
+			self.tx_base = seq
+			self.tx_time = ticks_ms()
+			if self.ack_handler is not None:
+				self.ack_handler()
+
+	def give_up(self):
+		"""Forget all unacknowledged frames."""
+		self.unacked = []
+		self.tx_base = self.tx_seq
+
+	def go_back(self, seq):
+		"""Send all unacknowledged frames starting at sequence number `seq`
+		   again."""
+		self.ack(seq)
+		if len(self.unacked) > 0:
+			data = b''.join(self.unacked)
+			if self.show_packets:
+				dump_mem(data, 'Resend')
+			self.serial_port.write(data)
+			self.tx_time = ticks_ms()
+
+	def retransmission_due(self):
+		"""Return the time in ms until unacknowledged frames are sent
+		   again or None if all frames are acknowledged."""
+		if len(self.unacked) == 0:
+			return None
+		return max(0, self.rto - ticks_diff(ticks_ms(), self.tx_time))
+
+	def wait_readable(self, time_out=None):
+		"""Block until bytes are available on the serial port.
+
+		   Ports without `wait_readable` are polled every millisecond.
+
+		   Parameters
+		   ----------
+		   time_out : int, optional
+		       Maximal time in ms to wait. None waits until bytes are
+		       available.
+		"""
+		due = self.retransmission_due()
+		if due is not None and (time_out is None or due < time_out):
+			time_out = due
+		if hasattr(self.serial_port, 'wait_readable'):
+			self.serial_port.wait_readable(time_out)
+		else:
+			sleep(0.001)
+
+	def check_retransmission(self):
+		"""Send unacknowledged frames again if they time out."""
+		if len(self.unacked) > 0 and ticks_diff(ticks_ms(), self.tx_time) > self.rto:
+			self.go_back(self.tx_base)
+
+	def send_ack(self):
+		"""Acknowledge all frames before the next expected sequence number."""
+		self.ack_pending = False
+		data = self.frame_payloads([(ACK, bytearray((self.rx_expected,)))], crc=True)
+		if self.show_packets:
+			dump_mem(data, 'Send')
+		self.serial_port.write(data)
+
+	def poll(self):
+		"""Decode all bytes available on the serial port without waiting.
+
+		   Returns
+		   -------
+		   bool
+		       True if bytes were available.
+		"""
+		data = self.serial_port.read_available()
+		if len(data) > 0:
+			self.rx_objs.extend(self.decode(data))
+			return True
+		return False
+
+	def wait(self, num_frames, time_out=0):
+		"""Wait until at most `num_frames` frames are unacknowledged.
+
+		   Received objects are kept for `receive`.
+
+		   Parameters
+		   ----------
+		   num_frames : int
+		       Number of frames that may remain unacknowledged.
+		   time_out : int, optional
+		       Time in ms until return. If time_out = 0, the function never
+		       times out.
+
+		   Returns
+		   -------
+		   bool
+		       True if the frames were acknowledged, False in case of
+		       time out.
+		"""
+		deadline = ticks_add(ticks_ms(), time_out)
+		while len(self.unacked) > num_frames:
+			remaining = None
+			if time_out > 0:
+				remaining = ticks_diff(deadline, ticks_ms())
+				if remaining <= 0:
+					return False
+			if not self.poll():
+				self.check_retransmission()
+				self.wait_readable(remaining)
+		return True
+
+	def flush(self, time_out=0):
+		"""Wait until all frames sent in the reliable mode are acknowledged.
+
+		   Parameters
+		   ----------
+		   time_out : int, optional
+		       Time in ms until return. If time_out = 0, the function never
+		       times out.
+
+		   Returns
+		   -------
+		   bool
+		       True if all frames were acknowledged, False in case of
+		       time out.
+		"""
+		return self.wait(0, time_out)
+
+	def unpack(self, pkt_type, payload):
+		"""Convert the payload of a frame into a Python object.
+
+		   Parameters
+		   ----------
+		   pkt_type : int
+		       Type of the frame.
+		   payload : memoryview
+		       Payload of the frame.
+
+		   Returns
+		   -------
+		   out : 2d array / string / int / dict
+		       Returns object or None if the type is unknown. Telemetry
+		       is returned as dict of arrays (see `telemetry.loads`).
+		"""
+		if pkt_type == SEQ:
+			return tsv.loads(to_str(payload))
+		elif pkt_type == BSQ:
+			return bseq.loads(payload)
+		elif pkt_type == CAP:
+			self.peer_capabilities = int(to_str(payload))
+			self.rx_expected = None		#the other side started a new session
+			if not self.capabilities_sent:
+				self.send_capabilities()
+			return None
+		elif pkt_type == MSG:
+			return to_str(payload)
+		elif pkt_type == INS:
+			return int(to_str(payload))
+		elif pkt_type == FRG:
+			return self.unpack_fragment(payload)
+		elif pkt_type == TLM:
+			return telemetry.loads(payload)
+		return None
+
+	def unpack_fragment(self, payload):
+		"""Process the payload of a FRG frame.
+
+		   Fragments of sequences are passed to `fragment_handler` if
+		   it is set, e.g. to write them directly to a file. It is called
+		   as fragment_handler(pkt_type, index, data, last) and has to
+		   check that the index of the fragments is contiguous.
+		   Otherwise the fragments are reassembled and the object is
+		   returned after the last fragment is received. A transfer with
+		   a missing fragment is dropped.
+
+		   Parameters
+		   ----------
+		   payload : memoryview
+		       Payload of the FRG frame.
+
+		   Returns
+		   -------
+		   out : object
+		       Reassembled object or None.
+		"""
+		pkt_type, index, last = struct.unpack_from(FRG_HDR, payload, 0)
+		data = payload[FRG_HDR_LEN:]
+		if self.fragment_handler is not None and (pkt_type == SEQ or pkt_type == BSQ):
+			self.fragment_handler(pkt_type, index, data, last)
+			return None
+		if index == 0:
+			self.frg_type = pkt_type
+			self.frg_buf = bytearray()
+		elif index != self.frg_next or pkt_type != self.frg_type:
+			self.frg_buf = None		#fragment missing
+		if self.frg_buf is None:
+			return None
+		self.frg_buf.extend(data)
+		self.frg_next = index + 1
+		if last:
+			buf = self.frg_buf
+			self.frg_buf = None
+			return self.unpack(pkt_type, memoryview(buf))
+		return None
+
+	def unpack_compressed_fragment(self, payload, objs):
+		"""Reassemble a ZLB payload sent as FRG frames and decode its
+		   frames after the last fragment.
+
+		   The fragments of compressed batches are reassembled separately
+		   from the fragments of the objects inside the batches, which
+		   can span several batches. A batch with a missing fragment is
+		   dropped.
+		"""
+		pkt_type, index, last = struct.unpack_from(FRG_HDR, payload, 0)
+		if index == 0:
+			self.zlb_buf = bytearray()
+		elif index != self.zlb_next:
+			self.zlb_buf = None		#fragment missing
+		if self.zlb_buf is None:
+			return
+		self.zlb_buf.extend(payload[FRG_HDR_LEN:])
+		self.zlb_next = index + 1
+		if last:
+			buf = self.zlb_buf
+			self.zlb_buf = None
+			self.inflate(buf, objs)
+
+	def inflate(self, payload, objs):
+		"""Decompress a ZLB payload and append the objects of its frames
+		   to `objs`."""
+		self.scan(Buffer(zlib.decompress(to_bytes(payload), ZLB_WBITS)), objs)
+
+	def decode(self, data=b''):
+		"""Decode all complete frames in the buffered bytes and `data`.
+
+		   Frames are located with `find`, the payload is sliced out
+		   using a memoryview and the frame is checked at once. If a
+		   frame is corrupted, the decoder resynchronizes at the next
+		   start of header. Bytes of an incomplete frame are kept for
+		   the next call. They stay in place in the receive buffer, new
+		   bytes are appended behind them and the buffer is only
+		   compacted if they do not fit.
+
+		   Parameters
+		   ----------
+		   data : bytes object / bytearray
+		       Received bytes.
+
+		   Returns
+		   -------
+		   list
+		       Decoded objects. Empty if no frame was completed.
+		"""
+		data_len = len(data)
+		if data_len > 0:
+			if self.rx_end + data_len > len(self.rx_buf):
+				self.compact(data_len)
+			self.rx_buf[self.rx_end:self.rx_end + data_len] = data
+			self.rx_end += data_len
+		objs = []
+		self.rx_start = self.scan(self.rx_buf, objs, self.rx_start, self.rx_end)
+		if self.rx_start == self.rx_end:
+			self.rx_start = 0		#all bytes were consumed, the buffer is reused from the start
+			self.rx_end = 0
+		if self.ack_pending:
+			self.send_ack()			#one cumulative acknowledgment per chunk
+		return objs
+
+	def compact(self, data_len):
+		"""Move the bytes that are not decoded yet to the start of the
+		   receive buffer, so `data_len` more bytes fit. The buffer grows
+		   if this is not enough."""
+		pending = self.rx_end - self.rx_start
+		if pending + data_len > len(self.rx_buf):
+			buf = bytearray(max(2 * len(self.rx_buf), pending + data_len))
+			buf[:pending] = memoryview(self.rx_buf)[self.rx_start:self.rx_end]
+			self.rx_buf = buf
+		elif pending > 0:
+			self.rx_buf[:pending] = self.rx_buf[self.rx_start:self.rx_end]		#copy, the ranges can overlap
+		self.rx_start = 0
+		self.rx_end = pending
+
+	def scan(self, buf, objs, start=0, buf_len=None):
+		"""Append the objects of all complete frames in `buf` to `objs`.
+
+		   Parameters
+		   ----------
+		   buf : bytearray / bytes
+		       Buffer that is scanned for frames.
+		   objs : list
+		       List the decoded objects are appended to.
+		   start : int, optional
+		       Index of the first byte that is scanned. Default is 0.
+		   buf_len : int, optional
+		       Index after the last byte that is scanned. Default is the
+		       length of `buf`.
+
+		   Returns
+		   -------
+		   int
+		       Index of the first byte that was not consumed.
+		"""
+		if buf_len is None:
+			buf_len = len(buf)
+		mv = memoryview(buf)
+		while True:
+			start = find_soh(buf, start, buf_len)
+			if start < 0:
+				start = buf_len
+				break
+			if buf_len - start < HDR_LEN:
+				break
+			if buf[start + 4] != STX:
+				start += 1
+				continue
+			pkt_type = buf[start + 3]
+			if pkt_type & CRC_FLAG:
+				ftr_len = CRC_FTR_LEN
 			else:
-				self.state = Packet.STATE_SOH
-		elif self.state == Packet.STATE_LRC:
-			self.lrc = ((self.lrc ^ 0xff) + 1) & 0xff
-			if self.lrc == byte:
-				self.state = Packet.STATE_EOT
+				ftr_len = FTR_LEN
+			end = start + HDR_LEN + (buf[start + 1] | (buf[start + 2] << 8))
+			if buf_len < end + ftr_len:
+				break
+			payload = mv[start + HDR_LEN:end]
+			if buf[end] != ETX or buf[end + ftr_len - 1] != EOT:
+				start += 1
+				continue
+			if pkt_type & CRC_FLAG:
+				if buf[end + 1] | (buf[end + 2] << 8) != crc16(mv[start + 1:end]):
+					self.send_nak()		#request retransmission immediately instead of waiting for a time out
+					start += 1
+					continue
+				pkt_type ^= CRC_FLAG
+			elif buf[end + 1] != lrc(payload):
+				start += 1
+				continue
+			if self.show_packets:
+				dump_mem(mv[start:end + ftr_len], 'Rcvd')
+			if pkt_type & SEQ_FLAG:
+				pkt_type ^= SEQ_FLAG
+				seq = struct.unpack_from('<B', payload, 0)[0]		#indexing a memoryview returns str on Python 2
+				payload = payload[1:]
+				if self.rx_expected is None:
+					self.rx_expected = seq
+				self.ack_pending = True
+				if seq != self.rx_expected:
+					if (seq - self.rx_expected) & 0xff < 0x80:
+						self.send_nak()		#frame after a lost frame
+					start = end + ftr_len		#otherwise duplicate
+					continue
+				self.rx_expected = (seq + 1) & 0xff
+				self.nak_seq = None
+			if pkt_type == ZLB:
+				self.inflate(payload, objs)
+			elif pkt_type == FRG and struct.unpack_from('<B', payload, 0)[0] == ZLB:
+				self.unpack_compressed_fragment(payload, objs)
+			elif pkt_type == NAK:
+				if len(payload) == 1:
+					self.go_back(struct.unpack_from('<B', payload, 0)[0])
+			elif pkt_type == ACK:
+				self.ack(struct.unpack_from('<B', payload, 0)[0])
 			else:
-				self.state = Packet.STATE_SOH
-		elif self.state == Packet.STATE_EOT:
-			self.state = Packet.STATE_SOH
-			if byte == EOT:
-				if self.pkt_type == SEQ:
-					try:				# MicroPython does not have decode attribute for bytearrays
-						return tsv.loads(self.pkt.decode('ascii'))
-					except AttributeError:
-						return tsv.loads(str(self.pkt,'ascii'))
-				elif self.pkt_type == MSG:
-					try:
-						return self.pkt.decode('ascii')
-					except AttributeError:
-						return str(self.pkt,'ascii')
-				elif self.pkt_type == INS:
-					try:
-						return int(self.pkt.decode('ascii'))
-					except AttributeError:
-						return int(str(self.pkt,'ascii'))
+				obj = self.unpack(pkt_type, payload)
+				if obj is not None:
+					objs.append(obj)
+			start = end + ftr_len
+		return start
+
+	def resync(self):
+		"""Discard the start of header of a stalled frame and decode the
+		   remaining buffered bytes."""
+		if self.rx_end > self.rx_start:
+			self.rx_start += 1
+			if self.peer_capabilities & CAP_CRC:
+				self.send_nak()
+			self.rx_objs.extend(self.decode())
 
 	def receive(self,time_out=0):
 		"""
 		Try to receive an object.
 
 		This function tries to receive an object
-		until `time_out`. If a byte is received, `time_out`
+		until `time_out`. If a frame is received partially, `time_out`
 		becomes obsolete and the function times out if no more
-		bytes are received for 1s. Returns None upon time out.
+		bytes are received for `inter_byte_timeout`. Returns None upon
+		time out. All bytes available on the serial port are read and
+		decoded at once. While no bytes are available, the function
+		blocks on the serial port instead of polling it.
 
 		Parameters
 		----------
 		time_out : int
-		    Approximate time in ms until return if no bytes are received.
+		    Time in ms until return if no object is received.
 		    If time_out = 0, the function never times out.
 
 		Returns
@@ -206,17 +1058,33 @@ class Packet:
 		out : object
 		    Received object or None in case of time out.
 		"""
-		i = 0
-		while time_out == 0 or i < time_out:
-			byte = self.serial_port.read_byte()
-			if byte is not None:
-				i=0
-				time_out=1000	#once the functions starts to receive something it times out after 1s
-				obj = self.process_byte(byte)
-				if obj is not None:
-					return obj
-				continue
-			i += 1
-			sleep(0.001)
+		if len(self.rx_objs) > 0:
+			return self.rx_objs.pop(0)
+		end = ticks_add(ticks_ms(), time_out)
+		frame_end = None
+		data = self.serial_port.read_available()
+		while True:
+			if len(data) > 0:
+				self.rx_objs.extend(self.decode(data))
+				if len(self.rx_objs) > 0:
+					return self.rx_objs.pop(0)
+			if self.rx_end > self.rx_start:
+				if len(data) > 0 or frame_end is None:
+					frame_end = ticks_add(ticks_ms(), self.inter_byte_timeout)	#once a frame starts, the function times out if no more bytes are received
+				deadline = frame_end
+			else:
+				frame_end = None
+				deadline = end if time_out > 0 else None
+			self.check_retransmission()
+			remaining = None
+			if deadline is not None:
+				remaining = ticks_diff(deadline, ticks_ms())
+				if remaining <= 0:
+					break
+			self.wait_readable(remaining)
+			data = self.serial_port.read_available()
+		if self.rx_end > self.rx_start:
+			self.resync()		#the frame in the buffer is not completed
+			if len(self.rx_objs) > 0:
+				return self.rx_objs.pop(0)
 		return None
-
@@ -1,6 +1,7 @@
 import utime
+from telemetry import KIND_END
 
-def deliver_pulse(pin_out_func, amplitude, pulse_width, pulse_sleep, pin_outLED, eh, ticks=utime.ticks_ms, sleep=utime.sleep_ms, on_state=1):
+def deliver_pulse(pin_out_func, amplitude, pulse_width, pulse_sleep, pin_outLED, eh, ticks=utime.ticks_ms, sleep=utime.sleep_ms, on_state=1, event=0, pulse=0):
 	"""
 	Deliver stimulus pulse.
 
@@ -29,6 +30,12 @@ def deliver_pulse(pin_out_func, amplitude, pulse_width, pulse_sleep, pin_outLED,
 	sleep: sleep function, optional
 	    Default is utime.sleep_ms. The sleep function
 	    should match the ticks function.
+	event : int, optional
+	    Index of the event the pulse belongs to. Used to report
+	    timing deviations.
+	pulse : int, optional
+	    Index of the pulse in the event. Used to report timing
+	    deviations.
 	"""
 	start_time = ticks()
 	pin_out_func(amplitude*on_state)
@@ -44,5 +51,6 @@ def deliver_pulse(pin_out_func, amplitude, pulse_width, pulse_sleep, pin_outLED,
 		pin_outLED.off()
 	elif utime.ticks_diff(ticks(),scheduled_time) > 0:
 		pin_out_func(not on_state)
+		end_time = ticks()
 		pin_outLED.off()
-		eh.send('Missed scheduled end time of pulse by {0} us'.format(utime.ticks_diff(ticks(),scheduled_time)))
+		eh.timing(event, pulse, scheduled_time, end_time, KIND_END)
@@ -0,0 +1,109 @@
+"""
+Synchronization of the schedule to the volume triggers of the scanner.
+
+The first trigger starts the sequence. Every following trigger marks the
+start of the next repetition time (TR) of the scanner and anchors the
+schedule again (phase locking). The number of ticks of the pyboard per TR
+is estimated from the intervals between the triggers (frequency locking),
+so onsets between two triggers are corrected for the drift between the
+clocks as well. All calculations use small integers, so no memory is
+allocated while pulses are delivered.
+"""
+
+try:
+	from utime import ticks_diff, ticks_add
+except ImportError:
+	TICKS_PERIOD = 1 << 30		#ticks of MicroPython wrap around after this number
+	def ticks_diff(new, old):
+		return (new - old + TICKS_PERIOD // 2) % TICKS_PERIOD - TICKS_PERIOD // 2
+	def ticks_add(ticks, delta):
+		return (ticks + delta) % TICKS_PERIOD
+
+try:
+	from array import array
+except ImportError:
+	from uarray import array
+
+try:
+	import telemetry
+except ImportError:
+	from cosplay import telemetry
+
+class TriggerSync(object):
+	"""
+	Clock model mapping the time of the scanner onto ticks of the pyboard.
+
+	Parameters
+	----------
+	tr : int
+	    Nominal repetition time in ticks.
+	size : int, optional
+	    Number of triggers that are buffered and logged. Default is 1024.
+	unit : string, optional
+	    Unit of the ticks, 'us' or 'ms'. Default is 'us'.
+	"""
+
+	def __init__(self, tr, size=1024, unit='us'):
+		self.tr = tr
+		self.size = size
+		self.max_skew = min(tr // 1000, 1 << 14)	#largest drift per TR that is corrected (1000 ppm)
+		self.scale = tr // (1 << 15) + 1		#keeps the interpolation between triggers below 2**29
+		self.times = array('i', [0] * size)		#ticks of the triggers, written in the interrupt
+		self.log = telemetry.Batch(size, unit)		#predicted and actual ticks of each trigger
+		self.reset()
+
+	def reset(self):
+		"""Forget all triggers, e.g. before a new sequence."""
+		self.count = 0			#number of triggers received
+		self.processed = 0		#number of triggers used by `update`
+		self.volume = 0			#index of the TR of the last trigger
+		self.anchor_tick = 0		#ticks of the last trigger
+		self.anchor_time = 0		#time of the scanner of the last trigger in ticks
+		self.period = self.tr		#estimated ticks per TR
+		self.log.clear()
+
+	def trigger(self, ticks):
+		"""Store the ticks of a trigger. Can be called in an interrupt."""
+		self.times[self.count % self.size] = ticks
+		self.count += 1
+
+	def update(self):
+		"""
+		Anchor the clock model to the triggers received since the last call.
+
+		The difference between the predicted and the actual ticks of each
+		trigger is logged in `log` as records of the kind
+		`telemetry.KIND_TRIGGER`.
+		"""
+		while self.processed < self.count:
+			ticks = self.times[self.processed % self.size]
+			self.processed += 1
+			if self.processed == 1:
+				self.anchor_tick = ticks
+				continue
+			interval = ticks_diff(ticks, self.anchor_tick)
+			num_tr = (interval + self.period // 2) // self.period		#more than one if triggers were missed
+			if num_tr < 1:
+				continue		#bouncing of the trigger line
+			time = ticks_add(self.anchor_time, num_tr * self.tr)
+			predicted = self.schedule(time)
+			self.volume += num_tr
+			self.log.add(self.processed - 1, self.volume, predicted, ticks, telemetry.KIND_TRIGGER)
+			period = self.period + (interval // num_tr - self.period) // 4
+			self.period = max(self.tr - self.max_skew, min(self.tr + self.max_skew, period))
+			self.anchor_tick = ticks
+			self.anchor_time = time
+
+	def schedule(self, time):
+		"""
+		Return the ticks of the pyboard at the time `time` of the scanner.
+
+		Parameters
+		----------
+		time : int
+		    Time since the first trigger in ticks.
+		"""
+		delta = ticks_diff(time, self.anchor_time)
+		skew = self.period - self.tr
+		fraction = (delta % self.tr) // self.scale * skew // (self.tr // self.scale)
+		return ticks_add(self.anchor_tick, delta + (delta // self.tr) * skew + fraction)
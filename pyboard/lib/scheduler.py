@@ -0,0 +1,166 @@
+"""
+Merged schedule of the pulse edges of all events.
+
+Events of different out channels can overlap in time. `EdgeScheduler`
+merges the rising and falling edges of the pulses of all events into one
+stream ordered by time, so overlapping and interleaved pulse trains are
+delivered on time. The next edge of each event is kept in a binary heap
+stored in preallocated arrays, so no memory is allocated while the edges
+are delivered. Times are in ticks since the start of the sequence.
+"""
+
+try:
+	from array import array
+except ImportError:
+	from uarray import array
+
+FALLING = 0		#end of a pulse
+RISING = 1		#start of a pulse
+
+def end_time(onset, period, num_pulses, pulse_width):
+	"""Return the time the last pulse of an event ends."""
+	return onset + (num_pulses - 1) * period + pulse_width
+
+def collisions(onset, period, num_pulses, pulse_width, channel):
+	"""
+	Find events that overlap with another event of the same out channel.
+
+	Parameters
+	----------
+	onset, period, num_pulses, pulse_width : list
+	    Parameters of each event in ticks.
+	channel : list
+	    Out channel of each event. An event driving several channels
+	    can be given a list of channels.
+
+	Returns
+	-------
+	list
+	    (i, j) tuples of the indices of overlapping events with i < j.
+	"""
+	found = []
+	uses = []		#(channel, onset, event) for each channel driven by an event
+	for i in range(len(onset)):
+		if type(channel[i]) in (list, tuple):
+			uses.extend([(c, onset[i], i) for c in channel[i]])
+		else:
+			uses.append((channel[i], onset[i], i))
+	uses.sort()
+	for k in range(len(uses)):
+		c, start, i = uses[k]
+		end = end_time(onset[i], period[i], num_pulses[i], pulse_width[i])
+		for other, other_start, j in uses[k + 1:]:
+			if other != c or other_start >= end:
+				break
+			if (min(i, j), max(i, j)) not in found:
+				found.append((min(i, j), max(i, j)))
+	return sorted(found)
+
+class EdgeScheduler(object):
+	"""
+	Time-ordered stream of the pulse edges of all events.
+
+	`peek` sets `event`, `pulse`, `edge` and `time` to the next edge,
+	`advance` moves on to the following edge of the same event and `drop`
+	skips the remaining edges of the event.
+	Simultaneous edges are ordered falling before rising and then by event.
+
+	Parameters
+	----------
+	onset, period, num_pulses, pulse_width : list / array
+	    Parameters of each event in ticks.
+	"""
+
+	def __init__(self, onset, period, num_pulses, pulse_width):
+		self.onset = onset
+		self.period = period
+		self.num_pulses = num_pulses
+		self.pulse_width = pulse_width
+		num_events = len(onset)
+		self.heap = array('i', [0] * num_events)		#indices of the events ordered by their next edge
+		self.next_pulse = array('i', [0] * num_events)
+		self.next_edge = array('B', [0] * num_events)
+		self.next_time = array('i', [0] * num_events)
+		self.reset()
+
+	def reset(self):
+		"""Start again with the first edge of the sequence."""
+		self.size = 0
+		for i in range(len(self.onset)):
+			self.next_pulse[i] = 0
+			self.next_edge[i] = RISING
+			self.next_time[i] = self.onset[i]
+			if self.num_pulses[i] > 0:
+				self.heap[self.size] = i
+				self.size += 1
+		for k in range(self.size // 2 - 1, -1, -1):
+			self.sift_down(k)
+		self.event = -1
+		self.pulse = 0
+		self.edge = RISING
+		self.time = 0
+
+	def before(self, a, b):
+		"""Return True if the next edge of event `a` is delivered before
+		   the next edge of event `b`."""
+		if self.next_time[a] != self.next_time[b]:
+			return self.next_time[a] < self.next_time[b]
+		if self.next_edge[a] != self.next_edge[b]:
+			return self.next_edge[a] < self.next_edge[b]
+		return a < b
+
+	def sift_down(self, k):
+		heap = self.heap
+		size = self.size
+		while True:
+			child = 2 * k + 1
+			if child >= size:
+				return
+			if child + 1 < size and self.before(heap[child + 1], heap[child]):
+				child += 1
+			if not self.before(heap[child], heap[k]):
+				return
+			heap[k], heap[child] = heap[child], heap[k]
+			k = child
+
+	def peek(self):
+		"""
+		Set `event`, `pulse`, `edge` and `time` to the next edge.
+
+		Returns
+		-------
+		int
+		    Index of the event of the next edge or -1 if all edges
+		    were delivered.
+		"""
+		if self.size == 0:
+			self.event = -1
+			return -1
+		event = self.heap[0]
+		self.event = event
+		self.pulse = self.next_pulse[event]
+		self.edge = self.next_edge[event]
+		self.time = self.next_time[event]
+		return event
+
+	def advance(self):
+		"""Move on to the following edge of the event of the next edge."""
+		event = self.heap[0]
+		if self.next_edge[event] == RISING:
+			self.next_edge[event] = FALLING
+			self.next_time[event] += self.pulse_width[event]
+		else:
+			pulse = self.next_pulse[event] + 1
+			if pulse >= self.num_pulses[event]:
+				self.drop()
+				return
+			self.next_pulse[event] = pulse
+			self.next_edge[event] = RISING
+			self.next_time[event] = self.onset[event] + pulse * self.period[event]
+		self.sift_down(0)
+
+	def drop(self):
+		"""Skip the remaining edges of the event of the next edge."""
+		self.size -= 1
+		self.heap[0] = self.heap[self.size]
+		self.sift_down(0)
@@ -6,15 +6,19 @@ receive serial data using the pyboard's USB_VCP class.
 """
 
 from pyb import USB_VCP
+import uselect
 
 class USB_Port:
 
     def __init__(self):
         self.usb_serial = USB_VCP()
         self.recv_buf = bytearray(1)
+        self.chunk_buf = bytearray(64)     # size of one USB full speed packet
         # Disable Control-C on the USB serial port in case one comes in the 
         # data.
         self.usb_serial.setinterrupt(-1)
+        self.poller = uselect.poll()
+        self.poller.register(self.usb_serial, uselect.POLLIN)
 
     def read_byte(self):
         """Reads a byte from the usb serial device."""
@@ -23,6 +27,22 @@ class USB_Port:
             if bytes_read > 0:
                 return self.recv_buf[0]
 
+    def read_available(self):
+        """Reads all bytes that are available on the usb serial device."""
+        data = bytearray()
+        while self.usb_serial.any():
+            bytes_read = self.usb_serial.recv(self.chunk_buf, timeout=0)
+            if bytes_read <= 0:
+                break
+            data.extend(self.chunk_buf[:bytes_read])
+        return data
+
+    def wait_readable(self, time_out=None):
+        """Blocks until bytes are available or `time_out` ms passed."""
+        if time_out is None:
+            time_out = -1
+        return len(self.poller.poll(time_out)) > 0
+
     def write(self, data):
         """Writes an entire packet to the serial port."""
         self.usb_serial.write(data)
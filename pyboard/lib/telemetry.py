@@ -0,0 +1,270 @@
+"""
+Binary timing telemetry.
+
+Timing deviations measured on the pyboard are sent to the host as
+records instead of messages. A telemetry payload is a header followed by
+the records. All values are little-endian. The header contains the format
+version, the unit of the ticks, the format of the records and the number
+of records. Records in the format `RECORDS` describe one deviation each:
+the event index, the pulse index, the scheduled tick, the actual tick and
+the kind of the deviation. Records in the format `SUMMARY` aggregate the
+deviations of one event: the event index, the number of late onsets, the
+maximal and summed lateness of the onsets, the number of late pulse ends
+and the maximal and summed lateness of the pulse ends.
+"""
+
+try:
+	import ustruct as struct
+except ImportError:
+	import struct
+
+try:
+	from array import array
+except ImportError:
+	from uarray import array
+
+VERSION = 1
+HEADER = '<BBBH'	#version, unit, format, number of records
+HEADER_LEN = struct.calcsize(HEADER)
+UNITS = ('us', 'ms')
+TICKS_PERIOD = 1 << 30		#ticks of MicroPython wrap around after this number
+
+RECORDS = 0			#format of payloads with one record per deviation
+SUMMARY = 1			#format of payloads with one record per event
+RECORD = '<HIIIB'	#event index, pulse index, scheduled tick, actual tick, kind
+RECORD_LEN = struct.calcsize(RECORD)
+COLUMNS = ('event', 'pulse', 'scheduled', 'actual', 'kind')
+TYPECODES = ('H', 'I', 'I', 'I', 'B')
+SUMMARY_RECORD = '<HIIIIII'
+SUMMARY_RECORD_LEN = struct.calcsize(SUMMARY_RECORD)
+SUMMARY_COLUMNS = ('event', 'late_onsets', 'max_onset', 'sum_onset', 'late_ends', 'max_end', 'sum_end')
+SUMMARY_TYPECODES = ('H', 'I', 'I', 'I', 'I', 'I', 'I')
+
+KIND_ONSET = 0			#pulse started after its scheduled onset
+KIND_END = 1			#pulse ended after its scheduled end
+KIND_TRIGGER = 2		#volume trigger of the scanner (event is the trigger index, pulse the TR index)
+
+try:
+	from utime import ticks_diff
+	def lateness(scheduled, actual):
+		"""Return the number of ticks `actual` is after `scheduled`."""
+		return ticks_diff(actual, scheduled)
+except ImportError:
+	def lateness(scheduled, actual):
+		"""Return the number of ticks `actual` is after `scheduled`,
+		   taking the wrap around of the ticks into account."""
+		return (actual - scheduled + TICKS_PERIOD // 2) % TICKS_PERIOD - TICKS_PERIOD // 2
+
+class Batch(object):
+	"""
+	Preallocated buffer collecting telemetry records.
+
+	Adding records does not allocate memory, so records can be added
+	while pulses are delivered. Records that do not fit are counted
+	in `overflow`.
+
+	Parameters
+	----------
+	size : int, optional
+	    Maximal number of records. Default is 64.
+	unit : string, optional
+	    Unit of the ticks, 'us' or 'ms'. Default is 'us'.
+	"""
+
+	def __init__(self, size=64, unit='us'):
+		self.buf = bytearray(HEADER_LEN + size * RECORD_LEN)
+		self.size = size
+		self.unit = UNITS.index(unit)
+		self.count = 0
+		self.overflow = 0		#number of records that did not fit
+
+	def add(self, event, pulse, scheduled, actual, kind):
+		"""
+		Add a record.
+
+		Returns
+		-------
+		bool
+		    True if the record was added, False if the batch is full.
+		"""
+		if self.count >= self.size:
+			self.overflow += 1
+			return False
+		struct.pack_into(RECORD, self.buf, HEADER_LEN + self.count * RECORD_LEN, event, pulse, scheduled, actual, kind)
+		self.count += 1
+		return True
+
+	def record(self, index):
+		"""Return the record at `index` as tuple."""
+		return struct.unpack_from(RECORD, self.buf, HEADER_LEN + index * RECORD_LEN)
+
+	def payload(self):
+		"""Return a memoryview of the header and the records."""
+		struct.pack_into(HEADER, self.buf, 0, VERSION, self.unit, RECORDS, self.count)
+		return memoryview(self.buf)[:HEADER_LEN + self.count * RECORD_LEN]
+
+	def clear(self):
+		"""Remove all records and reset the overflow counter."""
+		self.count = 0
+		self.overflow = 0
+
+class Summary(object):
+	"""
+	Lateness statistics of each event of a sequence.
+
+	The counters are preallocated, so deviations can be added while
+	pulses are delivered without allocating memory.
+
+	Parameters
+	----------
+	num_events : int
+	    Number of events of the sequence.
+	unit : string, optional
+	    Unit of the ticks, 'us' or 'ms'. Default is 'us'.
+	"""
+
+	def __init__(self, num_events, unit='us'):
+		self.unit = UNITS.index(unit)
+		self.late_onsets = array('I', [0] * num_events)
+		self.max_onset = array('I', [0] * num_events)
+		self.sum_onset = array('I', [0] * num_events)
+		self.late_ends = array('I', [0] * num_events)
+		self.max_end = array('I', [0] * num_events)
+		self.sum_end = array('I', [0] * num_events)
+
+	def add(self, event, lateness, kind):
+		"""Add a deviation of `lateness` ticks of the kind `kind` to the
+		   statistics of `event`."""
+		if kind == KIND_ONSET:
+			self.late_onsets[event] += 1
+			self.sum_onset[event] += lateness
+			if lateness > self.max_onset[event]:
+				self.max_onset[event] = lateness
+		else:
+			self.late_ends[event] += 1
+			self.sum_end[event] += lateness
+			if lateness > self.max_end[event]:
+				self.max_end[event] = lateness
+
+	def events(self):
+		"""Return the indices of the events with deviations."""
+		return [i for i in range(len(self.late_onsets)) if self.late_onsets[i] > 0 or self.late_ends[i] > 0]
+
+	def record(self, event):
+		"""Return the summary record of `event` as tuple."""
+		return (event, self.late_onsets[event], self.max_onset[event], self.sum_onset[event],
+			self.late_ends[event], self.max_end[event], self.sum_end[event])
+
+	def payload(self):
+		"""Return the header and the records of all events with deviations."""
+		events = self.events()
+		buf = bytearray(HEADER_LEN + len(events) * SUMMARY_RECORD_LEN)
+		struct.pack_into(HEADER, buf, 0, VERSION, self.unit, SUMMARY, len(events))
+		offset = HEADER_LEN
+		for event in events:
+			struct.pack_into(SUMMARY_RECORD, buf, offset, *self.record(event))
+			offset += SUMMARY_RECORD_LEN
+		return buf
+
+def dumps(records, unit='us'):
+	"""
+	Serialize `records` to a telemetry payload.
+
+	Parameters
+	----------
+	records : list
+	    List of (event, pulse, scheduled, actual, kind) tuples.
+	unit : string, optional
+	    Unit of the ticks. Default is 'us'.
+
+	Returns
+	-------
+	bytes
+	    Telemetry payload.
+	"""
+	batch = Batch(len(records), unit)
+	for record in records:
+		batch.add(*record)
+	return bytes(batch.payload())
+
+def loads(buf):
+	"""
+	Convert a telemetry payload into columns.
+
+	Parameters
+	----------
+	buf : bytes / bytearray / memoryview
+	    Telemetry payload.
+
+	Returns
+	-------
+	dict
+	    Array for each name in `COLUMNS` or `SUMMARY_COLUMNS`, the unit
+	    of the ticks as 'unit' and the format as 'format'.
+	"""
+	version, unit, fmt, num_records = struct.unpack_from(HEADER, buf, 0)
+	if version != VERSION:
+		raise ValueError('Unsupported telemetry version {0}.'.format(version))
+	if fmt == RECORDS:
+		record_fmt = RECORD
+	elif fmt == SUMMARY:
+		record_fmt = SUMMARY_RECORD
+	else:
+		raise ValueError('Unsupported telemetry format {0}.'.format(fmt))
+	columns = empty(UNITS[unit], fmt)
+	arrays = [columns[name] for name in column_names(fmt)]
+	offset = HEADER_LEN
+	record_len = struct.calcsize(record_fmt)
+	for i in range(num_records):
+		record = struct.unpack_from(record_fmt, buf, offset)
+		for column, value in zip(arrays, record):
+			column.append(value)
+		offset += record_len
+	return columns
+
+def column_names(fmt):
+	"""Return the names of the columns of the format `fmt`."""
+	if fmt == SUMMARY:
+		return SUMMARY_COLUMNS
+	return COLUMNS
+
+def empty(unit='us', fmt=RECORDS):
+	"""Return columns without records in the format of `loads`."""
+	columns = {'unit': unit, 'format': fmt}
+	if fmt == SUMMARY:
+		typecodes = SUMMARY_TYPECODES
+	else:
+		typecodes = TYPECODES
+	for name, typecode in zip(column_names(fmt), typecodes):
+		columns[name] = array(typecode)
+	return columns
+
+def concatenate(payloads, fmt=RECORDS):
+	"""Return the records of all decoded `payloads` in the format `fmt`
+	   as one set of columns or None if there are no such records."""
+	columns = None
+	for other in payloads:
+		if other['format'] != fmt:
+			continue
+		if columns is None:
+			columns = empty(other['unit'], fmt)
+		for name in column_names(fmt):
+			columns[name].extend(other[name])
+	return columns
+
+def message(event, pulse, scheduled, actual, kind, unit='us'):
+	"""Return the message describing a record for the user."""
+	if kind == KIND_TRIGGER:
+		return 'Volume trigger {0} (TR {1}) arrived {2} {3} after the predicted time'.format(event, pulse, lateness(scheduled, actual), unit)
+	if kind == KIND_ONSET:
+		return 'Missed scheduled onset time of pulse {0} in event {1} by {2} {3}'.format(pulse, event, lateness(scheduled, actual), unit)
+	return 'Missed scheduled end time of pulse {0} in event {1} by {2} {3}'.format(pulse, event, lateness(scheduled, actual), unit)
+
+def summary_message(event, late_onsets, max_onset, sum_onset, late_ends, max_end, sum_end, unit='us'):
+	"""Return the message describing a summary record for the user."""
+	parts = []
+	if late_onsets > 0:
+		parts.append('scheduled onset time of {0} pulses (max {1} {3}, mean {2:.1f} {3})'.format(late_onsets, max_onset, sum_onset / late_onsets, unit))
+	if late_ends > 0:
+		parts.append('scheduled end time of {0} pulses (max {1} {3}, mean {2:.1f} {3})'.format(late_ends, max_end, sum_end / late_ends, unit))
+	return 'Missed {0} in event {1}'.format(' and '.join(parts), event)
@@ -0,0 +1,211 @@
+import pyb
+import stm
+import timers
+
+TIMER_BASE = {1: 0x40010000, 2: 0x40000000, 4: 0x40000800, 8: 0x40010400}
+CR1 = 0x00
+DIER = 0x0c
+SR = 0x10
+EGR = 0x14
+CCER = 0x20
+CNT = 0x24
+PSC = 0x28
+ARR = 0x2c
+RCR = 0x30
+CCR1 = 0x34		#compare register of timer channel 1, followed by those of channels 2 to 4
+CEN = 1			#counter enable
+URS = 1 << 2		#only overflows generate update interrupts
+OPM = 1 << 3		#one pulse mode, the counter stops at the next update
+UIE = 1			#update interrupt enable, calls the callback of the timer
+UG = 1
+
+MAX_CALLBACK_FREQUENCY = 10000		#highest frequency in Hz of trains counted by callbacks
+
+class TimerPulseTrain:
+	"""
+	Pulse train of a digital out channel generated by a hardware timer.
+
+	The timer produces the edges of the pulses in PWM mode, so their timing
+	does not depend on the interpreter. The CPU only starts the train at the
+	onset of an event. `arm` configures the timer before a sequence is
+	delivered, afterwards `prepare` and `start` only write its registers, so
+	they do not allocate memory.
+	Timers with a repetition counter (out channels 1 and 3) count the pulses
+	themselves in bursts of up to 256 pulses and stop after the last one, so
+	the frequency is only limited by the timer clock. The timers of the other
+	channels call a callback every period, which counts the pulses and stops
+	the train. Their frequency is limited to `MAX_CALLBACK_FREQUENCY`.
+
+	Parameters
+	----------
+	out_channel : int
+	    Out channel 1 to 4 (see `timers.CHANNELS`).
+	pin : pyb.Pin object
+	    Pin of the out channel configured as output.
+	on_value : int
+	    Value of the pin while a pulse is active.
+	ticks_per_second : int, optional
+	    Number of ticks per second of the schedule. Default is 1000000.
+	"""
+	def __init__(self, out_channel, pin, on_value, ticks_per_second=1000000):
+		pin_name, timer_id, channel, af, complementary, bits = timers.CHANNELS[out_channel]
+		self.out_channel = out_channel
+		self.pin = pin
+		self.pin_mode = pin.mode()		#restored when the train is released
+		self.pin_pull = pin.pull()
+		self.on_value = on_value
+		self.channel = channel
+		self.af = getattr(pyb.Pin, af)
+		self.bits = bits
+		self.ticks_per_second = ticks_per_second
+		self.timer_id = timer_id
+		self.timer = pyb.Timer(timer_id)
+		self.source_freq = self.timer.source_freq()
+		self.timer.deinit()
+		self.repetition = timer_id in timers.REPETITION_TIMERS
+		if self.repetition:		#PWM mode 2, active at the end of the period
+			self.mode = pyb.Timer.PWM_INVERTED
+		elif bool(on_value) != complementary:		#complementary outputs are inverted
+			self.mode = pyb.Timer.PWM
+		else:
+			self.mode = pyb.Timer.PWM_INVERTED
+		if self.pin_mode == pyb.Pin.OUT_OD:
+			self.af_mode = pyb.Pin.AF_OD
+		else:
+			self.af_mode = pyb.Pin.AF_PP
+		#register addresses are computed once, the sums are not small ints
+		self.base = TIMER_BASE[timer_id]
+		self.cr1 = self.base + CR1
+		self.dier = self.base + DIER
+		self.sr = self.base + SR
+		self.egr = self.base + EGR
+		self.ccer = self.base + CCER
+		self.cnt = self.base + CNT
+		self.psc = self.base + PSC
+		self.arr = self.base + ARR
+		self.rcr = self.base + RCR
+		self.ccr = self.base + CCR1 + 4 * (channel - 1)
+		#polarity of the output in PWM mode 2, which is active at the end of the period
+		if complementary:
+			self.polarity_bit = 1 << (4 * (channel - 1) + 3)
+			self.polarity = self.polarity_bit if on_value else 0
+		else:
+			self.polarity_bit = 1 << (4 * (channel - 1) + 1)
+			self.polarity = 0 if on_value else self.polarity_bit
+		self.count_callback = self.count		#bound once, binding a method allocates
+		self.bursts_callback = self.count_bursts
+		self.timer_channel = None
+		self.remaining = 0
+		self.bursts = 0
+		self.interrupt = 0		#UIE if the callback counts the prepared train
+		self.running = False
+
+	def settings(self, period, pulse_width):
+		"""Return the timer settings of a train with `period` and
+		   `pulse_width` in ticks (see `timers.settings`)."""
+		if not self.repetition and period * MAX_CALLBACK_FREQUENCY < self.ticks_per_second:
+			raise ValueError('Out channel {0} generates pulse trains of at most {1} Hz.'.format(self.out_channel, MAX_CALLBACK_FREQUENCY))
+		return timers.settings(self.source_freq, period, pulse_width, self.ticks_per_second, self.bits)
+
+	def arm(self):
+		"""
+		Configure the timer and its channel before a sequence is delivered.
+
+		The callbacks are installed here, because `pyb.Timer.callback`
+		also starts the counter. Afterwards the counter and the update
+		interrupt are only enabled by `start`.
+		"""
+		timer = self.timer
+		timer.init(prescaler=0, period=0xffff)
+		self.timer_channel = timer.channel(self.channel, self.mode, pulse_width=0)
+		if self.repetition:
+			timer.callback(self.bursts_callback)
+		else:
+			timer.callback(self.count_callback)
+		mem32 = stm.mem32
+		mem32[self.cr1] = (mem32[self.cr1] & ~(CEN | OPM)) | URS
+		mem32[self.dier] = mem32[self.dier] & ~UIE
+		if self.repetition:
+			mem32[self.ccer] = (mem32[self.ccer] & ~self.polarity_bit) | self.polarity
+		self.running = False
+
+	def prepare(self, prescaler, period, pulse_width, num_pulses):
+		"""
+		Configure the next pulse train, which is started with `start`.
+
+		Parameters
+		----------
+		prescaler, period, pulse_width : int
+		    Timer settings as returned by `settings`.
+		num_pulses : int
+		    Number of pulses of the train.
+		"""
+		mem32 = stm.mem32
+		mem32[self.cr1] = mem32[self.cr1] & ~(CEN | OPM)
+		mem32[self.dier] = mem32[self.dier] & ~UIE
+		mem32[self.psc] = prescaler
+		mem32[self.arr] = period
+		if self.repetition:
+			mem32[self.ccr] = period + 1 - pulse_width
+			first = (num_pulses - 1) % timers.REPETITION + 1		#timers.bursts without the tuple
+			self.bursts = (num_pulses - first) // timers.REPETITION
+			mem32[self.rcr] = first - 1
+			mem32[self.egr] = UG		#loads the settings and the repetition counter
+			mem32[self.rcr] = timers.REPETITION - 1		#for the following bursts
+			mem32[self.cnt] = max(period - pulse_width, 0)		#the first pulse starts one count after the counter
+		else:
+			self.remaining = num_pulses		#counted down at the start of every period
+			mem32[self.ccr] = pulse_width
+			mem32[self.egr] = UG
+			mem32[self.cnt] = period		#the first pulse starts one count after the counter
+		mem32[self.sr] = 0
+		self.pin.init(self.af_mode, af=self.af)		#the pin is connected to the stopped timer, so it keeps its idle value
+		if self.repetition and self.bursts == 0:
+			mem32[self.cr1] = mem32[self.cr1] | OPM
+			self.interrupt = 0
+		else:
+			self.interrupt = UIE
+
+	def start(self):
+		"""Start the prepared pulse train immediately."""
+		self.running = True
+		mem32 = stm.mem32
+		mem32[self.dier] = mem32[self.dier] | self.interrupt
+		mem32[self.cr1] = mem32[self.cr1] | CEN
+
+	def count(self, timer):
+		"""Timer callback at the start of every period."""
+		if self.remaining > 0:
+			self.remaining -= 1
+			if self.remaining == 0:
+				stm.mem32[self.ccr] = 0		#the current pulse is the last one, takes effect at the next period
+		else:
+			stm.mem32[self.dier] = stm.mem32[self.dier] & ~UIE
+			stm.mem32[self.cr1] = stm.mem32[self.cr1] & ~CEN
+			self.running = False
+
+	def count_bursts(self, timer):
+		"""Timer callback at the start of every burst of the repetition counter."""
+		self.bursts -= 1
+		if self.bursts == 0:
+			stm.mem32[self.cr1] = stm.mem32[self.cr1] | OPM		#the counter stops after the current burst
+			stm.mem32[self.dier] = stm.mem32[self.dier] & ~UIE
+
+	def wait(self):
+		"""Wait until the train is finished."""
+		if self.repetition:
+			while self.running and stm.mem32[self.cr1] & CEN:
+				pyb.wfi()
+			self.running = False
+			return
+		while self.running:
+			pyb.wfi()
+
+	def release(self):
+		"""Stop the timer and return the pin to its idle value."""
+		self.timer.callback(None)
+		self.timer.deinit()
+		self.running = False
+		stm.mem32[self.cr1] = stm.mem32[self.cr1] & ~(CEN | OPM | URS)
+		self.pin.init(self.pin_mode, pull=self.pin_pull)
+		self.pin.value(not self.on_value)
@@ -0,0 +1,102 @@
+"""
+Hardware timers generating the pulses of the digital out channels.
+
+Each digital out channel is connected to the output of a timer channel.
+Pulse trains are produced by the timer in PWM mode: the counter counts
+from 0 to `period` and the output is active while the counter is smaller
+than `pulse_width`. The counter runs at the source frequency of the timer
+divided by `prescaler + 1`. Timers 1 and 8 have a repetition counter, so
+they count the pulses of a train themselves in bursts of up to
+`REPETITION` pulses. This module only contains the calculation of the
+timer settings, so it can be used on the host as well.
+"""
+
+#out channel: (pin, timer, timer channel, alternate function, complementary output, counter bits)
+CHANNELS = {
+	1: ('Y1', 8, 1, 'AF3_TIM8', False, 16),		#PC6
+	2: ('Y3', 4, 3, 'AF2_TIM4', False, 16),		#PB8
+	3: ('Y12', 1, 3, 'AF1_TIM1', True, 16),		#PB1, TIM1_CH3N
+	4: ('X2', 2, 2, 'AF1_TIM2', False, 32),		#PA1
+}
+
+#source frequency in Hz of the timers of a pyboard running at 168 MHz
+SOURCE_FREQ = {1: 168000000, 2: 84000000, 4: 84000000, 8: 168000000}
+
+MAX_PRESCALER = 0xffff
+REPETITION_TIMERS = (1, 8)		#timers with a repetition counter
+REPETITION = 256		#largest number of periods counted by the 8 bit repetition counter
+
+def settings(source_freq, period, pulse_width, ticks_per_second=1000000, bits=16):
+	"""
+	Calculate the timer settings of a pulse train.
+
+	The smallest prescaler is used, so the resolution of the period and
+	the pulse width is as fine as possible.
+
+	Parameters
+	----------
+	source_freq : int
+	    Source frequency of the timer in Hz.
+	period : int
+	    Period of the pulses in ticks.
+	pulse_width : int
+	    Width of the pulses in ticks.
+	ticks_per_second : int, optional
+	    Number of ticks per second, 1000000 for 'us' and 1000 for 'ms'.
+	    Default is 1000000.
+	bits : int, optional
+	    Width of the counter of the timer. Default is 16.
+
+	Returns
+	-------
+	tuple
+	    (prescaler, period, pulse_width) as values of the timer
+	    registers. The period of the counter is `period + 1`.
+	"""
+	cycles = source_freq * period // ticks_per_second
+	divider = (cycles - 1) // (1 << bits) + 1
+	if divider > MAX_PRESCALER + 1:
+		raise ValueError('Period of {0} ticks is too long for the timer.'.format(period))
+	if divider < 1 or pulse_width > period:
+		raise ValueError('Invalid period {0} or pulse width {1}.'.format(period, pulse_width))
+	scale = divider * ticks_per_second
+	counts = (source_freq * period + scale // 2) // scale
+	width = (source_freq * pulse_width + scale // 2) // scale
+	if counts < 2:
+		raise ValueError('Period of {0} ticks is too short for the timer.'.format(period))
+	return divider - 1, counts - 1, min(width, counts)
+
+def quantization(source_freq, prescaler, period, pulse_width):
+	"""
+	Return the period and the pulse width produced by the timer.
+
+	Parameters
+	----------
+	source_freq : int
+	    Source frequency of the timer in Hz.
+	prescaler, period, pulse_width : int
+	    Timer settings as returned by `settings`.
+
+	Returns
+	-------
+	tuple
+	    (period, pulse_width) in ns.
+	"""
+	count_ns = (prescaler + 1) * 1000000000
+	return (period + 1) * count_ns // source_freq, pulse_width * count_ns // source_freq
+
+def bursts(num_pulses):
+	"""
+	Split a pulse train into bursts counted by the repetition counter.
+
+	The first burst is the shortest, so the timer has at least
+	`REPETITION` periods to stop after the last burst.
+
+	Returns
+	-------
+	tuple
+	    (first, following): number of pulses of the first burst and
+	    number of bursts of `REPETITION` pulses following it.
+	"""
+	first = (num_pulses - 1) % REPETITION + 1
+	return first, (num_pulses - first) // REPETITION
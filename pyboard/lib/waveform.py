@@ -0,0 +1,97 @@
+"""
+Waveforms of the amplitude modulation channels.
+
+Events of the out channels 5 and 6 can shape their pulses with the
+optional sequence column 'waveform':
+
+- 'square' or 'n/a': rectangular pulses (default)
+- 'ramp': the amplitude rises linearly during each pulse
+- 'sine': raised cosine from 0 to the amplitude and back during each pulse
+- 'table:v0,v1,...': arbitrary samples between 0 and 1 stretched to the
+  width of each pulse
+
+One period of the waveform is computed as samples of the 8 bit DAC before
+the sequence is armed. The samples are played repeatedly by DMA at a fixed
+sample rate, so the interpreter does not time the samples.
+"""
+
+import math
+
+SHAPES = ('square', 'ramp', 'sine', 'table')
+
+def parse(value):
+	"""
+	Parse a value of the column 'waveform'.
+
+	Returns
+	-------
+	tuple
+	    (shape, table), table is None except for shape 'table'. None
+	    for rectangular pulses.
+	"""
+	if type(value) != str or value in ('n/a', '', 'square'):
+		return None
+	if value.startswith('table:'):
+		try:
+			table = [float(v) for v in value[6:].split(',')]
+		except ValueError:
+			raise ValueError('Invalid waveform table {0}.'.format(value))
+		if len(table) == 0 or min(table) < 0 or max(table) > 1:
+			raise ValueError('Samples of waveform table {0} must be between 0 and 1.'.format(value))
+		return ('table', table)
+	if value not in SHAPES:
+		raise ValueError('Unrecognized waveform {0}.'.format(value))
+	return (value, None)
+
+def num_samples(duration, sample_rate, ticks_per_second=1000000):
+	"""Return the number of samples closest to `duration` ticks."""
+	return (duration * sample_rate + ticks_per_second // 2) // ticks_per_second
+
+def samples(waveform, period, pulse_width, amplitude, sample_rate, ticks_per_second=1000000, max_samples=4096):
+	"""
+	Compute the samples of one period of a pulse train.
+
+	Parameters
+	----------
+	waveform : tuple
+	    Waveform as returned by `parse`.
+	period, pulse_width : int
+	    Period and width of the pulses in ticks.
+	amplitude : float
+	    Amplitude between 0 and 1.
+	sample_rate : int
+	    Samples per second.
+	ticks_per_second : int, optional
+	    Number of ticks per second. Default is 1000000.
+	max_samples : int, optional
+	    Maximal number of samples of one period. Default is 4096.
+
+	Returns
+	-------
+	bytearray
+	    Samples of the DAC. The period played is `len(samples) /
+	    sample_rate` s.
+	"""
+	length = num_samples(period, sample_rate, ticks_per_second)
+	width = min(max(num_samples(pulse_width, sample_rate, ticks_per_second), 1), length)
+	if length < 1 or length > max_samples:
+		raise ValueError('Period of {0} ticks needs {1} samples, but 1 to {2} are possible.'.format(period, length, max_samples))
+	shape, table = waveform
+	buf = bytearray(length)
+	for k in range(width):
+		if shape == 'ramp':
+			value = (k + 1) / width
+		elif shape == 'sine':
+			value = (1 - math.cos(2 * math.pi * (k + 0.5) / width)) / 2
+		elif shape == 'table':
+			value = table[k * len(table) // width]
+		else:
+			value = 1
+		buf[k] = min(255, max(0, int(value * amplitude * 255 + 0.5)))
+	return buf
+
+def period_error(period, sample_rate, ticks_per_second=1000000):
+	"""Return the difference in ns between the period played with
+	   `sample_rate` and `period` ticks."""
+	length = num_samples(period, sample_rate, ticks_per_second)
+	return length * 1000000000 // sample_rate - period * (1000000000 // ticks_per_second)
@@ -1,31 +1,140 @@
 import utime
 import micropython
+import machine
+import gc
 import random
 import uos
 import path as ospath
 import sys
 import tsv
+import bseq
+import telemetry
+import resync
+import gpio
+import waveform
+import timers
+import event_table
 
 import config as cfg
 from pulse import deliver_pulse
+from timer_pulse import TimerPulseTrain
+from scheduler import EdgeScheduler, RISING, collisions
+from pattern import PatternCompiler
+from dma_pattern import PatternPlayer
 from stm_usb_port import USB_Port
 from pkt import Packet
 from error_handler import ErrorHandler
+from library import LibraryWriter
 
 micropython.alloc_emergency_exception_buf(100)
 
 trigger_received = False
+trigger_ticks = 0			#ticks when the trigger was received, set in the interrupt
+trigger_clock = utime.ticks_us		#ticks function of the schedule, used in the interrupt
+sync = None				#`resync.TriggerSync` if the schedule follows every volume trigger
 
 class SequenceError(Exception):
 	pass
 
+def load_sequence(path):
+	"""
+	Load sequence stored as tsv or packed binary (.bsq) file.
+
+	Parameters
+	----------
+	path : string
+	    Path to sequence file.
+
+	Returns
+	-------
+	2d array
+	    Sequence.
+	"""
+	if path.endswith('.bsq'):
+		with open(path, 'rb') as f:
+			return bseq.load(f)
+	with open(path) as f:
+		return tsv.load(f)
+
+def event_table_path(path):
+	"""Return the path of the cached event table of the sequence file `path`,
+	   which is hidden, so it is not listed as sequence."""
+	idx = path.rfind('/') + 1
+	return path[:idx] + '.' + path[idx:] + '.evt'
+
+def load_event_table(path, ticks_per_second, tmax):
+	"""
+	Load the `event_table.EventTable` of a sequence file.
+
+	The table is read from its cache if the cache was compiled from the
+	current version of the file with the same `ticks_per_second` and
+	`tmax`. Otherwise the sequence is compiled and the cache is written.
+
+	Parameters
+	----------
+	path : string
+	    Path to sequence file.
+	ticks_per_second : int
+	    Number of ticks per second.
+	tmax : int
+	    Longest sleep in ticks.
+
+	Returns
+	-------
+	`event_table.EventTable`
+	"""
+	stat = uos.stat(path)
+	source = (stat[6], stat[8])		#size and modification time
+	cache_path = event_table_path(path)
+	try:
+		with open(cache_path, 'rb') as f:
+			table = event_table.load(f)
+		if table.source == source and table.ticks_per_second == ticks_per_second and table.tmax == tmax:
+			return table
+	except (OSError, ValueError):		#no cache or incomplete cache
+		pass
+	try:
+		if path.endswith('.bsq'):		#the columns are read into arrays without a row per event
+			with open(path, 'rb') as f:
+				table = event_table.from_columns(bseq.COLUMNS, bseq.load_columns(f), ticks_per_second, tmax)
+		else:
+			table = event_table.from_sequence(load_sequence(path), ticks_per_second, tmax)
+	except ValueError as e:
+		raise SequenceError('Invalid sequence {0}. {1}\n'.format(path, e))
+	table.source = source
+	gc.collect()		#the parsed sequence is not needed anymore
+	try:
+		with open(cache_path, 'wb') as f:
+			event_table.dump(table, f)
+	except OSError:
+		pass		#the table is compiled again the next time
+	return table
+
+def memory_usage():
+	"""Return free and allocated heap memory in bytes."""
+	return gc.mem_free(), gc.mem_alloc()
+
+def channel_list_writer(out_channel, on_values, path):
+	"""Return the function switching the digital out channels of a
+	   channel list like '1+3' with register writes."""
+	try:
+		return gpio.PortWriter(gpio.parse_channels(out_channel), on_values).value
+	except ValueError as e:
+		raise SequenceError('Invalid sequence {0}. {1}\n'.format(path, e))
+
 def callback_trigger(line):
-	global trigger_received
+	global trigger_received, trigger_ticks
+	trigger_ticks = trigger_clock()		#timestamp of the trigger, not of the moment it is noticed
 	trigger_received = True
+	if sync is not None:
+		sync.trigger(trigger_ticks)
 
 def callback_trigger2():
-	global trigger_received
+	global trigger_received, trigger_ticks
+	trigger_ticks = trigger_clock()
 	trigger_received = True
+	if sync is not None:
+		sync.trigger(trigger_ticks)
 
 
 def main():
@@ -55,10 +164,10 @@ def main():
 	pin_outLED = pyb.LED(4)
 
 	use_wo_server = False
-	global trigger_received
+	global trigger_received, trigger_clock, sync
 
 	serial_port = USB_Port()
-	pkt = Packet(serial_port)
+	pkt = Packet(serial_port, window=cfg.window)
 
 	armedLED = pyb.LED(3)			#indicates when the system is waiting for a trigger
 	triggerLED = pyb.LED(2)			#indicates when the system is delivering a sequence
@@ -91,6 +200,7 @@ def main():
 	while not use_wo_server or pyb.elapsed_millis(first_push_time)<double_click_time:
 		reps += 1
 		if reps%send_repetition == 0:
+			pkt.send_capabilities()
 			pkt.send(pkt.INS_check_for_sequences_on_server)
 		answer = pkt.receive(time_out=1)
 		if answer is not None:
@@ -131,16 +241,16 @@ def main():
 				path = '0:/sequence_library'
 			if not ospath.exists(path):
 				uos.mkdir(path)
-			for s in uos.listdir(path):
-				uos.remove(path + '/' + s)
-			sequence_idx = 0
+			library = LibraryWriter(path)
+			library.clear()
+			pkt.fragment_handler = library.fragment		#large sequences are written to flash fragment by fragment
 			rcvd_pkt = pkt.receive()
 			while type(rcvd_pkt) == list:
-				with open(path+'/sequence'+str(sequence_idx)+'.tsv','w+') as fp:
-					fp.write(tsv.dumps(rcvd_pkt))
+				library.write(rcvd_pkt)
 				rcvd_pkt = pkt.receive()
-				sequence_idx += 1
-			file_paths = [path + '/' + s for s in uos.listdir(path)]
+			library.abort()
+			pkt.fragment_handler = None
+			file_paths = [path + '/' + s for s in ospath.listdir_nohidden(path)]
 	elif len(file_paths) == 0:
 			pkt.send('Error: No sequences found! You can generate sequences using COSgen.')
 			raise ValueError('No sequences found on pyboard or server. Copy sequences to the sd card and specify the path in "config.py".')
@@ -172,7 +282,7 @@ def main():
 		uos.mkdir(path)
 		storage_path = path
 
-	eh = ErrorHandler(use_wo_server,pkt,storage_path)
+	eh = ErrorHandler(use_wo_server,pkt,storage_path,cfg.accuracy,cfg.timing_buffer_size,cfg.timing_detail)
 
 	if cfg.accuracy == 'us':
 		ticks = utime.ticks_us		#Function for utime.measurment
@@ -183,98 +293,127 @@ def main():
 		sleep = utime.sleep_ms
 		conversion_factor = 1000
 	tmax = int(utime.ticks_add(0,-1)/2)
+	trigger_clock = ticks
+	if cfg.tr is not None:
+		sync = resync.TriggerSync(int(cfg.tr*conversion_factor), cfg.resync_log_size, cfg.accuracy)
+
+	trains = {}		#pulse trains of the out channels generated by hardware timers
+	if cfg.timer_pulses or cfg.pwm_min_frequency is not None:
+		trains[1] = TimerPulseTrain(1, pin_out1, cfg.on_value_out_channel1, conversion_factor)
+		trains[2] = TimerPulseTrain(2, pin_out2, cfg.on_value_out_channel2, conversion_factor)
+		trains[3] = TimerPulseTrain(3, pin_out3, cfg.on_value_out_channel3, conversion_factor)
+		trains[4] = TimerPulseTrain(4, pin_out4, cfg.on_value_out_channel4, conversion_factor)
 
 	extint = pyb.ExtInt('X1', pyb.ExtInt.IRQ_FALLING, pyb.Pin.PULL_DOWN, callback_trigger)
 	extint.disable()
 
+	on_values = {1: cfg.on_value_out_channel1, 2: cfg.on_value_out_channel2, 3: cfg.on_value_out_channel3, 4: cfg.on_value_out_channel4}
+	channel_on_values = {1: cfg.on_value_out_channel1, 2: cfg.on_value_out_channel2, 3: cfg.on_value_out_channel3,
+		4: cfg.on_value_out_channel4, 5: cfg.on_value_out_channel5, 6: cfg.on_value_out_channel6}
+	out_funcs = {1: pin_out1.value, 2: pin_out2.value, 3: pin_out3.value, 4: pin_out4.value, 5: dac5.write, 6: dac6.write}
+	dacs = {5: dac5, 6: dac6}
+	writers = {}		#register writers of the digital out channels
+	if cfg.gpio_registers:
+		for out_channel in on_values:
+			writers[out_channel] = gpio.PortWriter([out_channel], on_values).value
+
 	num_seq = len(file_paths)
 	pkt.send('Size of sequence library: {0}'.format(num_seq))
+	for file_path in file_paths:		#compiled once, later only the event tables are read
+		load_event_table(file_path, conversion_factor, tmax)
+	gc.collect()
 
 	while True:
 		seq_index = random.randrange(num_seq)
-		with open(file_paths[seq_index]) as f:
-			seq = tsv.load(f)
-		pkt.send('Current sequence:\n'+tsv.dumps(seq))
-		num_of_events = len(seq) - 1
-		range_of_events = range(num_of_events-1)
-		onset_column = seq[0].index('onset')
-		frequency_column = seq[0].index('frequency')
-		duration_column = seq[0].index('duration')
-		pulse_width_column = seq[0].index('pulse_width')
-		out_channel_column = seq[0].index('out_channel')
-		amplitude_column = seq[0].index('amplitude')
-		T = [int(1./seq[1][frequency_column]*conversion_factor)]
-		onset = [int(seq[1][onset_column]*conversion_factor)]
-		onset_sleep = [ onset[0] - onset[0]%tmax ]
-		num_pulses = [round(seq[1][duration_column]*conversion_factor/T[0])]
-		pulse_width = [ int(seq[1][pulse_width_column]*conversion_factor) ]
-		pulse_sleep = [ pulse_width[0] - pulse_width[0]%tmax ]
-		if seq[1][out_channel_column] == 1:
-			pin_out_func = [pin_out1.value]
-			amplitude = [1]
-			on_value = [cfg.on_value_out_channel1]
-		elif seq[1][out_channel_column] == 2:
-			pin_out_func = [pin_out2.value]
-			amplitude = [1]
-			on_value = [cfg.on_value_out_channel2]
-		elif seq[1][out_channel_column] == 3:
-			pin_out_func = [pin_out3.value]
-			amplitude = [1]
-			on_value = [cfg.on_value_out_channel3]
-		elif seq[1][out_channel_column] == 4:
-			pin_out_func = [pin_out4.value]
-			amplitude = [1]
-			on_value = [cfg.on_value_out_channel4]
-		elif seq[1][out_channel_column] == 5:
-			pin_out_func = [dac5.write]
-			amplitude = [int(seq[1][amplitude_column]*255)]
-			on_value = [cfg.on_value_out_channel5]
-		elif seq[1][out_channel_column] == 6:
-			pin_out_func = [dac6.write]
-			amplitude = [int(seq[1][amplitude_column]*255)]
-			on_value = [cfg.on_value_out_channel6]
-		else:
-			raise SequenceError('Invalide sequence {0}. Unrecognized out channel {1}.\n'.format(file_paths[seq_index], seq[1][out_channel_column]))
-
-		if T[0] < seq[1][pulse_width_column]*conversion_factor:
-			raise SequenceError("Invalid sequence {0}. Period is smaller than pulse width.\n".format(file_paths[seq_index]))
-		for i in range(2,num_of_events):
-			T.append(int(1./seq[i][frequency_column]*conversion_factor))
-			onset.append(int(seq[i][onset_column]*conversion_factor))
-			onset_sleep.append( onset[i-1] - onset[i-2] - ( onset[i-1] - onset[i-2] ) % tmax )
-			num_pulses.append(round(seq[i][duration_column]*conversion_factor/T[i-1]))
-			pulse_width.append(int(seq[i][pulse_width_column]*conversion_factor))
-			pulse_sleep.append(pulse_width[i-1] - pulse_width[i-1]%tmax)
-			if seq[i][out_channel_column] == 1:
-				pin_out_func.append(pin_out1.value)
-				amplitude.append(1)
-				on_value.append(cfg.on_value_out_channel1)
-			elif seq[i][out_channel_column] == 2:
-				pin_out_func.append(pin_out2.value)
-				amplitude.append(1)
-				on_value.append(cfg.on_value_out_channel2)
-			elif seq[i][out_channel_column] == 3:
-				pin_out_func.append(pin_out3.value)
-				amplitude.append(1)
-				on_value.append(cfg.on_value_out_channel3)
-			elif seq[i][out_channel_column] == 4:
-				pin_out_func.append(pin_out4.value)
-				amplitude.append(1)
-				on_value.append(cfg.on_value_out_channel4)
-			elif seq[i][out_channel_column] == 5:
-				pin_out_func.append(dac5.write)
-				amplitude.append(int(seq[i][amplitude_column]*255))
-				on_value.append(cfg.on_value_out_channel5)
-			elif seq[i][out_channel_column] == 6:
-				pin_out_func.append(dac6.write)
-				amplitude.append(int(seq[i][amplitude_column]*255))
-				on_value.append(cfg.on_value_out_channel6)
+		table = load_event_table(file_paths[seq_index], conversion_factor, tmax)
+		pkt.send('Current sequence: {0} ({1} events)'.format(file_paths[seq_index], len(table)))
+		num_of_events = len(table)
+		num_delivered_events = num_of_events
+		T = table.period
+		onset = table.onset
+		onset_sleep = table.onset_sleep
+		num_pulses = table.num_pulses
+		pulse_width = table.pulse_width
+		pulse_sleep = table.pulse_sleep
+		amplitude = table.amplitude
+		channel = table.channel			#index of the out channel of each event in table.channels
+		pin_out_func = []
+		on_value = []
+		for out_channel in table.channels:
+			if type(out_channel) == str:		#several digital out channels, e.g. '1+3'
+				pin_out_func.append(channel_list_writer(out_channel, on_values, file_paths[seq_index]))
+				on_value.append(1)		#the writer sets the on value of each channel
+			elif out_channel in writers:
+				pin_out_func.append(writers[out_channel])
+				on_value.append(1)
 			else:
-				raise SequenceError('Invalide sequence {0}. Unrecognized out channel {1}.\n'.format(file_paths[seq_index], seq[i][out_channel_column]))
-			if T[i-1] < seq[i][pulse_width_column]*conversion_factor:
-				raise SequenceError("Invalid sequence {0}. Period is smaller than pulse width.\n".format(file_paths[seq_index]))
-
-
+				pin_out_func.append(out_funcs[out_channel])
+				on_value.append(channel_on_values[out_channel])
+		shapes = []
+		for value in table.waveforms:
+			try:
+				shapes.append(waveform.parse(value))
+			except ValueError as e:
+				raise SequenceError('Invalid sequence {0}. {1}\n'.format(file_paths[seq_index], e))
+		waveform_out = []		#DAC and samples of one period of events with shaped pulses
+		max_period_error = 0
+		for i in range(num_delivered_events):
+			shape = shapes[table.waveform[i]]
+			out_channel = table.channels[channel[i]]
+			if shape is None:
+				waveform_out.append(None)
+				continue
+			if out_channel not in dacs:
+				raise SequenceError('Invalid sequence {0}. Waveforms are only possible for out channels 5 and 6.\n'.format(file_paths[seq_index]))
+			try:
+				waveform_out.append((dacs[out_channel], waveform.samples(shape, T[i], pulse_width[i], amplitude[i]/255, cfg.dac_sample_rate, conversion_factor, cfg.dac_max_samples)))
+			except ValueError as e:
+				raise SequenceError('Invalid sequence {0}. {1}\n'.format(file_paths[seq_index], e))
+			max_period_error = max(max_period_error, abs(waveform.period_error(T[i], cfg.dac_sample_rate, conversion_factor)))
+		if len(table.waveforms) > 1:
+			pkt.send('Waveforms are played with {0} samples/s, periods deviate up to {1} ns.'.format(cfg.dac_sample_rate, max_period_error))
+		train = []
+		timer_settings = []
+		for i in range(num_delivered_events):
+			out_channel = table.channels[channel[i]]
+			if out_channel in trains and (cfg.timer_pulses or T[i]*cfg.pwm_min_frequency <= conversion_factor):
+				train.append(trains[out_channel])
+				try:
+					timer_settings.append(train[i].settings(T[i], pulse_width[i]))
+				except ValueError as e:
+					raise SequenceError('Invalid sequence {0}. {1}\n'.format(file_paths[seq_index], e))
+				period_ns, width_ns = timers.quantization(train[i].source_freq, timer_settings[i][0], timer_settings[i][1], timer_settings[i][2])
+				pkt.send('Event {0}: timer {1} generates pulses of {2} ns every {3} ns.'.format(i + 1, train[i].timer_id, width_ns, period_ns))
+			else:
+				train.append(None)
+				timer_settings.append(None)
+		if cfg.concurrent_events or cfg.dma_pattern:
+			parsed = [gpio.parse_channels(value) for value in table.channels]
+			out_channel = [parsed[k] for k in channel]
+			overlapping = collisions(onset, T, num_pulses, pulse_width, out_channel)
+			if len(overlapping) > 0:
+				raise SequenceError('Invalid sequence {0}. Events {1} and {2} overlap on the same out channel.\n'.format(file_paths[seq_index], overlapping[0][0] + 1, overlapping[0][1] + 1))
+			edge_num_pulses = list(num_pulses)
+			edge_pulse_width = list(pulse_width)
+			for i in range(len(waveform_out)):
+				if waveform_out[i] is not None:		#one edge starts and one stops the waveform
+					edge_num_pulses[i] = 1
+					edge_pulse_width[i] = num_pulses[i]*T[i]
+			edges = EdgeScheduler(onset, T, edge_num_pulses, edge_pulse_width)
+		player = None
+		if cfg.dma_pattern:
+			try:
+				compiler = PatternCompiler(onset, T, num_pulses, pulse_width, out_channel, on_values,
+					int(cfg.dma_resolution*conversion_factor), cfg.dma_segment_size)
+				player = PatternPlayer(compiler, conversion_factor)
+			except ValueError as e:
+				raise SequenceError('Invalid sequence {0}. {1}\n'.format(file_paths[seq_index], e))
+
+		eh.start(num_of_events)
+		mem_compiled = memory_usage()
+		gc.collect()
+		if gc.mem_free() < cfg.min_free_memory:
+			raise SequenceError('Sequence {0} is too large. Only {1} bytes of memory are free, but {2} are required.\n'.format(file_paths[seq_index], gc.mem_free(), cfg.min_free_memory))
 		pkt.send('Ready to be armed!')
 		trigger_received = False
 		sw.callback(None)
@@ -290,33 +429,154 @@ def main():
 		pkt.send('System armed!')
 
 		sw.callback(callback_trigger2)			#for test purposes the switch can be used to trigger
+		if cfg.disable_gc:
+			gc.collect()
+			gc.disable()		#no garbage collection can pause the sequence
+		if sync is not None:
+			sync.reset()
+		if player is not None:
+			player.arm()
+		else:		#timer 8 is used by the pattern player
+			for out_channel in trains:
+				trains[out_channel].arm()
+		mem_armed = memory_usage()
 		extint.enable()
 		while not trigger_received:
-			utime.sleep_us(1)
+			machine.idle()		#sleeps until the next interrupt
 
-		start_ticks = ticks()
+		noticed_ticks = ticks()
+		start_ticks = trigger_ticks		#the schedule starts at the trigger, independent of the time it took to notice it
 		triggerLED.on()
 		armedLED.off()
-		extint.disable()
-		pkt.send('Trigger received!')
-		for i in range_of_events:
-			sleep(onset_sleep[i])
-			scheduled_time= utime.ticks_add(start_ticks, onset[i])
-			pulse = 0
-			while pulse < num_pulses[i]:
-				if utime.ticks_diff(ticks(), scheduled_time) < 0:
-					sleep(utime.ticks_diff(scheduled_time, ticks()))
-					deliver_pulse(pin_out_func[i], amplitude[i], pulse_width[i], pulse_sleep[i], pin_outLED, eh, ticks, sleep, on_value[i])
-				elif utime.ticks_diff(ticks(), scheduled_time) == 0:
-					deliver_pulse(pin_out_func[i], amplitude[i], pulse_width[i], pulse_sleep[i], pin_outLED, eh, ticks, sleep, on_value[i])
-				elif utime.ticks_diff(ticks(), scheduled_time) > 0:
+		if sync is None:
+			extint.disable()		#otherwise every volume trigger is timestamped during delivery
+		if player is None:
+			pkt.send('Trigger received!')		#the DMA pattern may start right after the trigger
+		ticks_add = utime.ticks_add
+		ticks_diff = utime.ticks_diff
+		dac_sample_rate = cfg.dac_sample_rate
+		if player is not None:		#the pulses are played by DMA
+			delay = player.start_time()
+			if sync is None:
+				scheduled_time = ticks_add(start_ticks, delay)
+			else:
+				sync.update()
+				scheduled_time = sync.schedule(delay)
+			if delay > 0:
+				sleep(delay - delay % tmax)		#multiples of tmax like onset_sleep
+			if ticks_diff(scheduled_time, ticks()) > 0:
+				sleep(ticks_diff(scheduled_time, ticks()))
+			player.play()
+			pkt.send('Trigger received!')
+		elif cfg.concurrent_events:		#edges of all events ordered by time
+			previous_time = 0
+			while edges.peek() >= 0:
+				i = edges.event
+				k = channel[i]
+				gap = edges.time - previous_time
+				previous_time = edges.time
+				sleep(gap - gap % tmax)		#multiples of tmax like onset_sleep, longer waits wrap around in ticks_diff
+				if sync is None:
+					scheduled_time = ticks_add(start_ticks, edges.time)
+				else:
+					sync.update()
+					scheduled_time = sync.schedule(edges.time)
+				if ticks_diff(scheduled_time, ticks()) > 0:
+					sleep(ticks_diff(scheduled_time, ticks()))
+				if edges.edge == RISING:
+					if train[i] is not None:
+						train[i].wait()
+						train[i].prepare(timer_settings[i][0], timer_settings[i][1], timer_settings[i][2], num_pulses[i])
+						now = ticks()
+						train[i].start()
+						edges.drop()		#the remaining edges are generated by the timer
+					elif waveform_out[i] is not None:
+						now = ticks()
+						waveform_out[i][0].write_timed(waveform_out[i][1], dac_sample_rate, mode=pyb.DAC.CIRCULAR)
+						edges.advance()
+					else:
+						now = ticks()
+						pin_out_func[k](amplitude[i]*on_value[k])
+						pin_outLED.on()
+						edges.advance()
+					if ticks_diff(now, scheduled_time) > 0:
+						eh.timing(i, edges.pulse, scheduled_time, now, telemetry.KIND_ONSET)
+				else:
+					now = ticks()
+					pin_out_func[k](not on_value[k])
+					pin_outLED.off()
+					edges.advance()
+					if ticks_diff(now, scheduled_time) > 0:
+						eh.timing(i, edges.pulse, scheduled_time, now, telemetry.KIND_END)
+		else:
+			i = 0
+			while i < num_delivered_events:		#no heap memory is allocated while the pulses are delivered
+				sleep(onset_sleep[i])
+				if sync is None:
+					scheduled_time= ticks_add(start_ticks, onset[i])
+				else:
+					sync.update()		#re-anchor the upcoming onsets to the last volume trigger
+					scheduled_time = sync.schedule(onset[i])
+				k = channel[i]
+				if train[i] is not None:		#the pulses are generated by a timer
+					train[i].wait()		#previous train of the same channel
+					train[i].prepare(timer_settings[i][0], timer_settings[i][1], timer_settings[i][2], num_pulses[i])
+					if ticks_diff(ticks(), scheduled_time) < 0:
+						sleep(ticks_diff(scheduled_time, ticks()))
+					now = ticks()
+					train[i].start()
+					if ticks_diff(now, scheduled_time) > 0:
+						eh.timing(i, 0, scheduled_time, now, telemetry.KIND_ONSET)
+					i += 1
+					continue
+				if waveform_out[i] is not None:		#the samples are played by DMA
+					if ticks_diff(ticks(), scheduled_time) < 0:
+						sleep(ticks_diff(scheduled_time, ticks()))
 					now = ticks()
-					deliver_pulse(pin_out_func[i], amplitude[i], pulse_width[i],pulse_sleep[i],pin_outLED,eh,ticks,sleep,on_value[i])
-					eh.send("Missed scheduled onset time of pulse in event {0} by {1} {2} ".format(i, utime.ticks_diff(now, scheduled_time), cfg.accuracy))
-				scheduled_time = utime.ticks_add(scheduled_time, T[i])
-				pulse += 1
+					waveform_out[i][0].write_timed(waveform_out[i][1], dac_sample_rate, mode=pyb.DAC.CIRCULAR)
+					if ticks_diff(now, scheduled_time) > 0:
+						eh.timing(i, 0, scheduled_time, now, telemetry.KIND_ONSET)
+					scheduled_time = ticks_add(scheduled_time, num_pulses[i]*T[i])
+					if ticks_diff(ticks(), scheduled_time) < 0:
+						sleep(ticks_diff(scheduled_time, ticks()))
+					waveform_out[i][0].write(not on_value[k])		#stops the waveform
+					i += 1
+					continue
+				pulse = 0
+				while pulse < num_pulses[i]:
+					if ticks_diff(ticks(), scheduled_time) < 0:
+						sleep(ticks_diff(scheduled_time, ticks()))
+						deliver_pulse(pin_out_func[k], amplitude[i], pulse_width[i], pulse_sleep[i], pin_outLED, eh, ticks, sleep, on_value[k], i, pulse)
+					elif ticks_diff(ticks(), scheduled_time) == 0:
+						deliver_pulse(pin_out_func[k], amplitude[i], pulse_width[i], pulse_sleep[i], pin_outLED, eh, ticks, sleep, on_value[k], i, pulse)
+					elif ticks_diff(ticks(), scheduled_time) > 0:
+						now = ticks()
+						deliver_pulse(pin_out_func[k], amplitude[i], pulse_width[i],pulse_sleep[i],pin_outLED,eh,ticks,sleep,on_value[k], i, pulse)
+						eh.timing(i, pulse, scheduled_time, now, telemetry.KIND_ONSET)
+					scheduled_time = ticks_add(scheduled_time, T[i])
+					pulse += 1
+				i += 1
+		for out_channel in trains:
+			trains[out_channel].wait()
+			trains[out_channel].release()
+		mem_delivered = memory_usage()
+		gc.enable()
+		eh.send('Trigger latency: {0} {1}'.format(utime.ticks_diff(noticed_ticks, start_ticks), cfg.accuracy))
+		if player is not None:
+			eh.send('GPIO pattern: {0} segments, resolution {1} ns, largest quantization error {2} {3}, {4} underruns'.format(
+				compiler.num_segments, player.resolution_ns, compiler.max_error, cfg.accuracy, player.underruns))
+		if sync is not None:
+			extint.disable()
+			sync.update()
+			eh.send('Volume triggers: {0} received, {1} TRs, estimated TR {2} {3}'.format(sync.count, sync.volume, sync.period, cfg.accuracy))
+			eh.report(sync.log)		#drift correction at each volume trigger
+		eh.send('Memory (free/allocated bytes): compiled {0}/{1}, armed {2}/{3}, delivered {4}/{5}. Allocated during delivery: {6} bytes'.format(
+			mem_compiled[0], mem_compiled[1], mem_armed[0], mem_armed[1], mem_delivered[0], mem_delivered[1], mem_delivered[1] - mem_armed[1]))
+		seq = load_sequence(file_paths[seq_index])		#only parsed for the record of the delivered sequence
 		if not use_wo_server:
+			eh.flush()		#timing deviations are only reported after the sequence to not delay pulses
 			pkt.send(seq)
+			pkt.flush(1000)		#retransmit lost packets before the next sequence in the reliable mode
 		else:
 			eh.save()
 			with open(storage_path+'/sequence'+str(delivered_sequence_idx)+'.tsv', 'w+') as fp:
@@ -329,6 +589,7 @@ def main():
 try:
 	main()
 except Exception as e:
+	gc.enable()
 	#write error message to file and send them to server(does not work for syntax errors)
 	serial_port = USB_Port()
 	pkt = Packet(serial_port)